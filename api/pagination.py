@@ -0,0 +1,102 @@
+from datetime import datetime, time
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import models
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.response import Response
+from buildings.pagination import paginate_keyset
+
+API_PAGE_SIZE = getattr(settings, "API_PAGE_SIZE", 50)
+API_MAX_PAGE_SIZE = getattr(settings, "API_MAX_PAGE_SIZE", 200)
+
+
+def parse_moment(value, field):
+    """
+    `value` (an ISO date or datetime) as a value for `field`: a date for a
+    DateField, an aware datetime for a DateTimeField, where a bare date
+    means its local midnight. ValueError when it is neither.
+    """
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        moment = datetime.combine(day, time())
+    if not isinstance(field, models.DateTimeField):
+        return moment.date()
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class CursorListMixin:
+    """
+    List endpoint over `queryset`, or `get_queryset()` when the rows depend
+    on the request, with "since" (inclusive) and "until" (exclusive) filters
+    on `date_field`. When the request has a "cursor" or a "page_size"
+    parameter the list is cursor-paginated on `ordering`, newest first, and
+    the response becomes {"next", "previous", "results"} with the links to
+    the neighbouring pages; without either the whole list is returned as
+    before, for clients that predate pagination.
+    """
+
+    queryset = None
+    serializer_class = None
+    date_field = None
+    ordering = ("-id",)
+
+    def get_queryset(self):
+        # Same contract as GenericAPIView.get_queryset().
+        assert self.queryset is not None, (
+            f"'{self.__class__.__name__}' should either include a `queryset` "
+            "attribute, or override the `get_queryset()` method."
+        )
+        return self.queryset.all()
+
+    def get(self, request, *args, **kwargs):
+        queryset = self.get_queryset()
+        field = queryset.model._meta.get_field(self.date_field)
+        params = request.query_params
+        try:
+            if params.get("since"):
+                since = parse_moment(params["since"], field)
+                queryset = queryset.filter(**{f"{self.date_field}__gte": since})
+            if params.get("until"):
+                until = parse_moment(params["until"], field)
+                queryset = queryset.filter(**{f"{self.date_field}__lt": until})
+        except ValueError:
+            return Response({"error": "Invalid since/until date."}, status=400)
+
+        if "cursor" not in params and "page_size" not in params:
+            serializer = self.serializer_class(queryset, many=True)
+            return Response(serializer.data)
+
+        try:
+            page_size = int(params.get("page_size", API_PAGE_SIZE))
+        except ValueError:
+            return Response({"error": "Invalid page_size."}, status=400)
+        page_size = min(max(page_size, 1), API_MAX_PAGE_SIZE)
+        try:
+            page = paginate_keyset(
+                queryset, self.ordering, page_size, params.get("cursor") or None
+            )
+        except (ValueError, ValidationError):
+            return Response({"error": "Invalid cursor."}, status=400)
+
+        def link(cursor):
+            if cursor is None:
+                return None
+            query = params.copy()
+            query["cursor"] = cursor
+            query["page_size"] = page_size
+            return request.build_absolute_uri(f"?{query.urlencode()}")
+
+        serializer = self.serializer_class(page.object_list, many=True)
+        return Response(
+            {
+                "next": link(page.next_cursor),
+                "previous": link(page.previous_cursor),
+                "results": serializer.data,
+            }
+        )
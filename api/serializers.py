@@ -3,6 +3,7 @@ from buildings.models import Flat, Charge, Payment, Garage, Notification
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from buildings.phones import normalize_phone
 
 User = get_user_model()
 
@@ -15,14 +16,17 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         phone_number = attrs.get("phone_number")
         password = attrs.get("password")
 
-        try:
-            user = User.objects.get(phone_number=phone_number)
-        except User.DoesNotExist:
+        # Several accounts (e.g. one family) may share a number; the password
+        # decides which one is logging in.
+        digits = normalize_phone(phone_number)
+        users = list(User.objects.filter(phone_digits=digits)) if digits else []
+        if not users:
             raise serializers.ValidationError(
                 "Bu telefon numarası ile kullanıcı bulunamadı."
             )
 
-        if not user.check_password(password):
+        user = next((user for user in users if user.check_password(password)), None)
+        if user is None:
             raise serializers.ValidationError("Geçersiz şifre.")
 
         attrs["user"] = user
@@ -32,7 +36,15 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
 class FlatSerializer(serializers.ModelSerializer):
     class Meta:
         model = Flat
-        fields = ["id", "name", "building", "section", "square_metres", "balance"]
+        fields = [
+            "id",
+            "name",
+            "building",
+            "section",
+            "square_metres",
+            "balance",
+            "updated_at",
+        ]
 
 
 class ChargeSerializer(serializers.ModelSerializer):
@@ -46,6 +58,7 @@ class ChargeSerializer(serializers.ModelSerializer):
             "is_paid",
             "created_at",
             "is_paid_at",
+            "updated_at",
         ]
 
 
@@ -60,13 +73,14 @@ class ChargeSerializer(serializers.ModelSerializer):
             "is_paid",
             "created_at",
             "is_paid_at",
+            "updated_at",
         ]
 
 
 class PaymentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Payment
-        fields = ["id", "flat", "charge", "amount", "date"]
+        fields = ["id", "flat", "charge", "amount", "date", "updated_at"]
 
 
 class GarageSerializer(serializers.ModelSerializer):
@@ -78,4 +92,12 @@ class GarageSerializer(serializers.ModelSerializer):
 class NotificationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Notification
-        fields = ["id", "title", "message", "timestamp", "is_read", "user_id"]
+        fields = [
+            "id",
+            "title",
+            "message",
+            "timestamp",
+            "is_read",
+            "user_id",
+            "updated_at",
+        ]
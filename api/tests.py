@@ -1,3 +1,122 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+from buildings.models import Flat, Notification, Payment, User
+from buildings.tests import create_flat
+from api.serializers import CustomTokenObtainPairSerializer
 
-# Create your tests here.
+
+class PhoneLoginTests(TestCase):
+    def test_any_notation_of_the_number_logs_in(self):
+        user = User.objects.create(username="sakin", phone_number="+994501234567")
+        user.set_password("parol-123")
+        user.save()
+
+        attrs = CustomTokenObtainPairSerializer.validate(
+            {"phone_number": "050 123 45 67", "password": "parol-123"}
+        )
+        self.assertEqual(attrs["user"], user)
+
+
+class PhoneBackfillMigrationTests(TransactionTestCase):
+    def test_existing_users_log_in_right_after_migrating(self):
+        before = [("buildings", "0052_log_structured_columns_routelatency")]
+        executor = MigrationExecutor(connection)
+        executor.migrate(before)
+        OldUser = executor.loader.project_state(before).apps.get_model(
+            "buildings", "User"
+        )
+        OldUser.objects.create(
+            username="sakin",
+            phone_number="+994 50 123 45 67",
+            password=make_password("parol-123"),
+        )
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes("buildings"))
+        attrs = CustomTokenObtainPairSerializer.validate(
+            {"phone_number": "0501234567", "password": "parol-123"}
+        )
+        self.assertEqual(attrs["user"].username, "sakin")
+
+
+@override_settings(ACCESS_LOG_MODE="sync")
+class CursorPaginationTests(TestCase):
+    def test_payments_are_paged_newest_first(self):
+        flat = create_flat()
+        resident = User.objects.create(username="sakin", resident=True)
+        Flat.objects.filter(id=flat.id).update(resident=resident)
+        for day in range(1, 6):
+            Payment.objects.create(
+                building=flat.building, flat=flat, amount=day, date=date(2024, 1, day)
+            )
+        token = RefreshToken.for_user(resident).access_token
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+
+        first = self.client.get("/api/payments/", {"page_size": 2}).json()
+        self.assertEqual(
+            [row["date"] for row in first["results"]], ["2024-01-05", "2024-01-04"]
+        )
+        self.assertIsNone(first["previous"])
+        second = self.client.get(first["next"]).json()
+        self.assertEqual(
+            [row["date"] for row in second["results"]], ["2024-01-03", "2024-01-02"]
+        )
+        back = self.client.get(second["previous"]).json()
+        self.assertEqual(back["results"], first["results"])
+
+        period = {"since": "2024-01-02", "until": "2024-01-04", "page_size": 10}
+        found = self.client.get("/api/payments/", period).json()
+        self.assertEqual(len(found["results"]), 2)
+        self.assertIsNone(found["next"])
+        self.assertEqual(len(self.client.get("/api/payments/").json()), 5)
+        self.assertEqual(
+            self.client.get("/api/payments/", {"cursor": "x"}).status_code, 400
+        )
+
+
+@override_settings(ACCESS_LOG_MODE="sync")
+class SyncTests(TestCase):
+    def test_only_changes_since_the_token_are_sent(self):
+        flat = create_flat()
+        resident = User.objects.create(username="sakin", resident=True)
+        flat.resident = resident
+        flat.save()
+        kept = Payment.objects.create(
+            building=flat.building, flat=flat, amount=1, date=date(2024, 1, 1)
+        )
+        gone = Payment.objects.create(
+            building=flat.building, flat=flat, amount=2, date=date(2024, 1, 2)
+        )
+        token = RefreshToken.for_user(resident).access_token
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+
+        full = self.client.get("/api/sync/").json()
+        self.assertTrue(full["reset"])
+        self.assertEqual(len(full["payments"]["updated"]), 2)
+
+        Payment.objects.filter(id=kept.id).update(
+            updated_at=timezone.now() - timedelta(hours=1)
+        )
+        Flat.objects.filter(id=flat.id).update(
+            updated_at=timezone.now() - timedelta(hours=1)
+        )
+        Payment.objects.filter(id=gone.id).delete()
+        Notification.objects.create(user=resident, title="Su", message="Su olmayacaq")
+
+        delta = self.client.get("/api/sync/", {"token": full["token"]}).json()
+        self.assertFalse(delta["reset"])
+        self.assertEqual(delta["flats"]["updated"], [])
+        self.assertEqual(delta["payments"], {"updated": [], "deleted": [gone.id]})
+        self.assertEqual(len(delta["notifications"]["updated"]), 1)
+
+        flat.resident = None
+        flat.save()
+        moved = self.client.get("/api/sync/", {"token": delta["token"]}).json()
+        self.assertEqual(moved["flats"]["deleted"], [flat.id])
+        self.assertEqual(self.client.get("/api/sync/", {"token": "x"}).status_code, 400)
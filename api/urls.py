@@ -12,6 +12,7 @@ from api.views import (
     TokenObtainPairView,
     TokenRefreshView,
     LoginView,
+    SyncView,
 )
 
 urlpatterns = [
@@ -50,4 +51,6 @@ urlpatterns = [
         MarkAllNotificationsReadView.as_view(),
         name="mark-all-notifications-read",
     ),
+    # -----------------------------SYNC-----------------------------------------------
+    path("sync/", SyncView.as_view(), name="sync"),
 ]
@@ -1,3 +1,4 @@
+from datetime import datetime
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
@@ -5,9 +6,14 @@ from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth import authenticate
+from django.core import signing
+from django.utils import timezone
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from rest_framework.permissions import AllowAny
 from buildings.models import Flat, Charge, Payment, Garage, Notification
+from buildings.scope import get_scope
+from buildings.sync import changes_since
+from api.pagination import CursorListMixin
 from api.serializers import (
     FlatSerializer,
     ChargeSerializer,
@@ -17,6 +23,8 @@ from api.serializers import (
     CustomTokenObtainPairSerializer,
 )
 
+SYNC_SALT = "api.sync"
+
 
 class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
@@ -59,55 +67,62 @@ class FlatListView(APIView):
         return Response(serializer.data)
 
 
-class ChargeListView(APIView):
+class ChargeListView(CursorListMixin, APIView):
     permission_classes = [IsAuthenticated]
+    serializer_class = ChargeSerializer
+    date_field = "created_at"
+    ordering = ("-created_at", "-id")
+
+    def get_queryset(self):
+        return Charge.objects.filter(flat_id=self.kwargs["id"])
 
     def get(self, request, id):
-        try:
-            flat = Flat.objects.get(id=id, resident=request.user)
-            charges = Charge.objects.filter(flat=flat)
-            serializer = ChargeSerializer(charges, many=True)
-            return Response(serializer.data)
-        except Flat.DoesNotExist:
+        if not Flat.objects.filter(id=id, resident=request.user).exists():
             return Response(
                 {"error": "Flat not found or you do not have access to it."}, status=404
             )
+        return super().get(request, id=id)
 
 
-class AllChargesListView(APIView):
+class AllChargesListView(CursorListMixin, APIView):
     permission_classes = [IsAuthenticated]
+    serializer_class = ChargeSerializer
+    date_field = "created_at"
+    ordering = ("-created_at", "-id")
 
-    def get(self, request):
-        charges = Charge.objects.filter(flat__resident=request.user)
-        serializer = ChargeSerializer(charges, many=True)
-        return Response(serializer.data)
+    def get_queryset(self):
+        return Charge.objects.filter(flat__resident=self.request.user)
 
 
-class PaymentsListView(APIView):
+class PaymentsListView(CursorListMixin, APIView):
     permission_classes = [IsAuthenticated]
+    serializer_class = PaymentSerializer
+    date_field = "date"
+    ordering = ("-date", "-id")
 
-    def get(self, request):
-        payments = Payment.objects.filter(flat__resident=request.user)
-        serializer = PaymentSerializer(payments, many=True)
-        return Response(serializer.data)
+    def get_queryset(self):
+        return Payment.objects.filter(flat__resident=self.request.user)
 
 
 class GaragesListView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        garages = Garage.objects.filter(building__branch__owner=request.user)
+        garages = Garage.objects.filter(
+            building_id__in=get_scope(request.user).building_ids
+        )
         serializer = GarageSerializer(garages, many=True)
         return Response(serializer.data)
 
 
-class NotificationsListView(APIView):
+class NotificationsListView(CursorListMixin, APIView):
     permission_classes = [IsAuthenticated]
+    serializer_class = NotificationSerializer
+    date_field = "timestamp"
+    ordering = ("-timestamp", "-id")
 
-    def get(self, request):
-        notifications = Notification.objects.filter(user=request.user)
-        serializer = NotificationSerializer(notifications, many=True)
-        return Response(serializer.data)
+    def get_queryset(self):
+        return Notification.objects.filter(user=self.request.user)
 
 
 class NotificationDetailView(APIView):
@@ -139,6 +154,65 @@ class MarkAllNotificationsReadView(APIView):
 
     def get(self, request):
         Notification.objects.filter(user=request.user, is_read=False).update(
-            is_read=True
+            is_read=True, updated_at=timezone.now()
         )
         return Response({"message": "All notifications marked as read"})
+
+
+class SyncView(APIView):
+    """
+    Everything a resident's app has to change in its local copy since its
+    last sync. The client keeps the returned token and sends it back as
+    "token"; without one (or with one too old to sync from) it gets all of
+    its rows and reset=true. Rows may repeat across syncs, so clients store
+    them by id.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        since, known_flats = None, ()
+        if request.query_params.get("token"):
+            try:
+                token = signing.loads(request.query_params["token"], salt=SYNC_SALT)
+                if token["user"] == request.user.pk:
+                    since = datetime.fromisoformat(token["at"])
+                    known_flats = token["flats"]
+            except (signing.BadSignature, KeyError, TypeError, ValueError):
+                return Response({"error": "Invalid sync token."}, status=400)
+
+        now = timezone.now()
+        changes = changes_since(request.user, since, known_flats, now)
+        token = signing.dumps(
+            {
+                "user": request.user.pk,
+                "at": now.isoformat(),
+                "flats": changes["flat_ids"],
+            },
+            salt=SYNC_SALT,
+        )
+        deleted = changes["deleted"]
+        return Response(
+            {
+                "token": token,
+                "reset": changes["reset"],
+                "flats": {
+                    "updated": FlatSerializer(changes["flats"], many=True).data,
+                    "deleted": deleted["flats"],
+                },
+                "charges": {
+                    "updated": ChargeSerializer(changes["charges"], many=True).data,
+                    "deleted": deleted["charges"],
+                },
+                "payments": {
+                    "updated": PaymentSerializer(changes["payments"], many=True).data,
+                    "deleted": deleted["payments"],
+                },
+                "notifications": {
+                    "updated": NotificationSerializer(
+                        changes["notifications"], many=True
+                    ).data,
+                    "deleted": deleted["notifications"],
+                },
+            }
+        )
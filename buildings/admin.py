@@ -15,6 +15,8 @@ from .models import (
     Garage,
     CarPlate,
     Notification,
+    BillingRun,
+    BillingSchedule,
 )
 
 
@@ -54,13 +56,13 @@ class CustomUserAdmin(UserAdmin):
         ),
     )
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related("branch")
+
     def display_branch(self, obj):
         """Custom method to display related branches."""
-        return (
-            ", ".join([branch.name for branch in obj.branch.all()])
-            if obj.branch.exists()
-            else "None"
-        )
+        # obj.branch.all() is prefetched; exists() would query once per row.
+        return ", ".join([branch.name for branch in obj.branch.all()]) or "None"
 
     display_branch.short_description = "Branch"
 
@@ -79,3 +81,5 @@ admin.site.register(Charge)
 admin.site.register(Garage)
 admin.site.register(CarPlate)
 admin.site.register(Notification)
+admin.site.register(BillingRun)
+admin.site.register(BillingSchedule)
@@ -0,0 +1,140 @@
+from collections import defaultdict, deque
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import DecimalField, Exists, F, OuterRef, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .ledger import record_entries
+from .models import Flat, Charge, Payment, ChargeAllocation
+
+ALLOCATION_CHUNK_SIZE = 1000
+
+
+def _allocated(relation):
+    return Coalesce(
+        Sum(f"{relation}__amount"),
+        Value(Decimal(0)),
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+def open_charges(flat_ids):
+    """(id, flat_id, remaining) of the unpaid charges of `flat_ids`, oldest first."""
+    return (
+        Charge.objects.filter(flat_id__in=flat_ids, is_paid=False)
+        .annotate(remaining=F("amount") - _allocated("allocations"))
+        .order_by("flat_id", "created_at", "id")
+        .values_list("id", "flat_id", "remaining")
+    )
+
+
+def allocate(funds, first=()):
+    """
+    Apply `funds` to the oldest open charges of their flats, starting with
+    the charges in `first` (e.g. the one a payment was entered against).
+
+    `funds` is a sequence of (flat_id, payment_id, amount) applied in order;
+    payment_id may be None for money taken from a flat's balance. All open
+    charges of the flats involved are read in one query, allocations are
+    inserted with one bulk_create and fully covered charges are flipped to
+    paid with one UPDATE. Returns the unallocated remainder of each fund, in
+    the same order.
+
+    Must run inside a transaction; the flats involved are row-locked so two
+    allocations for the same flat cannot spend the same charge twice.
+    """
+    flat_ids = {flat_id for flat_id, _, _ in funds}
+    list(Flat.objects.select_for_update().filter(id__in=flat_ids).values_list("id"))
+
+    queues = defaultdict(deque)
+    paid_ids = []
+    for charge_id, flat_id, remaining in open_charges(flat_ids):
+        if remaining > 0:
+            queues[flat_id].append([charge_id, remaining])
+        else:
+            paid_ids.append(charge_id)
+    if first:
+        first = set(first)
+        for flat_id, queue in queues.items():
+            queues[flat_id] = deque(sorted(queue, key=lambda c: c[0] not in first))
+
+    allocations = []
+    leftovers = []
+    for flat_id, payment_id, amount in funds:
+        queue = queues[flat_id]
+        while amount > 0 and queue:
+            charge = queue[0]
+            applied = min(amount, charge[1])
+            allocations.append(
+                ChargeAllocation(
+                    charge_id=charge[0], payment_id=payment_id, amount=applied
+                )
+            )
+            amount -= applied
+            charge[1] -= applied
+            if charge[1] == 0:
+                paid_ids.append(charge[0])
+                queue.popleft()
+        leftovers.append(amount)
+
+    ChargeAllocation.objects.bulk_create(allocations)
+    now = timezone.now()
+    Charge.objects.filter(id__in=paid_ids).update(
+        is_paid=True, is_paid_at=now, updated_at=now
+    )
+    return leftovers
+
+
+def allocate_payments(payments, first=()):
+    """
+    Allocate the not yet allocated part of `payments` (a Payment queryset),
+    oldest payment first, to the charges in `first` and then the oldest
+    open ones. Returns {payment_id: unallocated amount}.
+    """
+    rows = list(
+        payments.annotate(unallocated=F("amount") - _allocated("allocations"))
+        .filter(unallocated__gt=0)
+        .order_by("date", "id")
+        .values_list("flat_id", "id", "unallocated")
+    )
+    with transaction.atomic():
+        leftovers = allocate(rows, first)
+    return {payment_id: left for (_, payment_id, _), left in zip(rows, leftovers)}
+
+
+def allocate_balances(flats, chunk_size=ALLOCATION_CHUNK_SIZE):
+    """
+    Spend the positive balance of `flats` (a Flat queryset) on their open
+    charges, e.g. to backfill a whole building. Works in chunks of flats, each
+    in its own transaction; consumed credit is taken off the balance and
+    written to the ledger. Returns the total amount allocated.
+    """
+    open_charges = Charge.objects.filter(flat_id=OuterRef("pk"), is_paid=False)
+    flat_ids = list(
+        flats.filter(Exists(open_charges), balance__gt=0)
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+    total = Decimal(0)
+    for start in range(0, len(flat_ids), chunk_size):
+        with transaction.atomic():
+            balances = list(
+                Flat.objects.select_for_update()
+                .filter(id__in=flat_ids[start : start + chunk_size], balance__gt=0)
+                .order_by("id")
+                .values_list("id", "balance")
+            )
+            leftovers = allocate(
+                [(flat_id, None, balance) for flat_id, balance in balances]
+            )
+            now = timezone.now()
+            updated = []
+            entries = []
+            for (flat_id, balance), left in zip(balances, leftovers):
+                if left != balance:
+                    updated.append(Flat(id=flat_id, balance=left, updated_at=now))
+                    entries.append((flat_id, left - balance, "ALLOCATION"))
+                    total += balance - left
+            Flat.objects.bulk_update(updated, ["balance", "updated_at"])
+            record_entries(entries)
+    return total
@@ -0,0 +1,148 @@
+import gzip
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+from .models import Log
+
+LOG_RETENTION_MONTHS = getattr(settings, "LOG_RETENTION_MONTHS", 6)
+LOG_ARCHIVE_DIR = Path(
+    getattr(settings, "LOG_ARCHIVE_DIR", Path(settings.BASE_DIR) / "log_archive")
+)
+ARCHIVE_CHUNK_SIZE = 5000
+ARCHIVE_FIELDS = (
+    "id",
+    "user_id",
+    "action",
+    "model_name",
+    "object_id",
+    "timestamp",
+    "details",
+    "method",
+    "path",
+    "route",
+    "status",
+    "duration_ms",
+)
+
+
+def month_start(moment, months_back=0):
+    """Start of the month `months_back` months before the one holding `moment`."""
+    index = moment.year * 12 + moment.month - 1 - months_back
+    return moment.replace(
+        year=index // 12,
+        month=index % 12 + 1,
+        day=1,
+        hour=0,
+        minute=0,
+        second=0,
+        microsecond=0,
+    )
+
+
+def archive_path(month, directory=LOG_ARCHIVE_DIR):
+    """A new file for `month`; an existing archive is never overwritten."""
+    name = f"logs-{month:%Y-%m}"
+    path = Path(directory) / f"{name}.jsonl.gz"
+    number = 1
+    while path.exists():
+        path = Path(directory) / f"{name}.{number}.jsonl.gz"
+        number += 1
+    return path
+
+
+def archive_month(month, directory=LOG_ARCHIVE_DIR, chunk_size=ARCHIVE_CHUNK_SIZE):
+    """
+    Export the Log rows of the month starting at `month` to a gzipped JSON
+    lines file, then delete exactly the exported rows in short batches.
+    Returns (path, row count); path is None when the month is empty.
+    """
+    entries = Log.objects.filter(
+        timestamp__gte=month, timestamp__lt=month_start(month, -1)
+    )
+    last_id = entries.aggregate(last=Max("id"))["last"]
+    if last_id is None:
+        return None, 0
+    entries = entries.filter(id__lte=last_id)
+
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    path = archive_path(month, directory)
+    partial = path.with_name(path.name + ".part")
+    count = 0
+    try:
+        with gzip.open(partial, "wt", encoding="utf-8") as archive:
+            rows = entries.order_by("id").values(*ARCHIVE_FIELDS)
+            for row in rows.iterator(chunk_size=chunk_size):
+                row["timestamp"] = row["timestamp"].isoformat()
+                archive.write(json.dumps(row, ensure_ascii=False) + "\n")
+                count += 1
+        os.replace(partial, path)
+    except BaseException:
+        # Nothing is deleted unless the whole month made it to disk.
+        partial.unlink(missing_ok=True)
+        raise
+
+    while True:
+        ids = list(entries.values_list("id", flat=True)[:chunk_size])
+        if not ids:
+            break
+        Log.objects.filter(id__in=ids).delete()
+    return path, count
+
+
+def archive_expired_logs(
+    retention_months=LOG_RETENTION_MONTHS, directory=LOG_ARCHIVE_DIR, now=None
+):
+    """
+    Archive and delete every month older than the last `retention_months`
+    full months. Returns [(path, count)] for the months archived.
+    """
+    cutoff = month_start(timezone.localtime(now), retention_months)
+    first = (
+        Log.objects.filter(timestamp__lt=cutoff)
+        .order_by("timestamp")
+        .values_list("timestamp", flat=True)
+        .first()
+    )
+    if first is None:
+        return []
+    archived = []
+    month = month_start(timezone.localtime(first))
+    while month < cutoff:
+        path, count = archive_month(month, directory)
+        if path:
+            archived.append((path, count))
+        month = month_start(month, -1)
+    return archived
+
+
+def search_archives(
+    directory=LOG_ARCHIVE_DIR, since=None, until=None, text=None, **fields
+):
+    """
+    Yield archived rows (dicts) matching `fields` exactly, `text` anywhere in
+    details or path, and a timestamp in [since, until). Only the files of
+    the months in range are opened.
+    """
+    for path in sorted(Path(directory).glob("logs-*.jsonl.gz")):
+        month = datetime.strptime(path.name[5:12], "%Y-%m")
+        if since and (month.year, month.month) < (since.year, since.month):
+            continue
+        if until and (month.year, month.month) > (until.year, until.month):
+            continue
+        with gzip.open(path, "rt", encoding="utf-8") as archive:
+            for line in archive:
+                row = json.loads(line)
+                moment = datetime.fromisoformat(row["timestamp"])
+                if since and moment < since or until and moment >= until:
+                    continue
+                if any(
+                    str(row.get(key)) != str(value) for key, value in fields.items()
+                ):
+                    continue
+                if text and text not in f"{row['details'] or ''} {row['path']}":
+                    continue
+                yield row
@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.functions import Length
+from django.http import JsonResponse
+
+AUTOCOMPLETE_PAGE_SIZE = getattr(settings, "AUTOCOMPLETE_PAGE_SIZE", 20)
+# Past this page Select2 is told there is nothing more: nobody scrolls
+# through hundreds of suggestions instead of typing one more character.
+AUTOCOMPLETE_MAX_PAGES = getattr(settings, "AUTOCOMPLETE_MAX_PAGES", 10)
+
+
+def ranked(queryset, q, extra=None, field="name"):
+    """
+    Rows of `queryset` whose `field` contains `q` (or matching the `extra`
+    Q), best first: exact matches, then prefix matches, then the rest,
+    shorter names first so "5" comes before "15" and "105".
+    """
+    if not q:
+        return queryset.order_by(Length(field), field, "id")
+    match = Q(**{f"{field}__icontains": q})
+    if extra is not None:
+        match |= extra
+    rank = Case(
+        When(**{f"{field}__iexact": q}, then=Value(0)),
+        When(**{f"{field}__istartswith": q}, then=Value(1)),
+        default=Value(2),
+        output_field=IntegerField(),
+    )
+    return (
+        queryset.filter(match)
+        .alias(rank=rank)
+        .order_by("rank", Length(field), field, "id")
+    )
+
+
+def select2_page(request, queryset, label=str):
+    """
+    One page of `queryset` in the Select2 AJAX format, the page number
+    taken from the "page" parameter Select2 sends. Reads one row past the
+    page to fill pagination.more, and never counts.
+    """
+    try:
+        page = min(max(int(request.GET.get("page", 1)), 1), AUTOCOMPLETE_MAX_PAGES)
+    except ValueError:
+        page = 1
+    start = (page - 1) * AUTOCOMPLETE_PAGE_SIZE
+    rows = list(queryset[start : start + AUTOCOMPLETE_PAGE_SIZE + 1])
+    more = len(rows) > AUTOCOMPLETE_PAGE_SIZE and page < AUTOCOMPLETE_MAX_PAGES
+    results = [
+        {"id": row.id, "text": label(row)} for row in rows[:AUTOCOMPLETE_PAGE_SIZE]
+    ]
+    return JsonResponse({"results": results, "pagination": {"more": more}})
@@ -0,0 +1,303 @@
+import calendar
+from collections import Counter
+from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
+from itertools import islice
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .ledger import record_entries
+from .models import (
+    Service,
+    Flat,
+    Payment,
+    Charge,
+    BillingRun,
+    BillingItem,
+    BillingSchedule,
+)
+from .rollups import add_payments
+from .stats import bump_stats, refresh_residents
+
+BILLING_CHUNK_SIZE = 1000
+CENTS = Decimal("0.01")
+BILLING_MAX_CATCHUP_DAYS = getattr(settings, "BILLING_MAX_CATCHUP_DAYS", 7)
+BILLING_FLAT_FIELDS = ("id", "building_id", "resident_id", "square_metres")
+
+
+def invoice_amount(price, square_metres):
+    """
+    A flat's invoice in cents, rounded half away from zero as PostgreSQL
+    rounds numeric columns, so the ledger matches the per-flat billing that
+    let the database round each stored amount.
+    """
+    return (price * square_metres).quantize(CENTS, rounding=ROUND_HALF_UP)
+
+
+def bill_flat(balance, amount):
+    """
+    Apply one invoice of `amount` to a flat holding `balance`.
+
+    Returns (new_balance, payment_amount, charge_amount); either amount is
+    None when no row of that kind is written. A balance that covers the
+    invoice is drawn down by a payment, otherwise the shortfall becomes a
+    charge and whatever balance was left is booked as a payment.
+    """
+    if balance >= amount:
+        return balance - amount, amount, None
+    payment_amount = balance if balance != 0 else None
+    return Decimal(0), payment_amount, amount - balance
+
+
+def services_due_on(billing_date):
+    """
+    Active services whose invoice falls on `billing_date`.
+
+    On the last day of a month this includes services with an invoice_day
+    the month does not have (e.g. 29-31 in February).
+    """
+    last_day = calendar.monthrange(billing_date.year, billing_date.month)[1]
+    if billing_date.day == last_day:
+        return Service.objects.filter(invoice_day__gte=last_day, is_active=True)
+    return Service.objects.filter(invoice_day=billing_date.day, is_active=True)
+
+
+def next_billing_date(invoice_day, today=None):
+    """First date on or after `today` on which `invoice_day` is billed."""
+    day = today or timezone.now().date()
+    while True:
+        last_day = calendar.monthrange(day.year, day.month)[1]
+        due = min(invoice_day, last_day)
+        if day.day <= due:
+            return day.replace(day=due)
+        day = (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def project_service(
+    service, price=None, invoice_day=None, limit=100, building_ids=None
+):
+    """
+    What billing `service` at `price` would do right now, without writing.
+
+    Reads (flat, building, square_metres, balance) for every subscribed flat
+    in one query, or only those in `building_ids` when given, and runs them
+    through the same rules as bill_service in a single pass. Returns the
+    current and projected invoice totals, the shortfall that would become
+    charges (overall and per building), and the `limit` flats with the
+    largest shortfall.
+    """
+    price = service.price if price is None else price
+    invoice_day = service.invoice_day if invoice_day is None else invoice_day
+    flats = service.flats.all()
+    if building_ids is not None:
+        flats = flats.filter(building_id__in=building_ids)
+    rows = flats.order_by("id").values_list(
+        "id", "name", "building_id", "building__name", "square_metres", "balance"
+    )
+
+    current_total = projected_total = shortfall_total = Decimal(0)
+    buildings = {}
+    short_flats = []
+    for flat_id, name, building_id, building_name, square_metres, balance in rows:
+        # Rounded per flat to cents, as the stored Charge/Payment would be.
+        amount = invoice_amount(price, square_metres)
+        _, _, shortfall = bill_flat(balance, amount)
+        shortfall = shortfall or Decimal(0)
+        current_total += invoice_amount(service.price, square_metres)
+        projected_total += amount
+        shortfall_total += shortfall
+
+        building = buildings.setdefault(
+            building_id,
+            {
+                "id": building_id,
+                "name": building_name,
+                "flats": 0,
+                "projected_total": Decimal(0),
+                "shortfall_total": Decimal(0),
+                "short_flats": 0,
+            },
+        )
+        building["flats"] += 1
+        building["projected_total"] += amount
+        building["shortfall_total"] += shortfall
+        if shortfall:
+            building["short_flats"] += 1
+            short_flats.append(
+                {
+                    "id": flat_id,
+                    "name": name,
+                    "building_id": building_id,
+                    "balance": balance,
+                    "projected_charge": amount,
+                    "shortfall": shortfall,
+                }
+            )
+
+    short_flats.sort(key=lambda flat: flat["shortfall"], reverse=True)
+    return {
+        "service": service.id,
+        "current_price": service.price,
+        "price": price,
+        "invoice_day": invoice_day,
+        "next_billing_date": next_billing_date(invoice_day),
+        "flats": sum(building["flats"] for building in buildings.values()),
+        "current_total": current_total,
+        "projected_total": projected_total,
+        "difference": projected_total - current_total,
+        "shortfall_total": shortfall_total,
+        "short_flat_count": len(short_flats),
+        "short_flats": short_flats[:limit],
+        "buildings": list(buildings.values()),
+    }
+
+
+def billing_mark(branch_id):
+    """The last date billed for a branch, None before its first run."""
+    return (
+        BillingSchedule.objects.filter(branch_id=branch_id)
+        .values_list("last_billed_date", flat=True)
+        .first()
+    )
+
+
+def pending_billing_dates(branch_id, today=None, max_days=BILLING_MAX_CATCHUP_DAYS):
+    """
+    Dates after the branch's high-water mark, oldest first, up to `today`.
+
+    At most `max_days` dates are returned so a long outage is caught up over
+    several passes instead of one. Without a recorded mark only `today` is
+    due.
+    """
+    today = today or timezone.now().date()
+    mark = billing_mark(branch_id)
+    if mark is None:
+        return [today]
+    dates = []
+    day = mark + timedelta(days=1)
+    while day <= today and len(dates) < max_days:
+        dates.append(day)
+        day += timedelta(days=1)
+    return dates
+
+
+def advance_billing_schedule(branch_id, billing_date):
+    """Move a branch's high-water mark forward to `billing_date`, never backwards."""
+    with transaction.atomic():
+        schedule, created = BillingSchedule.objects.select_for_update().get_or_create(
+            branch_id=branch_id, defaults={"last_billed_date": billing_date}
+        )
+        if not created and schedule.last_billed_date < billing_date:
+            schedule.last_billed_date = billing_date
+            schedule.save(update_fields=["last_billed_date"])
+
+
+def iter_flat_chunks(service, chunk_size=BILLING_CHUNK_SIZE, run=None):
+    """
+    Stream `service`'s flats as BILLING_FLAT_FIELDS tuples, `chunk_size` rows
+    at a time, skipping flats that `run` has already billed.
+
+    Rows come from a server-side cursor (on PostgreSQL), so only the current
+    chunk is ever held in the worker no matter how many flats the service
+    covers.
+    """
+    flats = service.flats.order_by("id")
+    if run is not None:
+        flats = flats.exclude(
+            id__in=BillingItem.objects.filter(run=run).values("flat_id")
+        )
+    rows = flats.values_list(*BILLING_FLAT_FIELDS).iterator(chunk_size=chunk_size)
+    while chunk := list(islice(rows, chunk_size)):
+        yield chunk
+
+
+def bill_service(service, billing_date=None, chunk_size=BILLING_CHUNK_SIZE):
+    """
+    Bill every flat subscribed to `service` in chunks of `chunk_size`.
+
+    Each chunk is computed and written inside its own transaction with one
+    bulk_create per ledger table and one bulk_update for balances, which are
+    read under a row lock so payments posted meanwhile are not lost. The chunk
+    also records a BillingItem per flat under the (service, billing_date)
+    BillingRun, so rerunning after a crash only bills the flats that are
+    still missing, and rerunning a finished run is a no-op.
+    """
+    billing_date = billing_date or timezone.now().date()
+    totals = {"flats": 0, "payments": 0, "charges": 0}
+    run, _ = BillingRun.objects.get_or_create(
+        service=service, billing_date=billing_date
+    )
+    if run.status == "DONE":
+        return totals
+
+    for chunk in iter_flat_chunks(service, chunk_size, run=run):
+        with transaction.atomic():
+            _bill_chunk(service, run, chunk, totals)
+
+    run.status = "DONE"
+    run.finished_at = timezone.now()
+    run.save(update_fields=["status", "finished_at"])
+    return totals
+
+
+def _bill_chunk(service, run, rows, totals):
+    billing_date = run.billing_date
+    now = timezone.now()
+    items = []
+    entries = []
+    flats = []
+    payments = []
+    charges = []
+    balances = dict(
+        Flat.objects.select_for_update()
+        .filter(id__in=[row[0] for row in rows])
+        .order_by("id")
+        .values_list("id", "balance")
+    )
+    for flat_id, building_id, resident_id, square_metres in rows:
+        if flat_id not in balances:
+            continue
+        balance = balances[flat_id]
+        amount = invoice_amount(service.price, square_metres)
+        new_balance, payment_amount, charge_amount = bill_flat(balance, amount)
+        entries.append((flat_id, new_balance - balance, "BILLING"))
+        flats.append(Flat(id=flat_id, balance=new_balance, updated_at=now))
+        items.append(BillingItem(run=run, flat_id=flat_id))
+        if payment_amount is not None:
+            payments.append(
+                Payment(
+                    building_id=building_id,
+                    flat_id=flat_id,
+                    amount=payment_amount,
+                    charge=None,
+                    user_id=resident_id,
+                    date=billing_date,
+                )
+            )
+        if charge_amount is not None:
+            charges.append(
+                Charge(
+                    flat_id=flat_id,
+                    service=service,
+                    amount=charge_amount,
+                    is_paid=False,
+                )
+            )
+
+    # Inserted first: the unique (run, flat) constraint makes a concurrent
+    # duplicate run fail here and roll the whole chunk back.
+    BillingItem.objects.bulk_create(items)
+    Charge.objects.bulk_create(charges)
+    Payment.objects.bulk_create(payments)
+    Flat.objects.bulk_update(flats, ["balance", "updated_at"])
+    record_entries(entries)
+    add_payments(service.branch_id, payments)
+    for building_id, count in Counter(
+        payment.building_id for payment in payments
+    ).items():
+        bump_stats(building_id, payment_count=count)
+    refresh_residents({row[1] for row in rows})
+
+    totals["flats"] += len(flats)
+    totals["payments"] += len(payments)
+    totals["charges"] += len(charges)
@@ -17,6 +17,7 @@ from .models import (
 )
 from django.forms import ModelForm
 from django.contrib.auth.forms import UserCreationForm
+from .scope import get_scope
 
 
 class BuildingForm(forms.ModelForm):
@@ -69,25 +70,9 @@ class SectionForm(forms.ModelForm):
         self.fields["building"].label = "Binalar"
         self.fields["name"].label = "Blokun adı"
         if user.is_authenticated:
-            if user.is_superuser:
-                if user.branch.exists():
-                    self.fields["building"].queryset = Building.objects.filter(
-                        branch__in=user.branch.all()
-                    ).distinct()
-                    self.fields["branch"].queryset = Branch.objects.filter(owner=user)
-            elif user.commandant:
-                self.fields["building"].queryset = Building.objects.filter(
-                    commandant__in=[
-                        user,
-                    ]
-                )
-                buildings = Building.objects.filter(commandant=user)
-                self.fields["branch"].queryset = Branch.objects.filter(
-                    buildings__in=buildings
-                ).distinct()
-
-            else:
-                self.fields["building"].queryset = Building.objects.none()
+            scope = get_scope(user)
+            self.fields["building"].queryset = scope.buildings()
+            self.fields["branch"].queryset = scope.branches()
 
         if building_id:
             self.initial["building"] = building_id
@@ -135,14 +120,7 @@ class FlatForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
 
         if user.is_authenticated:
-            if user.is_superuser:
-                self.fields["building"].queryset = Building.objects.filter(
-                    branch__owner=user
-                )
-            elif user.commandant:
-                self.fields["building"].queryset = Building.objects.filter(
-                    commandant=user
-                )
+            self.fields["building"].queryset = get_scope(user).buildings()
 
         if building_id:
             self.fields["section"].queryset = Section.objects.filter(
@@ -194,13 +172,7 @@ class ServiceForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         user = kwargs.pop("user", None)
         super().__init__(*args, **kwargs)
-        if user.is_superuser:
-            self.fields["branch"].queryset = Branch.objects.filter(owner=user)
-        elif user.commandant:
-            buildings = Building.objects.filter(commandant=user)
-            self.fields["branch"].queryset = Branch.objects.filter(
-                buildings__in=buildings
-            ).distinct()
+        self.fields["branch"].queryset = get_scope(user).branches()
 
 
 class AddServiceForm(ModelForm):
@@ -407,30 +379,12 @@ class ResidentForm(UserCreationForm):
         super().__init__(*args, **kwargs)
 
         if user.is_authenticated:
-            if user.is_superuser:
-                self.fields["branch"].queryset = Branch.objects.filter(owner=user)
-                self.fields["building"].queryset = Building.objects.filter(
-                    branch__in=self.fields["branch"].queryset
-                )
-                self.fields["flat"].queryset = Flat.objects.filter(
-                    building__in=self.fields["building"].queryset
-                )
-            elif user.commandant:
-                buildings = Building.objects.filter(commandant=user)
-                self.fields["building"].queryset = buildings
-                self.fields["branch"].queryset = Branch.objects.filter(
-                    buildings__in=buildings
-                ).distinct()
-                # self.fields["building"].queryset = (
-                #     user.branch.first().buildings.all()
-                # )
-                self.fields["flat"].queryset = Flat.objects.filter(
-                    building__in=self.fields["building"].queryset
-                )
-            else:
-                self.fields["branch"].queryset = Branch.objects.none()
-                self.fields["building"].queryset = Building.objects.none()
-                self.fields["flat"].queryset = Flat.objects.none()
+            scope = get_scope(user)
+            self.fields["branch"].queryset = scope.branches()
+            self.fields["building"].queryset = scope.buildings()
+            self.fields["flat"].queryset = Flat.objects.filter(
+                building_id__in=scope.building_ids
+            )
 
         self.fields["password1"].label = "Parol"
         self.fields["password1"].widget = forms.PasswordInput(
@@ -544,16 +498,7 @@ class NewsForm(forms.ModelForm):
         user = kwargs.pop("user", None)
         super().__init__(*args, **kwargs)
         if user.is_authenticated:
-            if user.is_superuser:
-                branches = Branch.objects.filter(owner=user)
-                self.fields["building"].queryset = Building.objects.filter(
-                    branch__in=branches
-                )
-            elif user.commandant:
-                buildings = Building.objects.filter(commandant=user)
-                self.fields["building"].queryset = buildings
-            else:
-                self.fields["building"].queryset = Building.objects.none()
+            self.fields["building"].queryset = get_scope(user).buildings()
 
         for field in self.fields.values():
             field.label = ""
@@ -605,21 +550,9 @@ class ExpenseForm(forms.ModelForm):
         user = kwargs.pop("user", None)
         super().__init__(*args, **kwargs)
         if user.is_authenticated:
-            if user.is_superuser:
-                self.fields["branch"].queryset = Branch.objects.filter(owner=user)
-                self.fields["building"].queryset = Building.objects.filter(
-                    branch__in=self.fields["branch"].queryset
-                )
-            elif user.commandant:
-                buildings = Building.objects.filter(commandant=user)
-                self.fields["building"].queryset = buildings
-                self.fields["branch"].queryset = Branch.objects.filter(
-                    buildings__in=buildings
-                ).distinct()
-            else:
-                self.fields["branch"].queryset = Branch.objects.none()
-                self.fields["building"].queryset = Building.objects.none()
-                # self.fields["flat"].queryset = Flat.objects.none()
+            scope = get_scope(user)
+            self.fields["branch"].queryset = scope.branches()
+            self.fields["building"].queryset = scope.buildings()
 
         for field in self.fields.values():
             field.label = ""
@@ -0,0 +1,99 @@
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from .models import Flat, Section
+from .scope import get_scope
+
+BUILDING_TREE_TIMEOUT = getattr(settings, "BUILDING_TREE_TIMEOUT", 24 * 60 * 60)
+# Fields whose change alters a tree; saves of anything else leave it alone.
+TREE_FIELDS = frozenset({"name", "building", "building_id", "section", "section_id"})
+
+
+def _version_key(building_id):
+    return f"building-tree:version:{building_id}"
+
+
+def tree_version(building_id):
+    return cache.get_or_set(_version_key(building_id), time.time_ns, None)
+
+
+def invalidate_tree(building_id):
+    """Drop the cached tree of a building after one of its sections or flats changed."""
+    # A fresh value rather than incr(), as for the access scopes.
+    cache.set(_version_key(building_id), time.time_ns(), None)
+
+
+def compute_tree(building_id):
+    """
+    The sections and flats of a building as parallel id/name arrays, plus
+    the section of each flat, read in two queries.
+    """
+    sections = list(
+        Section.objects.filter(building_id=building_id)
+        .order_by("id")
+        .values_list("id", "name")
+    )
+    flats = list(
+        Flat.objects.filter(building_id=building_id)
+        .order_by("id")
+        .values_list("id", "name", "section_id")
+    )
+    return {
+        "sections": {
+            "id": [row[0] for row in sections],
+            "name": [row[1] for row in sections],
+        },
+        "flats": {
+            "id": [row[0] for row in flats],
+            "name": [row[1] for row in flats],
+            "section": [row[2] for row in flats],
+        },
+    }
+
+
+def building_tree(building_id):
+    """
+    (version, tree) of a building. The tree is cached under its version for
+    BUILDING_TREE_TIMEOUT seconds; saving or deleting a section or flat of
+    the building moves it to a new version.
+    """
+    version = tree_version(building_id)
+    key = f"building-tree:{version}:{building_id}"
+    tree = cache.get(key)
+    if tree is None:
+        tree = compute_tree(building_id)
+        cache.set(key, tree, BUILDING_TREE_TIMEOUT)
+    return version, tree
+
+
+def tree_items(tree, kind):
+    """(id, name) pairs of the "sections" or "flats" of `tree`, if any."""
+    if tree is None:
+        return []
+    return zip(tree[kind]["id"], tree[kind]["name"])
+
+
+def tree_response(request, render):
+    """
+    JSON of `render(tree)` for the building in the "building_id" parameter,
+    with an ETag of the tree version so that browsers revalidate it and get
+    a 304 while it is unchanged. Buildings outside the user's scope (or no
+    building at all) give `render(None)`, which is never cached.
+    """
+    try:
+        building_id = int(request.GET.get("building_id", ""))
+    except ValueError:
+        building_id = None
+    if building_id not in get_scope(request.user).building_ids:
+        return JsonResponse(render(None))
+
+    version, tree = building_tree(building_id)
+    etag = f'"{building_id}-{version}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse(render(tree))
+    response["ETag"] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
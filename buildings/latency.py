@@ -0,0 +1,125 @@
+from datetime import timedelta
+from django.db.models import Count, Max, Q, Sum
+from django.utils import timezone
+from .models import Log, RouteLatency
+
+# Upper bounds (ms) of the histogram buckets; a last, open bucket catches the rest.
+LATENCY_BOUNDS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+BUCKET = timedelta(hours=1)
+MAX_ROLLUP_BUCKETS = 24 * 7
+
+
+def bucket_start(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def rollup_bucket(start):
+    """
+    Aggregate the access entries of the hour starting at `start` into one
+    RouteLatency row per route and method. Safe to run again for an hour.
+    """
+    entries = Log.objects.filter(
+        action="ACCESS",
+        timestamp__gte=start,
+        timestamp__lt=start + BUCKET,
+        duration_ms__isnull=False,
+    ).exclude(route="")
+    rows = (
+        entries.values("route", "method")
+        .annotate(
+            count=Count("id"),
+            error_count=Count("id", filter=Q(status__gte=500)),
+            total_ms=Sum("duration_ms"),
+            max_ms=Max("duration_ms"),
+            **{
+                f"le_{bound}": Count("id", filter=Q(duration_ms__lte=bound))
+                for bound in LATENCY_BOUNDS_MS
+            },
+        )
+        .order_by()
+    )
+    latencies = []
+    for row in rows:
+        cumulative = [row[f"le_{bound}"] for bound in LATENCY_BOUNDS_MS]
+        cumulative.append(row["count"])
+        latencies.append(
+            RouteLatency(
+                bucket=start,
+                route=row["route"],
+                method=row["method"],
+                count=row["count"],
+                error_count=row["error_count"],
+                total_ms=row["total_ms"],
+                max_ms=row["max_ms"],
+                histogram=[
+                    count - previous
+                    for count, previous in zip(cumulative, [0] + cumulative)
+                ],
+            )
+        )
+    RouteLatency.objects.bulk_create(
+        latencies,
+        update_conflicts=True,
+        unique_fields=["bucket", "route", "method"],
+        update_fields=["count", "error_count", "total_ms", "max_ms", "histogram"],
+    )
+    return len(latencies)
+
+
+def rollup_pending(now=None, max_buckets=MAX_ROLLUP_BUCKETS):
+    """
+    Roll up every finished hour since the last one in RouteLatency, skipping
+    hours without access entries. Returns the number of hours processed.
+    """
+    current = bucket_start(now or timezone.now())
+    last = RouteLatency.objects.aggregate(last=Max("bucket"))["last"]
+    entries = Log.objects.filter(action="ACCESS", timestamp__lt=current)
+    if last is not None:
+        entries = entries.filter(timestamp__gte=last + BUCKET)
+    first = entries.order_by("timestamp").values_list("timestamp", flat=True).first()
+    if first is None:
+        return 0
+
+    start = bucket_start(first)
+    processed = 0
+    while start < current and processed < max_buckets:
+        rollup_bucket(start)
+        start += BUCKET
+        processed += 1
+    return processed
+
+
+def latency_summary(latencies, quantiles=(0.5, 0.95, 0.99)):
+    """
+    Merge RouteLatency rows into {count, errors, mean_ms, max_ms, p50, ...}.
+    Quantiles are the upper bound of the histogram bucket they fall into,
+    capped at the observed maximum (which also stands in for the open bucket).
+    """
+    histogram = [0] * (len(LATENCY_BOUNDS_MS) + 1)
+    count = errors = total = maximum = 0
+    for latency in latencies:
+        count += latency.count
+        errors += latency.error_count
+        total += latency.total_ms
+        maximum = max(maximum, latency.max_ms)
+        for index, value in enumerate(latency.histogram):
+            histogram[index] += value
+
+    summary = {
+        "count": count,
+        "errors": errors,
+        "mean_ms": round(total / count, 1) if count else None,
+        "max_ms": maximum,
+    }
+    bounds = LATENCY_BOUNDS_MS + (None,)
+    for quantile in quantiles:
+        target = quantile * count
+        seen = 0
+        value = None
+        for bound, bucket_count in zip(bounds, histogram):
+            seen += bucket_count
+            if count and seen >= target:
+                value = maximum if bound is None else min(bound, maximum)
+                break
+        summary[f"p{round(quantile * 100)}"] = value
+    return summary
@@ -0,0 +1,96 @@
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import F, Max, Sum
+from django.utils import timezone
+from .models import Flat, LedgerEntry, BalanceSnapshot
+from .stats import refresh_residents
+
+SNAPSHOT_BATCH_SIZE = 1000
+
+
+def record_entry(flat_id, amount, kind):
+    """Append one balance movement for a flat; zero amounts are not stored."""
+    if amount:
+        LedgerEntry.objects.create(flat_id=flat_id, kind=kind, amount=amount)
+
+
+def record_entries(entries):
+    """Append many (flat_id, amount, kind) movements with one bulk insert."""
+    LedgerEntry.objects.bulk_create(
+        LedgerEntry(flat_id=flat_id, kind=kind, amount=amount)
+        for flat_id, amount, kind in entries
+        if amount
+    )
+
+
+def adjust_balance(flat_id, amount, kind):
+    """
+    Add `amount` to a flat's balance as a database-side increment and append
+    the movement to the ledger, both in one transaction.
+
+    Never read-modify-write Flat.balance in Python: concurrent writers
+    (payments posted while billing runs) would overwrite each other.
+    """
+    with transaction.atomic():
+        Flat.objects.filter(id=flat_id).update(
+            balance=F("balance") + amount, updated_at=timezone.now()
+        )
+        record_entry(flat_id, amount, kind)
+        refresh_residents(Flat.objects.filter(id=flat_id).values("building_id"))
+
+
+def balance_at(flat_id, moment=None):
+    """
+    Balance of a flat just before `moment`: the latest snapshot taken at or
+    before it plus the ledger entries written since that snapshot.
+    """
+    moment = moment or timezone.now()
+    snapshot = (
+        BalanceSnapshot.objects.filter(flat_id=flat_id, taken_at__lte=moment)
+        .order_by("-taken_at")
+        .first()
+    )
+    entries = LedgerEntry.objects.filter(flat_id=flat_id, created_at__lt=moment)
+    balance = Decimal(0)
+    if snapshot:
+        balance = snapshot.balance
+        entries = entries.filter(created_at__gte=snapshot.taken_at)
+    return balance + (entries.aggregate(total=Sum("amount"))["total"] or 0)
+
+
+def take_balance_snapshots(taken_at):
+    """
+    Snapshot every flat's balance as of `taken_at`.
+
+    Rolls the previous snapshot forward with one grouped sum over the entries
+    written since, so the cost is bounded by a month of movements rather than
+    the whole history. Re-taking an existing snapshot is a no-op.
+    """
+    previous_at = BalanceSnapshot.objects.filter(taken_at__lt=taken_at).aggregate(
+        previous=Max("taken_at")
+    )["previous"]
+    balances = {}
+    entries = LedgerEntry.objects.filter(created_at__lt=taken_at)
+    if previous_at:
+        balances = dict(
+            BalanceSnapshot.objects.filter(taken_at=previous_at).values_list(
+                "flat_id", "balance"
+            )
+        )
+        entries = entries.filter(created_at__gte=previous_at)
+
+    movements = (
+        entries.order_by().values("flat_id").annotate(total=Sum("amount"))
+    ).values_list("flat_id", "total")
+    for flat_id, total in movements:
+        balances[flat_id] = balances.get(flat_id, 0) + total
+
+    BalanceSnapshot.objects.bulk_create(
+        (
+            BalanceSnapshot(flat_id=flat_id, taken_at=taken_at, balance=balance)
+            for flat_id, balance in balances.items()
+        ),
+        batch_size=SNAPSHOT_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    return len(balances)
@@ -0,0 +1,120 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from django.conf import settings
+from django.db import close_old_connections, connection
+from .models import Log
+
+logger = logging.getLogger(__name__)
+
+ACCESS_LOG_BUFFER_SIZE = getattr(settings, "ACCESS_LOG_BUFFER_SIZE", 10000)
+ACCESS_LOG_BATCH_SIZE = getattr(settings, "ACCESS_LOG_BATCH_SIZE", 500)
+ACCESS_LOG_FLUSH_INTERVAL = getattr(settings, "ACCESS_LOG_FLUSH_INTERVAL", 2.0)
+
+
+class LogBuffer:
+    """
+    In-process queue of unsaved Log rows written by a background thread.
+
+    Rows are inserted with bulk_create once `batch_size` of them are waiting
+    or `flush_interval` seconds after the first one arrived, whichever comes
+    first. The queue holds at most `max_size` rows; when the writer cannot
+    keep up new rows are dropped and counted instead of blocking requests.
+    The writer thread starts on first use, so every forked worker process
+    gets its own, and whatever is left is flushed when the process exits.
+    """
+
+    def __init__(
+        self,
+        max_size=ACCESS_LOG_BUFFER_SIZE,
+        batch_size=ACCESS_LOG_BATCH_SIZE,
+        flush_interval=ACCESS_LOG_FLUSH_INTERVAL,
+    ):
+        self.queue = queue.Queue(maxsize=max_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.written = 0
+        self._reported = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def put(self, entry):
+        self._start()
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="access-log-writer", daemon=True
+                )
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect()
+            if batch:
+                close_old_connections()
+                self._write(batch)
+                connection.close()
+
+    def _collect(self):
+        """Wait for the first row, then gather until the batch is full or due."""
+        try:
+            batch = [self.queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size and not self._stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        try:
+            Log.objects.bulk_create(batch, batch_size=self.batch_size)
+            self.written += len(batch)
+        except Exception:
+            logger.exception("Could not write %d access log entries", len(batch))
+        if self.dropped != self._reported:
+            logger.warning(
+                "Access log buffer full, %d entries dropped so far", self.dropped
+            )
+            self._reported = self.dropped
+
+    def flush(self):
+        """Write everything queued so far from the calling thread."""
+        batch = []
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        for start in range(0, len(batch), self.batch_size):
+            self._write(batch[start : start + self.batch_size])
+
+    def stop(self, timeout=5):
+        """Stop the writer thread and flush what is left, e.g. at worker exit."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+
+
+access_log_buffer = LogBuffer()
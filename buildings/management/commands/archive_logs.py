@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from buildings.archive import (
+    LOG_ARCHIVE_DIR,
+    LOG_RETENTION_MONTHS,
+    archive_expired_logs,
+    month_start,
+)
+from buildings.models import Log
+
+
+class Command(BaseCommand):
+    help = (
+        "Export Log rows older than the retention period to gzipped JSON lines "
+        "files, one per month, and delete them from the table."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--retention-months", type=int, default=LOG_RETENTION_MONTHS
+        )
+        parser.add_argument("--dir", default=str(LOG_ARCHIVE_DIR))
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        if options["dry_run"]:
+            cutoff = month_start(timezone.localtime(), options["retention_months"])
+            count = Log.objects.filter(timestamp__lt=cutoff).count()
+            self.stdout.write(f"{count} log entries before {cutoff:%Y-%m-%d}")
+            return
+
+        archived = archive_expired_logs(options["retention_months"], options["dir"])
+        for path, count in archived:
+            self.stdout.write(f"{path}: {count} entries")
+        self.stdout.write(
+            self.style.SUCCESS(f"Archived {sum(c for _, c in archived)} log entries")
+        )
@@ -0,0 +1,138 @@
+import json
+import statistics
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from buildings.billing import bill_service
+from buildings.models import User, Branch, Building, Flat, Service, Charge, Payment
+
+
+class Command(BaseCommand):
+    help = (
+        "Time billing, the main list views and the resident API against the "
+        "data of one owner and write the results as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--owner", default="bench")
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--output", default="bench_results.json")
+        parser.add_argument("--compare", help="Previous results file to diff against")
+        parser.add_argument("--only", nargs="*", help="Run only these cases")
+
+    def handle(self, *args, **options):
+        try:
+            owner = User.objects.get(username=options["owner"])
+        except User.DoesNotExist:
+            raise CommandError(
+                f"Owner '{options['owner']}' not found; run generate_data first."
+            )
+        resident = User.objects.filter(
+            flat__building__branch__owner=owner, resident=True
+        ).first()
+
+        cases = self.get_cases(owner, resident)
+        if options["only"]:
+            cases = [case for case in cases if case[0] in options["only"]]
+
+        with override_settings(ALLOWED_HOSTS=["testserver"]):
+            results = [self.measure(*case, options["repeat"]) for case in cases]
+
+        payload = {
+            "created_at": timezone.now().isoformat(),
+            "database": connection.vendor,
+            "owner": owner.username,
+            "scale": {
+                "branches": Branch.objects.filter(owner=owner).count(),
+                "buildings": Building.objects.filter(branch__owner=owner).count(),
+                "flats": Flat.objects.filter(building__branch__owner=owner).count(),
+                "charges": Charge.objects.filter(
+                    flat__building__branch__owner=owner
+                ).count(),
+                "payments": Payment.objects.filter(
+                    building__branch__owner=owner
+                ).count(),
+            },
+            "results": results,
+        }
+        with open(options["output"], "w") as output:
+            json.dump(payload, output, indent=2)
+
+        previous = {}
+        if options["compare"]:
+            with open(options["compare"]) as compare:
+                previous = {row["name"]: row for row in json.load(compare)["results"]}
+        for row in results:
+            line = (
+                f"{row['name']:<20} median {row['median_ms']:>9.2f} ms"
+                f"  queries {row['queries']:>6}"
+            )
+            if row["name"] in previous:
+                before = previous[row["name"]]
+                line += (
+                    f"  (was {before['median_ms']:.2f} ms,"
+                    f" {before['queries']} queries)"
+                )
+            self.stdout.write(line)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def get_cases(self, owner, resident):
+        client = Client()
+        client.force_login(owner)
+        api = APIClient()
+        if resident:
+            api.force_authenticate(user=resident)
+
+        def page(path):
+            return lambda: client.get(path).status_code
+
+        def endpoint(path):
+            return lambda: api.get(path).status_code
+
+        def billing():
+            # Bill every service of the owner for today and roll it all back,
+            # so repeated runs (and later benchmarks) see the same data.
+            billing_date = timezone.now().date()
+            with transaction.atomic():
+                for service in Service.objects.filter(
+                    branch__owner=owner, is_active=True
+                ):
+                    bill_service(service, billing_date)
+                transaction.set_rollback(True)
+
+        cases = [
+            ("billing", billing),
+            ("dashboard", page("/")),
+            ("flat-list", page("/flats/")),
+            ("payment-list", page("/payments/")),
+        ]
+        if resident:
+            cases += [
+                ("api-flats", endpoint("/api/flats/")),
+                ("api-payments", endpoint("/api/payments/")),
+                ("api-charges", endpoint("/api/charges/all/")),
+                ("api-notifications", endpoint("/api/notifications/")),
+            ]
+        return cases
+
+    def measure(self, name, run, repeat):
+        timings = []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                status = run()
+                timings.append((time.perf_counter() - start) * 1000)
+        return {
+            "name": name,
+            "repeat": repeat,
+            "status": status,
+            "queries": len(queries),
+            "min_ms": round(min(timings), 3),
+            "median_ms": round(statistics.median(timings), 3),
+            "mean_ms": round(statistics.mean(timings), 3),
+            "max_ms": round(max(timings), 3),
+        }
@@ -0,0 +1,186 @@
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from buildings.phones import phone_fields
+from buildings.rollups import rebuild_rollups
+from buildings.stats import reconcile_stats
+from buildings.models import (
+    User,
+    Branch,
+    Building,
+    Section,
+    Flat,
+    Service,
+    Charge,
+    Payment,
+    Expense,
+    Notification,
+)
+
+
+class Command(BaseCommand):
+    help = "Generate a synthetic branch/building/flat dataset for benchmarking."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--flats", type=int, default=1000)
+        parser.add_argument("--owner", default="bench")
+        parser.add_argument("--flats-per-building", type=int, default=200)
+        parser.add_argument("--buildings-per-branch", type=int, default=10)
+        parser.add_argument("--sections", type=int, default=4)
+        parser.add_argument("--services", type=int, default=3)
+        parser.add_argument("--months", type=int, default=3)
+        parser.add_argument("--notifications", type=int, default=2)
+        parser.add_argument("--resident-ratio", type=float, default=0.8)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options["seed"])
+        self.options = options
+        self.password = make_password("rempro-bench")
+
+        owner, _ = User.objects.get_or_create(
+            username=options["owner"],
+            defaults={"is_superuser": True, "is_staff": True},
+        )
+        owner.set_password("rempro-bench")
+        owner.save()
+
+        per_building = options["flats_per_building"]
+        remaining = options["flats"]
+        branch_count = 0
+        while remaining > 0:
+            branch, services = self.create_branch(owner, branch_count)
+            branch_count += 1
+            for _ in range(options["buildings_per_branch"]):
+                if remaining <= 0:
+                    break
+                flat_count = min(per_building, remaining)
+                self.create_building(branch, services, flat_count)
+                remaining -= flat_count
+            self.stdout.write(f"{branch.name}: done")
+
+        # The generator writes with bulk_create, which sends no signals.
+        reconcile_stats()
+        rebuild_rollups()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Generated {options['flats']} flats in {branch_count} branches "
+                f"for owner '{owner.username}'"
+            )
+        )
+
+    def create_branch(self, owner, number):
+        branch = Branch.objects.create(
+            owner=owner, name=f"Filial {number + 1}", address="Bakı"
+        )
+        services = Service.objects.bulk_create(
+            Service(
+                branch=branch,
+                name=f"Xidmət {index + 1}",
+                price=Decimal(self.random.randint(20, 150)) / 100,
+                invoice_day=self.random.randint(1, 28),
+            )
+            for index in range(self.options["services"])
+        )
+        return branch, services
+
+    @transaction.atomic
+    def create_building(self, branch, services, flat_count):
+        rnd = self.random
+        building = Building.objects.create(
+            name=f"Bina {branch.id}-{rnd.randint(1, 10**6)}",
+            address="Bakı",
+            branch=branch,
+        )
+        sections = Section.objects.bulk_create(
+            Section(building=building, name=chr(ord("A") + index % 26))
+            for index in range(self.options["sections"])
+        )
+
+        residents = User.objects.bulk_create(
+            User(
+                username=f"r{building.id}_{index}",
+                password=self.password,
+                resident=True,
+                phone_number=phone,
+                **phone_fields(phone),
+            )
+            for index in range(flat_count)
+            if rnd.random() < self.options["resident_ratio"]
+            for phone in [f"+99450{building.id % 1000:03d}{index:04d}"]
+        )
+        resident_ids = [user.id for user in residents]
+        resident_ids += [None] * (flat_count - len(resident_ids))
+        rnd.shuffle(resident_ids)
+
+        flats = Flat.objects.bulk_create(
+            Flat(
+                building=building,
+                section=sections[index % len(sections)],
+                name=str(index + 1),
+                resident_id=resident_ids[index],
+                square_metres=Decimal(rnd.randint(3000, 15000)) / 100,
+                balance=Decimal(rnd.randint(-5000, 10000)) / 100,
+            )
+            for index in range(flat_count)
+        )
+
+        Through = Flat.services.through
+        Through.objects.bulk_create(
+            Through(flat_id=flat.id, service_id=service.id)
+            for flat in flats
+            for service in rnd.sample(services, rnd.randint(1, len(services)))
+        )
+
+        today = date.today()
+        charges = []
+        payments = []
+        for flat in flats:
+            for month in range(self.options["months"]):
+                amount = (Decimal(rnd.randint(1000, 20000)) / 100).quantize(
+                    Decimal("0.01")
+                )
+                paid = rnd.random() < 0.7
+                charges.append(
+                    Charge(
+                        flat_id=flat.id,
+                        service=rnd.choice(services),
+                        amount=amount,
+                        is_paid=paid,
+                    )
+                )
+                if paid:
+                    payments.append(
+                        Payment(
+                            building=building,
+                            flat_id=flat.id,
+                            user_id=flat.resident_id,
+                            amount=amount,
+                            date=today - timedelta(days=30 * month),
+                        )
+                    )
+        Charge.objects.bulk_create(charges, batch_size=2000)
+        Payment.objects.bulk_create(payments, batch_size=2000)
+
+        Expense.objects.bulk_create(
+            Expense(
+                name="Təmir",
+                price=Decimal(rnd.randint(10000, 500000)) / 100,
+                outcome_date=today - timedelta(days=30 * month),
+                building=building,
+                branch=branch,
+            )
+            for month in range(self.options["months"])
+        )
+        Notification.objects.bulk_create(
+            (
+                Notification(title="Bildiriş", message="Xəbər", user_id=user.id)
+                for user in residents
+                for _ in range(self.options["notifications"])
+            ),
+            batch_size=2000,
+        )
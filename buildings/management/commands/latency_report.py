@@ -0,0 +1,43 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from buildings.latency import latency_summary, rollup_pending
+from buildings.models import RouteLatency
+
+
+class Command(BaseCommand):
+    help = "Per-route latency percentiles from the hourly RouteLatency rollups."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=7)
+        parser.add_argument("--route", help="Only this route name")
+        parser.add_argument("--method", help="Only this HTTP method")
+        parser.add_argument(
+            "--rollup", action="store_true", help="Roll up finished hours first"
+        )
+
+    def handle(self, *args, **options):
+        if options["rollup"]:
+            rollup_pending()
+
+        latencies = RouteLatency.objects.filter(
+            bucket__gte=timezone.now() - timedelta(days=options["days"])
+        )
+        if options["route"]:
+            latencies = latencies.filter(route=options["route"])
+        if options["method"]:
+            latencies = latencies.filter(method=options["method"].upper())
+
+        by_route = {}
+        for latency in latencies.order_by("route", "method"):
+            by_route.setdefault((latency.route, latency.method), []).append(latency)
+
+        for (route, method), rows in by_route.items():
+            summary = latency_summary(rows)
+            self.stdout.write(
+                f"{method:<6} {route:<40} n={summary['count']:<8}"
+                f" p50={summary['p50']} p95={summary['p95']} p99={summary['p99']}"
+                f" max={summary['max_ms']} ms errors={summary['errors']}"
+            )
+        if not by_route:
+            self.stdout.write("No latency rollups in this period.")
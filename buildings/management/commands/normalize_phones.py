@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from buildings.models import User
+from buildings.phones import phone_fields
+
+PHONE_CHUNK_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the normalized phone search columns of existing users, e.g. after "
+        "upgrading or after phone numbers were changed with bulk updates."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=PHONE_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        fields = ["phone_digits", "phone_digits_reversed"]
+        rows = User.objects.order_by("id").values_list("id", "phone_number", *fields)
+        changed = []
+        updated = 0
+        for user_id, phone_number, *stored in rows.iterator(chunk_size=chunk_size):
+            values = phone_fields(phone_number)
+            if [values[field] for field in fields] != stored:
+                changed.append(User(id=user_id, **values))
+            if len(changed) >= chunk_size:
+                updated += User.objects.bulk_update(changed, fields)
+                changed = []
+        if changed:
+            updated += User.objects.bulk_update(changed, fields)
+        self.stdout.write(self.style.SUCCESS(f"Normalized {updated} phone numbers"))
@@ -0,0 +1,46 @@
+import json
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from buildings.archive import LOG_ARCHIVE_DIR, search_archives
+
+
+class Command(BaseCommand):
+    help = "Search archived log entries; prints matching rows as JSON lines."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dir", default=str(LOG_ARCHIVE_DIR))
+        parser.add_argument("--since", help="YYYY-MM-DD")
+        parser.add_argument("--until", help="YYYY-MM-DD, exclusive")
+        parser.add_argument("--user", dest="user_id")
+        parser.add_argument("--action")
+        parser.add_argument("--route")
+        parser.add_argument("--status")
+        parser.add_argument("--text", help="Substring of details or path")
+        parser.add_argument("--limit", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        fields = {
+            key: options[key]
+            for key in ("user_id", "action", "route", "status")
+            if options[key]
+        }
+        rows = search_archives(
+            options["dir"],
+            since=self.parse_date(options["since"]),
+            until=self.parse_date(options["until"]),
+            text=options["text"],
+            **fields,
+        )
+        for number, row in enumerate(rows):
+            if number == options["limit"]:
+                break
+            self.stdout.write(json.dumps(row, ensure_ascii=False))
+
+    def parse_date(self, value):
+        if not value:
+            return None
+        try:
+            return timezone.make_aware(datetime.strptime(value, "%Y-%m-%d"))
+        except ValueError:
+            raise CommandError(f"Invalid date '{value}', expected YYYY-MM-DD")
@@ -1,4 +1,6 @@
+from django.conf import settings
 from django.utils.deprecation import MiddlewareMixin
+from .logbuffer import access_log_buffer
 from .models import Log
 
 from django.utils import timezone
@@ -9,23 +11,30 @@ class LogMiddleware(MiddlewareMixin):
         # For simplicity, log only authenticated user actions
         if request.user.is_authenticated:
             request._start_time = timezone.now()
+            # DRF may swap request.user for an anonymous one on API routes.
+            request._log_user_id = request.user.pk
 
     def process_response(self, request, response):
         if hasattr(request, "_start_time"):
             duration = timezone.now() - request._start_time
-            action = "ACCESS"
-            model_name = "N/A"
-            object_id = None
-            details = (
-                f"Method: {request.method}, Path: {request.path}, Duration: {duration}"
+            match = request.resolver_match
+            entry = Log(
+                user_id=request._log_user_id,
+                action="ACCESS",
+                model_name="N/A",
+                object_id=None,
+                timestamp=request._start_time,
+                method=request.method[:10],
+                path=request.path[:255],
+                route=(match.view_name if match else "")[:100],
+                status=response.status_code,
+                duration_ms=round(duration.total_seconds() * 1000),
             )
 
-            # Log access
-            Log.objects.create(
-                user=request.user,
-                action=action,
-                model_name=model_name,
-                object_id=object_id,
-                details=details,
-            )
+            # "sync" writes the entry during the response, "buffered" hands it
+            # to the background writer so the request never waits on the INSERT.
+            if getattr(settings, "ACCESS_LOG_MODE", "buffered") == "buffered":
+                access_log_buffer.put(entry)
+            else:
+                entry.save()
         return response
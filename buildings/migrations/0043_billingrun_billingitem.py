@@ -0,0 +1,46 @@
+# Generated by Django 5.0.6 on 2026-10-18 09:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildings', '0042_notification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BillingRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('billing_date', models.DateField()),
+                ('status', models.CharField(choices=[('RUNNING', 'İcra olunur'), ('DONE', 'Tamamlandı')], default='RUNNING', max_length=20)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='billing_runs', to='buildings.service')),
+            ],
+            options={
+                'verbose_name': 'Hesablama',
+                'verbose_name_plural': 'Hesablamalar',
+                'ordering': ['-billing_date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='BillingItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('flat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='billing_items', to='buildings.flat')),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='buildings.billingrun')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='billingrun',
+            constraint=models.UniqueConstraint(fields=('service', 'billing_date'), name='unique_billing_run'),
+        ),
+        migrations.AddConstraint(
+            model_name='billingitem',
+            constraint=models.UniqueConstraint(fields=('run', 'flat'), name='unique_billing_item'),
+        ),
+    ]
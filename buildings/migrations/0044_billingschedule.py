@@ -0,0 +1,24 @@
+# Generated by Django 5.0.6 on 2026-10-18 09:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildings', '0043_billingrun_billingitem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BillingSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_billed_date', models.DateField(verbose_name='Son hesablama tarixi')),
+            ],
+            options={
+                'verbose_name': 'Hesablama cədvəli',
+                'verbose_name_plural': 'Hesablama cədvəli',
+            },
+        ),
+    ]
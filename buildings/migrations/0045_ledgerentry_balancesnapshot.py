@@ -0,0 +1,50 @@
+# Generated by Django 5.0.6 on 2026-10-18 09:25
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildings', '0044_billingschedule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField()),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('flat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_snapshots', to='buildings.flat')),
+            ],
+            options={
+                'verbose_name': 'Balans qeydi',
+                'verbose_name_plural': 'Balans qeydləri',
+            },
+        ),
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('OPENING', 'İlkin balans'), ('PAYMENT', 'Ödəniş'), ('BILLING', 'Hesablama')], max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('flat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='buildings.flat')),
+            ],
+            options={
+                'verbose_name': 'Balans hərəkəti',
+                'verbose_name_plural': 'Balans hərəkətləri',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='balancesnapshot',
+            constraint=models.UniqueConstraint(fields=('flat', 'taken_at'), name='unique_balance_snapshot'),
+        ),
+        migrations.AddIndex(
+            model_name='ledgerentry',
+            index=models.Index(fields=['flat', 'created_at'], name='buildings_l_flat_id_566e73_idx'),
+        ),
+    ]
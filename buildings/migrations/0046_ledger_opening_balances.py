@@ -0,0 +1,32 @@
+# Generated by Django 5.0.6 on 2026-10-18 09:25
+
+from django.db import migrations
+
+
+def create_opening_entries(apps, schema_editor):
+    Flat = apps.get_model('buildings', 'Flat')
+    LedgerEntry = apps.get_model('buildings', 'LedgerEntry')
+    balances = Flat.objects.exclude(balance=0).values_list('id', 'balance')
+    LedgerEntry.objects.bulk_create(
+        (
+            LedgerEntry(flat_id=flat_id, kind='OPENING', amount=balance)
+            for flat_id, balance in balances.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+def delete_opening_entries(apps, schema_editor):
+    LedgerEntry = apps.get_model('buildings', 'LedgerEntry')
+    LedgerEntry.objects.filter(kind='OPENING').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildings', '0045_ledgerentry_balancesnapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_opening_entries, delete_opening_entries),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.0.6 on 2026-10-18 09:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildings', '0046_ledger_opening_balances'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChargeAllocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Borc ödənişi',
+                'verbose_name_plural': 'Borc ödənişləri',
+            },
+        ),
+        migrations.AlterField(
+            model_name='ledgerentry',
+            name='kind',
+            field=models.CharField(choices=[('OPENING', 'İlkin balans'), ('PAYMENT', 'Ödəniş'), ('BILLING', 'Hesablama'), ('ALLOCATION', 'Borca silindi')], max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='charge',
+            index=models.Index(fields=['flat', 'is_paid', 'created_at'], name='buildings_c_flat_id_55d22a_idx'),
+        ),
+        migrations.AddField(
+            model_name='chargeallocation',
+            name='charge',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='allocations', to='buildings.charge'),
+        ),
+        migrations.AddField(
+            model_name='chargeallocation',
+            name='payment',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='allocations', to='buildings.payment'),
+        ),
+    ]
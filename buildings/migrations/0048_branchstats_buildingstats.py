@@ -0,0 +1,51 @@
+# Generated by Django 5.0.6 on 2026-10-18 09:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildings', '0047_chargeallocation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BranchStats',
+            fields=[
+                ('branch', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='buildings.branch')),
+                ('building_count', models.IntegerField(default=0)),
+                ('section_count', models.IntegerField(default=0)),
+                ('flat_count', models.IntegerField(default=0)),
+                ('resident_count', models.IntegerField(default=0)),
+                ('debtor_count', models.IntegerField(default=0)),
+                ('payment_count', models.IntegerField(default=0)),
+                ('expense_month', models.DateField(blank=True, null=True)),
+                ('expense_total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Filial statistikası',
+                'verbose_name_plural': 'Filial statistikası',
+            },
+        ),
+        migrations.CreateModel(
+            name='BuildingStats',
+            fields=[
+                ('building', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='buildings.building')),
+                ('section_count', models.IntegerField(default=0)),
+                ('flat_count', models.IntegerField(default=0)),
+                ('resident_count', models.IntegerField(default=0)),
+                ('debtor_count', models.IntegerField(default=0)),
+                ('payment_count', models.IntegerField(default=0)),
+                ('expense_month', models.DateField(blank=True, null=True)),
+                ('expense_total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Bina statistikası',
+                'verbose_name_plural': 'Bina statistikası',
+            },
+        ),
+    ]
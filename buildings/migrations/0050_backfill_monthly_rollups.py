@@ -0,0 +1,73 @@
+# Generated by Django 5.0.6 on 2026-10-18 13:40
+
+from collections import defaultdict
+
+from django.db import migrations
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce, ExtractMonth, ExtractYear
+
+
+def fill_rollups(apps, schema_editor):
+    Payment = apps.get_model('buildings', 'Payment')
+    Expense = apps.get_model('buildings', 'Expense')
+    MonthlyRollup = apps.get_model('buildings', 'MonthlyRollup')
+
+    rows = defaultdict(dict)
+    payments = (
+        Payment.objects.values(
+            'building__branch_id',
+            'building_id',
+            year=ExtractYear('date'),
+            month=ExtractMonth('date'),
+        )
+        .annotate(payment_total=Sum('amount'), payment_count=Count('id'))
+        .order_by()
+    )
+    for row in payments:
+        key = (row['building__branch_id'], row['building_id'], row['year'], row['month'])
+        rows[key].update(
+            payment_total=row['payment_total'], payment_count=row['payment_count']
+        )
+    expenses = (
+        Expense.objects.exclude(building__isnull=True, branch__isnull=True)
+        .values(
+            'building_id',
+            rollup_branch=Coalesce('branch_id', 'building__branch_id'),
+            year=ExtractYear('outcome_date'),
+            month=ExtractMonth('outcome_date'),
+        )
+        .annotate(expense_total=Sum('price'))
+        .order_by()
+    )
+    for row in expenses:
+        key = (row['rollup_branch'], row['building_id'], row['year'], row['month'])
+        rows[key]['expense_total'] = row['expense_total']
+
+    MonthlyRollup.objects.bulk_create(
+        (
+            MonthlyRollup(
+                branch_id=branch_id,
+                building_id=building_id,
+                year=year,
+                month=month,
+                **totals,
+            )
+            for (branch_id, building_id, year, month), totals in rows.items()
+        ),
+        batch_size=1000,
+    )
+
+
+def clear_rollups(apps, schema_editor):
+    apps.get_model('buildings', 'MonthlyRollup').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildings', '0049_monthlyrollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_rollups, clear_rollups),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 09:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildings', '0050_backfill_monthly_rollups'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='log',
+            name='object_id',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.0.6 on 2026-10-18 09:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildings', '0051_log_object_id_nullable'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteLatency',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('route', models.CharField(max_length=100)),
+                ('method', models.CharField(max_length=10)),
+                ('count', models.IntegerField(default=0)),
+                ('error_count', models.IntegerField(default=0)),
+                ('total_ms', models.BigIntegerField(default=0)),
+                ('max_ms', models.IntegerField(default=0)),
+                ('histogram', models.JSONField(default=list)),
+            ],
+            options={
+                'verbose_name': 'Marşrut gecikməsi',
+                'verbose_name_plural': 'Marşrut gecikmələri',
+            },
+        ),
+        migrations.AddField(
+            model_name='log',
+            name='duration_ms',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='log',
+            name='method',
+            field=models.CharField(blank=True, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='log',
+            name='path',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='log',
+            name='route',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='log',
+            name='status',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='log',
+            index=models.Index(fields=['timestamp'], name='buildings_l_timesta_890964_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='log',
+            index=models.Index(fields=['route', 'timestamp'], name='buildings_l_route_d0ebcc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='log',
+            index=models.Index(fields=['status', 'timestamp'], name='buildings_l_status_3ea752_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='routelatency',
+            index=models.Index(fields=['route', 'bucket'], name='buildings_r_route_2fe153_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='routelatency',
+            constraint=models.UniqueConstraint(fields=('bucket', 'route', 'method'), name='unique_route_latency'),
+        ),
+    ]
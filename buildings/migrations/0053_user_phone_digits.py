@@ -0,0 +1,48 @@
+# Generated by Django 5.0.6 on 2026-10-18 09:56
+
+from django.db import migrations, models
+
+from buildings.phones import phone_fields
+
+
+def fill_phone_digits(apps, schema_editor):
+    User = apps.get_model('buildings', 'User')
+    fields = ['phone_digits', 'phone_digits_reversed']
+    rows = User.objects.exclude(phone_number__isnull=True).exclude(phone_number='')
+    changed = []
+    for user_id, phone_number in rows.values_list('id', 'phone_number').iterator():
+        changed.append(User(id=user_id, **phone_fields(phone_number)))
+        if len(changed) >= 1000:
+            User.objects.bulk_update(changed, fields)
+            changed = []
+    User.objects.bulk_update(changed, fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('buildings', '0052_log_structured_columns_routelatency'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='phone_digits',
+            field=models.CharField(blank=True, editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='phone_digits_reversed',
+            field=models.CharField(blank=True, editable=False, max_length=20),
+        ),
+        migrations.RunPython(fill_phone_digits, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['phone_digits'], name='user_phone_digits_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['phone_digits_reversed'], name='user_phone_reversed_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.6 on 2026-10-18 09:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildings', '0053_user_phone_digits'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='flat',
+            index=models.Index(fields=['building', 'name'], name='flat_building_name_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildings', '0054_flat_building_name_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='charge',
+            index=models.Index(fields=['flat', 'created_at'], name='charge_flat_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'timestamp'], name='notification_user_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['flat', 'date'], name='payment_flat_date_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildings', '0056_sync_change_tracking'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='billingschedule',
+            name='branch',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='billing_schedule', to='buildings.branch', verbose_name='Filial'),
+        ),
+    ]
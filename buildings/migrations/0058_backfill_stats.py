@@ -0,0 +1,28 @@
+# Generated by Django 5.0.6 on 2026-10-18 15:02
+
+from django.db import migrations
+
+from buildings.stats import reconcile_stats
+
+
+def fill_stats(apps, schema_editor):
+    # The stats tables only follow changes made after they exist; count
+    # everything already there once, with the nightly reconcile. It reads
+    # the current models, which match the schema at this point.
+    reconcile_stats()
+
+
+def clear_stats(apps, schema_editor):
+    apps.get_model('buildings', 'BuildingStats').objects.all().delete()
+    apps.get_model('buildings', 'BranchStats').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildings', '0057_billingschedule_branch'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_stats, clear_stats),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.0.6 on 2026-10-18 15:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def split_shared_mark(apps, schema_editor):
+    # The single mark kept before marks were per branch becomes the mark of
+    # every branch that has none of its own yet.
+    BillingSchedule = apps.get_model('buildings', 'BillingSchedule')
+    Branch = apps.get_model('buildings', 'Branch')
+    shared = BillingSchedule.objects.filter(branch__isnull=True)
+    last_billed_date = (
+        shared.order_by('-last_billed_date')
+        .values_list('last_billed_date', flat=True)
+        .first()
+    )
+    if last_billed_date is not None:
+        BillingSchedule.objects.bulk_create(
+            BillingSchedule(branch_id=branch_id, last_billed_date=last_billed_date)
+            for branch_id in Branch.objects.filter(
+                billing_schedule__isnull=True
+            ).values_list('id', flat=True)
+        )
+    shared.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildings', '0058_backfill_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(split_shared_mark, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='billingschedule',
+            name='branch',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='billing_schedule', to='buildings.branch', verbose_name='Filial'),
+        ),
+    ]
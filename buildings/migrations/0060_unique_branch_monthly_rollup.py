@@ -0,0 +1,40 @@
+# Generated by Django 5.0.6 on 2026-10-18 15:41
+
+from django.db import migrations, models
+from django.db.models import Count, F
+
+
+def merge_duplicate_rollups(apps, schema_editor):
+    MonthlyRollup = apps.get_model('buildings', 'MonthlyRollup')
+    duplicates = (
+        MonthlyRollup.objects.filter(building__isnull=True)
+        .values('branch_id', 'year', 'month')
+        .annotate(rows=Count('id'))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    for key in duplicates:
+        del key['rows']
+        rows = MonthlyRollup.objects.filter(building__isnull=True, **key)
+        first, *rest = rows.order_by('id')
+        MonthlyRollup.objects.filter(id=first.id).update(
+            payment_total=F('payment_total') + sum(row.payment_total for row in rest),
+            payment_count=F('payment_count') + sum(row.payment_count for row in rest),
+            expense_total=F('expense_total') + sum(row.expense_total for row in rest),
+        )
+        MonthlyRollup.objects.filter(id__in=[row.id for row in rest]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buildings', '0059_billingschedule_branch_required'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_rollups, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='monthlyrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('building__isnull', True)), fields=('branch', 'year', 'month'), name='unique_branch_monthly_rollup'),
+        ),
+    ]
@@ -4,6 +4,7 @@ from django.db import models
 from django.core.exceptions import ValidationError
 from django.contrib.auth.models import AbstractUser, Group, Permission
 from django.core.validators import RegexValidator
+from .phones import phone_fields
 
 
 def validate_day(value):
@@ -17,6 +18,10 @@ class User(AbstractUser):
         blank=True,
         null=True,
     )
+    # Canonical digits of phone_number and their reverse, set on save, for
+    # exact, prefix and last-digits search (see buildings.phones).
+    phone_digits = models.CharField(max_length=20, blank=True, editable=False)
+    phone_digits_reversed = models.CharField(max_length=20, blank=True, editable=False)
     commandant = models.BooleanField(default=False)
     resident = models.BooleanField(default=False)
     email = models.EmailField(unique=True, blank=True, null=True)
@@ -42,10 +47,36 @@ class User(AbstractUser):
     def set_password(self, raw_password):
         super().set_password(raw_password)
 
+    def save(self, *args, **kwargs):
+        for field, value in phone_fields(self.phone_number).items():
+            setattr(self, field, value)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "phone_number" in update_fields:
+            kwargs["update_fields"] = {
+                *update_fields,
+                "phone_digits",
+                "phone_digits_reversed",
+            }
+        super().save(*args, **kwargs)
+
     class Meta:
         ordering = ["id"]
         verbose_name = "İstifadəçilər"
         verbose_name_plural = "İstifadəçilər"
+        # The pattern opclass lets PostgreSQL use the index for LIKE 'x%'
+        # (startswith) as well as for equality; other backends ignore it.
+        indexes = [
+            models.Index(
+                fields=["phone_digits"],
+                name="user_phone_digits_idx",
+                opclasses=["varchar_pattern_ops"],
+            ),
+            models.Index(
+                fields=["phone_digits_reversed"],
+                name="user_phone_reversed_idx",
+                opclasses=["varchar_pattern_ops"],
+            ),
+        ]
 
 
 class Branch(models.Model):
@@ -163,11 +194,16 @@ class Flat(models.Model):
     owner_document = models.FileField(
         upload_to="documents/", verbose_name="Sahibkar sənədi"
     )
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ["id"]
         verbose_name = "Mənzillər"
         verbose_name_plural = "Mənzillər"
+        indexes = [
+            # Autocomplete: the name filter and ranking within one building.
+            models.Index(fields=["building", "name"], name="flat_building_name_idx"),
+        ]
 
     def __str__(self):
         return self.name
@@ -239,6 +275,7 @@ class Charge(models.Model):
     is_paid = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     is_paid_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Borc {self.flat} - {self.amount}"
@@ -246,6 +283,12 @@ class Charge(models.Model):
     class Meta:
         verbose_name = "Borc"
         verbose_name_plural = "Borclar"
+        indexes = [
+            models.Index(fields=["flat", "is_paid", "created_at"]),
+            # The resident API pages through charges newest first.
+            models.Index(fields=["flat", "created_at"], name="charge_flat_created_idx"),
+            models.Index(fields=["flat", "updated_at"], name="charge_flat_updated_idx"),
+        ]
 
 
 class Payment(models.Model):
@@ -279,6 +322,7 @@ class Payment(models.Model):
     )
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     date = models.DateField(verbose_name="Tarix", help_text="Ödənişin tarixi")
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Payment of {self.amount} on {self.date} for {self.flat}"
@@ -287,6 +331,12 @@ class Payment(models.Model):
         ordering = ["-date"]
         verbose_name = "Ödəniş"
         verbose_name_plural = "Ödəniş"
+        indexes = [
+            models.Index(fields=["flat", "date"], name="payment_flat_date_idx"),
+            models.Index(
+                fields=["flat", "updated_at"], name="payment_flat_updated_idx"
+            ),
+        ]
 
 
 class Garage(models.Model):
@@ -325,13 +375,25 @@ class Log(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="logs")
     action = models.CharField(max_length=20, choices=ACTION_CHOICES)
     model_name = models.CharField(max_length=50)
-    object_id = models.PositiveIntegerField()
+    object_id = models.PositiveIntegerField(blank=True, null=True)
     timestamp = models.DateTimeField(default=timezone.now)
     details = models.TextField(blank=True, null=True)
+    method = models.CharField(max_length=10, blank=True)
+    path = models.CharField(max_length=255, blank=True)
+    route = models.CharField(max_length=100, blank=True)
+    status = models.PositiveSmallIntegerField(blank=True, null=True)
+    duration_ms = models.PositiveIntegerField(blank=True, null=True)
 
     def __str__(self):
         return f"{self.user} {self.action} {self.model_name} #{self.object_id} at {self.timestamp}"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["timestamp"]),
+            models.Index(fields=["route", "timestamp"]),
+            models.Index(fields=["status", "timestamp"]),
+        ]
+
 
 class News(models.Model):
     building = models.ForeignKey(
@@ -360,6 +422,7 @@ class Notification(models.Model):
     user = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name="notifications"
     )
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.title} - {self.user.username} ({self.timestamp})"
@@ -368,3 +431,272 @@ class Notification(models.Model):
         ordering = ["-timestamp"]
         verbose_name = "Bildiriş"
         verbose_name_plural = "Bildirişlər"
+        indexes = [
+            models.Index(
+                fields=["user", "timestamp"], name="notification_user_time_idx"
+            ),
+            models.Index(
+                fields=["user", "updated_at"], name="notification_user_updated_idx"
+            ),
+        ]
+
+
+class BillingRun(models.Model):
+    STATUS_CHOICES = [
+        ("RUNNING", "İcra olunur"),
+        ("DONE", "Tamamlandı"),
+    ]
+
+    service = models.ForeignKey(
+        Service, on_delete=models.CASCADE, related_name="billing_runs"
+    )
+    billing_date = models.DateField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="RUNNING")
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.service} {self.billing_date} ({self.status})"
+
+    class Meta:
+        ordering = ["-billing_date"]
+        verbose_name = "Hesablama"
+        verbose_name_plural = "Hesablamalar"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["service", "billing_date"], name="unique_billing_run"
+            )
+        ]
+
+
+class BillingItem(models.Model):
+    run = models.ForeignKey(BillingRun, on_delete=models.CASCADE, related_name="items")
+    flat = models.ForeignKey(
+        Flat, on_delete=models.CASCADE, related_name="billing_items"
+    )
+
+    def __str__(self):
+        return f"{self.run} - {self.flat_id}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["run", "flat"], name="unique_billing_item")
+        ]
+
+
+class BillingSchedule(models.Model):
+    branch = models.OneToOneField(
+        Branch,
+        on_delete=models.CASCADE,
+        related_name="billing_schedule",
+        verbose_name="Filial",
+    )
+    last_billed_date = models.DateField(verbose_name="Son hesablama tarixi")
+
+    def __str__(self):
+        return f"{self.branch}: {self.last_billed_date}"
+
+    class Meta:
+        verbose_name = "Hesablama cədvəli"
+        verbose_name_plural = "Hesablama cədvəli"
+
+
+class LedgerEntry(models.Model):
+    KIND_CHOICES = [
+        ("OPENING", "İlkin balans"),
+        ("PAYMENT", "Ödəniş"),
+        ("BILLING", "Hesablama"),
+        ("ALLOCATION", "Borca silindi"),
+    ]
+
+    flat = models.ForeignKey(
+        Flat, on_delete=models.CASCADE, related_name="ledger_entries"
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.flat_id} {self.kind} {self.amount}"
+
+    class Meta:
+        verbose_name = "Balans hərəkəti"
+        verbose_name_plural = "Balans hərəkətləri"
+        indexes = [models.Index(fields=["flat", "created_at"])]
+
+
+class BalanceSnapshot(models.Model):
+    flat = models.ForeignKey(
+        Flat, on_delete=models.CASCADE, related_name="balance_snapshots"
+    )
+    taken_at = models.DateTimeField()
+    balance = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def __str__(self):
+        return f"{self.flat_id} {self.taken_at}: {self.balance}"
+
+    class Meta:
+        verbose_name = "Balans qeydi"
+        verbose_name_plural = "Balans qeydləri"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["flat", "taken_at"], name="unique_balance_snapshot"
+            )
+        ]
+
+
+class ChargeAllocation(models.Model):
+    charge = models.ForeignKey(
+        Charge, on_delete=models.CASCADE, related_name="allocations"
+    )
+    payment = models.ForeignKey(
+        Payment,
+        on_delete=models.CASCADE,
+        related_name="allocations",
+        blank=True,
+        null=True,
+    )
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.charge_id} <- {self.amount}"
+
+    class Meta:
+        verbose_name = "Borc ödənişi"
+        verbose_name_plural = "Borc ödənişləri"
+
+
+class BuildingStats(models.Model):
+    building = models.OneToOneField(
+        Building, on_delete=models.CASCADE, primary_key=True, related_name="stats"
+    )
+    section_count = models.IntegerField(default=0)
+    flat_count = models.IntegerField(default=0)
+    resident_count = models.IntegerField(default=0)
+    debtor_count = models.IntegerField(default=0)
+    payment_count = models.IntegerField(default=0)
+    expense_month = models.DateField(blank=True, null=True)
+    expense_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.building_id} statistikası"
+
+    class Meta:
+        verbose_name = "Bina statistikası"
+        verbose_name_plural = "Bina statistikası"
+
+
+class BranchStats(models.Model):
+    branch = models.OneToOneField(
+        Branch, on_delete=models.CASCADE, primary_key=True, related_name="stats"
+    )
+    building_count = models.IntegerField(default=0)
+    section_count = models.IntegerField(default=0)
+    flat_count = models.IntegerField(default=0)
+    resident_count = models.IntegerField(default=0)
+    debtor_count = models.IntegerField(default=0)
+    payment_count = models.IntegerField(default=0)
+    expense_month = models.DateField(blank=True, null=True)
+    expense_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.branch_id} statistikası"
+
+    class Meta:
+        verbose_name = "Filial statistikası"
+        verbose_name_plural = "Filial statistikası"
+
+
+class MonthlyRollup(models.Model):
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name="rollups")
+    building = models.ForeignKey(
+        Building,
+        on_delete=models.CASCADE,
+        related_name="rollups",
+        blank=True,
+        null=True,
+    )
+    year = models.PositiveSmallIntegerField()
+    month = models.PositiveSmallIntegerField()
+    payment_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    payment_count = models.IntegerField(default=0)
+    expense_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.month:02d}/{self.year}"
+
+    class Meta:
+        verbose_name = "Aylıq yekun"
+        verbose_name_plural = "Aylıq yekunlar"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["branch", "building", "year", "month"],
+                name="unique_monthly_rollup",
+            ),
+            # NULLs are distinct in the constraint above, so branch-only rows
+            # (building=None) need one of their own.
+            models.UniqueConstraint(
+                fields=["branch", "year", "month"],
+                condition=models.Q(building__isnull=True),
+                name="unique_branch_monthly_rollup",
+            ),
+        ]
+
+
+class RouteLatency(models.Model):
+    bucket = models.DateTimeField()
+    route = models.CharField(max_length=100)
+    method = models.CharField(max_length=10)
+    count = models.IntegerField(default=0)
+    error_count = models.IntegerField(default=0)
+    total_ms = models.BigIntegerField(default=0)
+    max_ms = models.IntegerField(default=0)
+    histogram = models.JSONField(default=list)
+
+    def __str__(self):
+        return f"{self.method} {self.route} {self.bucket}"
+
+    class Meta:
+        verbose_name = "Marşrut gecikməsi"
+        verbose_name_plural = "Marşrut gecikmələri"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["bucket", "route", "method"], name="unique_route_latency"
+            )
+        ]
+        indexes = [models.Index(fields=["route", "bucket"])]
+
+
+class Tombstone(models.Model):
+    """
+    A deleted charge, payment or notification, kept for the sync API so that
+    clients can drop their copy. flat_id and user_id are plain numbers, not
+    foreign keys: the flat or user is often deleted in the same cascade.
+    """
+
+    MODEL_CHOICES = [
+        ("charge", "Borc"),
+        ("payment", "Ödəniş"),
+        ("notification", "Bildiriş"),
+    ]
+
+    model_name = models.CharField(max_length=20, choices=MODEL_CHOICES)
+    object_id = models.BigIntegerField()
+    flat_id = models.BigIntegerField(blank=True, null=True)
+    user_id = models.BigIntegerField(blank=True, null=True)
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.model_name} #{self.object_id} ({self.deleted_at})"
+
+    class Meta:
+        verbose_name = "Silinmiş qeyd"
+        verbose_name_plural = "Silinmiş qeydlər"
+        indexes = [
+            models.Index(fields=["flat_id", "deleted_at"]),
+            models.Index(fields=["user_id", "deleted_at"]),
+            models.Index(fields=["deleted_at"]),
+        ]
@@ -0,0 +1,162 @@
+import base64
+import json
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import Http404
+
+
+class KeysetPage:
+    """
+    One page of a keyset-paginated queryset. Offers the parts of Django's
+    Page the templates use, but has no paginator and so no page count.
+    """
+
+    paginator = None
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def _json_value(value):
+    # Full isoformat: DjangoJSONEncoder would cut datetimes to milliseconds
+    # and the cursor would no longer match its own row.
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_cursor(direction, values):
+    payload = json.dumps([direction, values], default=_json_value)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """(direction, values) of a cursor; ValueError when it is malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        direction, values = json.loads(base64.urlsafe_b64decode(padded))
+    except (TypeError, ValueError) as error:
+        raise ValueError("Invalid cursor") from error
+    if direction not in ("next", "previous") or not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return direction, values
+
+
+def _flip(field):
+    return field[1:] if field.startswith("-") else f"-{field}"
+
+
+def keyset_filter(ordering, values, reverse=False):
+    """
+    Rows after `values` in `ordering` (before them with reverse=True), as
+    (a > x) OR (a = x AND b > y) ... with the comparison following each
+    field's direction.
+    """
+    condition = Q()
+    for index, field in enumerate(ordering):
+        descending = field.startswith("-") != reverse
+        lookup = "lt" if descending else "gt"
+        term = Q(**{f"{field.lstrip('-')}__{lookup}": values[index]})
+        for prior, value in zip(ordering[:index], values):
+            term &= Q(**{prior.lstrip("-"): value})
+        condition |= term
+    return condition
+
+
+def paginate_keyset(queryset, ordering, page_size, cursor=None):
+    """
+    The page of `queryset` that `cursor` points at (the first page without
+    one). `ordering` must end in a unique field, e.g. ("-date", "-id").
+    Reads page_size + 1 rows and never counts.
+    """
+    direction, values = decode_cursor(cursor) if cursor else ("next", None)
+    if values is not None and len(values) != len(ordering):
+        raise ValueError("Invalid cursor")
+    reverse = direction == "previous"
+
+    queryset = queryset.order_by(*(map(_flip, ordering) if reverse else ordering))
+    if values is not None:
+        queryset = queryset.filter(keyset_filter(ordering, values, reverse))
+    rows = list(queryset[: page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if reverse:
+        rows.reverse()
+
+    has_next = True if reverse else has_more
+    has_previous = has_more if reverse else values is not None
+    if not rows:
+        return KeysetPage(rows, None, None)
+
+    def key(row):
+        return [getattr(row, field.lstrip("-")) for field in ordering]
+
+    return KeysetPage(
+        rows,
+        encode_cursor("next", key(rows[-1])) if has_next else None,
+        encode_cursor("previous", key(rows[0])) if has_previous else None,
+    )
+
+
+class KeysetPaginationMixin:
+    """
+    Cursor pagination for a ListView, keyed on `keyset_ordering`. It is used
+    when the request has a "cursor" parameter (empty for the first page), or
+    by default when `keyset_by_default` is set unless a "page" is asked for;
+    otherwise the view paginates with OFFSET and COUNT as before.
+    """
+
+    keyset_ordering = ("-id",)
+    keyset_by_default = False
+
+    def use_keyset(self):
+        if "cursor" in self.request.GET:
+            return True
+        return self.keyset_by_default and "page" not in self.request.GET
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.use_keyset():
+            return super().paginate_queryset(queryset, page_size)
+        try:
+            page = paginate_keyset(
+                queryset,
+                self.keyset_ordering,
+                page_size,
+                self.request.GET.get("cursor"),
+            )
+        except (ValueError, ValidationError):
+            raise Http404("Səhifə tapılmadı")
+        return None, page, page.object_list, page.has_other_pages()
+
+    def cursor_url(self, cursor):
+        params = self.request.GET.copy()
+        params.pop("page", None)
+        params["cursor"] = cursor
+        return f"?{params.urlencode()}"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        page = context.get("page_obj")
+        if isinstance(page, KeysetPage):
+            if page.has_next():
+                context["cursor_next_url"] = self.cursor_url(page.next_cursor)
+            if page.has_previous():
+                context["cursor_previous_url"] = self.cursor_url(page.previous_cursor)
+        return context
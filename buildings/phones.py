@@ -0,0 +1,53 @@
+import re
+from django.db.models import Q
+
+COUNTRY_CODE = "994"
+# Digits of a full number after the country code, e.g. 50 123 45 67.
+NATIONAL_LENGTH = 9
+NON_DIGITS = re.compile(r"\D")
+
+
+def normalize_phone(value):
+    """
+    The canonical digits-only form of a phone number: "+994 50 123-45-67",
+    "00994501234567", "050 123 45 67" and "501234567" all give
+    "994501234567". Anything else is kept as its digits; empty gives "".
+    """
+    digits = NON_DIGITS.sub("", value or "")
+    if digits.startswith("00"):
+        digits = digits[2:]
+    if len(digits) == NATIONAL_LENGTH + 1 and digits.startswith("0"):
+        digits = digits[1:]
+    if len(digits) == NATIONAL_LENGTH:
+        digits = COUNTRY_CODE + digits
+    return digits
+
+
+def phone_fields(value):
+    """The indexed search columns of User for the phone number `value`."""
+    digits = normalize_phone(value)
+    return {"phone_digits": digits, "phone_digits_reversed": digits[::-1]}
+
+
+def phone_query(value, prefix=""):
+    """
+    Q matching users whose phone number fits what was typed in a search box:
+    the full number in any notation exactly, otherwise numbers starting with
+    the digits (local "050..." or international "99450...") or ending with
+    them, as commandants often type only the last few digits. Each branch is
+    a prefix match on an indexed column. None when `value` has no digits.
+    `prefix` reaches the user through a relation, e.g. "resident__".
+    """
+    digits = NON_DIGITS.sub("", value or "")
+    if not digits:
+        return None
+    number = normalize_phone(digits)
+    if len(number) == len(COUNTRY_CODE) + NATIONAL_LENGTH:
+        return Q(**{f"{prefix}phone_digits": number})
+
+    start = digits[2:] if digits.startswith("00") else digits
+    if start.startswith("0"):
+        start = COUNTRY_CODE + start[1:]
+    return Q(**{f"{prefix}phone_digits__startswith": start}) | Q(
+        **{f"{prefix}phone_digits_reversed__startswith": digits[::-1]}
+    )
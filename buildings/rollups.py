@@ -0,0 +1,199 @@
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce, ExtractMonth, ExtractYear
+from django.utils import timezone
+from .models import Building, Payment, Expense, MonthlyRollup
+from .scope import get_scope
+
+MAX_CHART_MONTHS = 120
+
+
+def add_to_rollup(branch_id, building_id, day, **totals):
+    """
+    Add `totals` (payment_total, payment_count, expense_total) to the month
+    of `day`, creating the row on first use. building_id is None for
+    expenses booked on the branch only.
+    """
+    totals = {field: value for field, value in totals.items() if value}
+    if not totals:
+        return
+    key = {
+        "branch_id": branch_id,
+        "building_id": building_id,
+        "year": day.year,
+        "month": day.month,
+    }
+    updated = MonthlyRollup.objects.filter(**key).update(
+        **{field: F(field) + value for field, value in totals.items()}
+    )
+    # Subtractions never create a row: a missing row means a cascade already
+    # deleted it together with the payment or expense being taken back.
+    if not updated and all(value > 0 for value in totals.values()):
+        _, created = MonthlyRollup.objects.get_or_create(**key, defaults=totals)
+        if not created:
+            MonthlyRollup.objects.filter(**key).update(
+                **{field: F(field) + value for field, value in totals.items()}
+            )
+
+
+def add_payment(payment, sign=1):
+    branch_id = (
+        Building.objects.filter(id=payment.building_id)
+        .values_list("branch_id", flat=True)
+        .first()
+    )
+    if branch_id is None:
+        return
+    add_to_rollup(
+        branch_id,
+        payment.building_id,
+        payment.date,
+        payment_total=sign * payment.amount,
+        payment_count=sign,
+    )
+
+
+def add_payments(branch_id, payments):
+    """Add Payment objects of one branch with one UPDATE per building and month."""
+    totals = defaultdict(lambda: [Decimal(0), 0])
+    for payment in payments:
+        total = totals[(payment.building_id, payment.date.year, payment.date.month)]
+        total[0] += payment.amount
+        total[1] += 1
+    for (building_id, year, month), (amount, count) in totals.items():
+        add_to_rollup(
+            branch_id,
+            building_id,
+            date(year, month, 1),
+            payment_total=amount,
+            payment_count=count,
+        )
+
+
+def add_expense(expense, sign=1):
+    branch_id = expense.branch_id
+    if branch_id is None and expense.building_id:
+        branch_id = (
+            Building.objects.filter(id=expense.building_id)
+            .values_list("branch_id", flat=True)
+            .first()
+        )
+    if branch_id is None:
+        return
+    add_to_rollup(
+        branch_id,
+        expense.building_id,
+        expense.outcome_date,
+        expense_total=sign * expense.price,
+    )
+
+
+def rebuild_rollups():
+    """Recompute every rollup row from the Payment and Expense tables."""
+    rows = defaultdict(dict)
+    payments = (
+        Payment.objects.values(
+            "building__branch_id",
+            "building_id",
+            year=ExtractYear("date"),
+            month=ExtractMonth("date"),
+        )
+        .annotate(payment_total=Sum("amount"), payment_count=Count("id"))
+        .order_by()
+    )
+    for row in payments:
+        key = (
+            row["building__branch_id"],
+            row["building_id"],
+            row["year"],
+            row["month"],
+        )
+        rows[key].update(
+            payment_total=row["payment_total"], payment_count=row["payment_count"]
+        )
+    expenses = Expense.objects.exclude(building__isnull=True, branch__isnull=True)
+    expenses = (
+        expenses.values(
+            "building_id",
+            rollup_branch=Coalesce("branch_id", "building__branch_id"),
+            year=ExtractYear("outcome_date"),
+            month=ExtractMonth("outcome_date"),
+        )
+        .annotate(expense_total=Sum("price"))
+        .order_by()
+    )
+    for row in expenses:
+        key = (row["rollup_branch"], row["building_id"], row["year"], row["month"])
+        rows[key]["expense_total"] = row["expense_total"]
+
+    MonthlyRollup.objects.all().delete()
+    MonthlyRollup.objects.bulk_create(
+        (
+            MonthlyRollup(
+                branch_id=branch_id,
+                building_id=building_id,
+                year=year,
+                month=month,
+                **totals,
+            )
+            for (branch_id, building_id, year, month), totals in rows.items()
+        ),
+        batch_size=1000,
+    )
+    return len(rows)
+
+
+def rollups_for(user):
+    """The rollup rows `user` may see: own branches or assigned buildings."""
+    scope = get_scope(user)
+    if user.is_superuser:
+        return MonthlyRollup.objects.filter(branch_id__in=scope.branch_ids)
+    if user.commandant:
+        return MonthlyRollup.objects.filter(building_id__in=scope.building_ids)
+    return MonthlyRollup.objects.none()
+
+
+def parse_month(value, default):
+    """A "YYYY-MM" query parameter as the first day of that month."""
+    try:
+        year, month = map(int, value.split("-"))
+        return date(year, month, 1)
+    except (AttributeError, ValueError):
+        return default
+
+
+def chart_range(params):
+    """
+    The (start, end) months of a chart from the "start" and "end" query
+    parameters, defaulting to the twelve months up to the current one.
+    """
+    end = parse_month(params.get("end"), timezone.localdate().replace(day=1))
+    first = end.year * 12 + end.month - 12
+    start = parse_month(params.get("start"), date(first // 12, first % 12 + 1, 1))
+    if start > end:
+        start, end = end, start
+    return start, end
+
+
+def month_series(rollups, field, start, end):
+    """
+    [(label, total)] of `field` for every month from `start` to `end`
+    inclusive, summed over `rollups`; months without rows are 0.
+    """
+    first = start.year * 12 + start.month - 1
+    last = min(end.year * 12 + end.month - 1, first + MAX_CHART_MONTHS - 1)
+    totals = dict(
+        rollups.filter(year__gte=first // 12, year__lte=last // 12)
+        .annotate(period=F("year") * 12 + F("month") - 1)
+        .filter(period__gte=first, period__lte=last)
+        .values("period")
+        .annotate(total=Sum(field))
+        .order_by()
+        .values_list("period", "total")
+    )
+    return [
+        (f"{period % 12 + 1:02d}/{period // 12}", float(totals.get(period, 0)))
+        for period in range(first, last + 1)
+    ]
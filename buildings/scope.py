@@ -0,0 +1,88 @@
+import time
+from django.conf import settings
+from django.core.cache import cache
+from .models import Branch, Building, Flat
+
+ACCESS_SCOPE_TIMEOUT = getattr(settings, "ACCESS_SCOPE_TIMEOUT", 300)
+SCOPE_VERSION_KEY = "access-scope:version"
+
+
+class AccessScope:
+    """
+    The branches and buildings a user may work with: a superuser's own
+    branches and all their buildings, or a commandant's assigned buildings
+    and the branches they belong to. Everyone else gets an empty scope.
+    """
+
+    def __init__(self, branch_ids=(), building_ids=()):
+        self.branch_ids = frozenset(branch_ids)
+        self.building_ids = frozenset(building_ids)
+
+    def __bool__(self):
+        return bool(self.branch_ids or self.building_ids)
+
+    def branches(self):
+        return Branch.objects.filter(id__in=self.branch_ids)
+
+    def buildings(self):
+        return Building.objects.filter(id__in=self.building_ids)
+
+
+def scope_flats(scope, **filters):
+    """
+    The flats of the scope's buildings matching `filters`, meant to be used
+    as an IN (`.values("id")`) or EXISTS subquery. Filtering other tables
+    through it instead of joining keeps their rows unique without DISTINCT.
+    """
+    return Flat.objects.filter(building_id__in=scope.building_ids, **filters)
+
+
+def compute_scope(user):
+    """(branch ids, building ids) of `user`, read from the database in one query."""
+    if user.is_superuser:
+        rows = list(
+            Branch.objects.filter(owner=user).values_list("id", "buildings__id")
+        )
+        branch_ids = {branch_id for branch_id, _ in rows}
+        return branch_ids, {building_id for _, building_id in rows if building_id}
+    if user.commandant:
+        rows = list(
+            Building.objects.filter(commandant=user).values_list("branch_id", "id")
+        )
+        return {branch_id for branch_id, _ in rows}, {
+            building_id for _, building_id in rows
+        }
+    return set(), set()
+
+
+def scope_version():
+    return cache.get_or_set(SCOPE_VERSION_KEY, time.time_ns, None)
+
+
+def invalidate_scopes():
+    """Drop every cached scope, e.g. after a branch or assignment changed."""
+    # A fresh value rather than incr(): if the version key was evicted, a
+    # restarted counter could match scopes cached under an old version.
+    cache.set(SCOPE_VERSION_KEY, time.time_ns(), None)
+
+
+def get_scope(user):
+    """
+    The AccessScope of `user`. It is kept on the user object for the rest
+    of the request and in the cache for ACCESS_SCOPE_TIMEOUT seconds; any
+    change to branches, buildings or commandant assignments invalidates it.
+    """
+    if not user.is_authenticated:
+        return AccessScope()
+    scope = getattr(user, "_access_scope", None)
+    if scope is None:
+        key = (
+            f"access-scope:{scope_version()}:{user.pk}"
+            f":{int(user.is_superuser)}{int(bool(user.commandant))}"
+        )
+        ids = cache.get(key)
+        if ids is None:
+            ids = compute_scope(user)
+            cache.set(key, ids, ACCESS_SCOPE_TIMEOUT)
+        scope = user._access_scope = AccessScope(*ids)
+    return scope
@@ -0,0 +1,238 @@
+from functools import partial
+from django.db.models import F, QuerySet
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+from .models import (
+    User,
+    Branch,
+    Building,
+    Section,
+    Flat,
+    Charge,
+    Payment,
+    Notification,
+    Expense,
+    BuildingStats,
+    BranchStats,
+)
+from .rollups import add_expense, add_payment
+from .scope import invalidate_scopes
+from .hierarchy import TREE_FIELDS, invalidate_tree
+from .sync import record_deletion
+from .stats import (
+    bump_expense,
+    bump_stats,
+    current_month,
+    reconcile_branch_stats,
+    reconcile_stats,
+    refresh_residents,
+)
+
+# Keep the BuildingStats/BranchStats counters in step with single-row writes.
+# Bulk writes send no signals; billing and the ledger update the counters
+# themselves and the nightly reconcile_stats task corrects whatever drifts.
+# Delete handlers never recreate a missing row: during a cascade the stats row
+# may already be gone while its building or branch still exists.
+
+
+@receiver(post_save, sender=Branch)
+def create_branch_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        BranchStats.objects.get_or_create(
+            branch=instance, defaults={"expense_month": current_month()}
+        )
+
+
+@receiver(post_save, sender=Building)
+def create_building_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        BuildingStats.objects.get_or_create(
+            building=instance, defaults={"expense_month": current_month()}
+        )
+        BranchStats.objects.filter(branch_id=instance.branch_id).update(
+            building_count=F("building_count") + 1
+        )
+
+
+@receiver(post_delete, sender=Building)
+def building_deleted(sender, instance, **kwargs):
+    # The cascade may drop the stats row before the flats, payments etc., so
+    # their decrements can miss the branch; recount it from what is left.
+    reconcile_branch_stats(
+        Branch.objects.filter(id=instance.branch_id, stats__isnull=False)
+    )
+
+
+@receiver(post_save, sender=Section)
+def section_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and not bump_stats(instance.building_id, section_count=1):
+        reconcile_stats([instance.building_id])
+
+
+@receiver(post_delete, sender=Section)
+def section_deleted(sender, instance, **kwargs):
+    bump_stats(instance.building_id, section_count=-1)
+
+
+@receiver(post_save, sender=Flat)
+def flat_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created and not bump_stats(instance.building_id, flat_count=1):
+        reconcile_stats([instance.building_id])
+        return
+    refresh_residents([instance.building_id])
+
+
+@receiver(post_delete, sender=Flat)
+def flat_deleted(sender, instance, **kwargs):
+    bump_stats(instance.building_id, flat_count=-1)
+    refresh_residents([instance.building_id])
+
+
+@receiver(pre_save, sender=Payment)
+@receiver(pre_save, sender=Expense)
+def remember_rollup_values(sender, instance, raw=False, **kwargs):
+    # An edit moves the old amount out of its month before the new one is
+    # added, so keep a copy of the row as it is stored now.
+    if instance.pk and not raw:
+        instance._stored = sender.objects.filter(pk=instance.pk).first()
+
+
+@receiver(post_save, sender=Payment)
+def payment_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created and not bump_stats(instance.building_id, payment_count=1):
+        reconcile_stats([instance.building_id])
+    stored = getattr(instance, "_stored", None)
+    if stored:
+        add_payment(stored, sign=-1)
+    add_payment(instance)
+
+
+@receiver(post_delete, sender=Payment)
+def payment_deleted(sender, instance, **kwargs):
+    bump_stats(instance.building_id, payment_count=-1)
+    add_payment(instance, sign=-1)
+
+
+@receiver(post_save, sender=Expense)
+def expense_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        bump_expense(instance)
+    stored = getattr(instance, "_stored", None)
+    if stored:
+        add_expense(stored, sign=-1)
+    add_expense(instance)
+
+
+@receiver(post_delete, sender=Expense)
+def expense_deleted(sender, instance, **kwargs):
+    bump_expense(instance, sign=-1)
+    add_expense(instance, sign=-1)
+
+
+# Cached access scopes are dropped whenever branches, buildings or commandant
+# assignments change, and again on commit so that a request racing the
+# transaction cannot keep the old scope cached. New users are included
+# because a new account may get the id of a deleted one.
+
+
+def scopes_changed():
+    invalidate_scopes()
+    transaction.on_commit(invalidate_scopes)
+
+
+@receiver(post_save, sender=Branch)
+@receiver(post_delete, sender=Branch)
+@receiver(post_save, sender=Building)
+@receiver(post_delete, sender=Building)
+def invalidate_scopes_on_change(sender, raw=False, **kwargs):
+    if not raw:
+        scopes_changed()
+
+
+@receiver(post_save, sender=User)
+def invalidate_scopes_on_new_user(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        scopes_changed()
+
+
+@receiver(m2m_changed, sender=Building.commandant.through)
+def invalidate_scopes_on_assignment(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        scopes_changed()
+
+
+# The cached section/flat tree of a building gets a new version whenever one
+# of its sections or flats is saved or deleted, again on commit as for the
+# scopes. A section or flat moved to another building changes both trees.
+# Bulk writes send no signals; their trees expire after BUILDING_TREE_TIMEOUT.
+
+
+def tree_changed(*building_ids):
+    for building_id in set(building_ids):
+        invalidate_tree(building_id)
+        transaction.on_commit(partial(invalidate_tree, building_id))
+
+
+def changes_tree(update_fields):
+    return update_fields is None or not TREE_FIELDS.isdisjoint(update_fields)
+
+
+@receiver(pre_save, sender=Section)
+@receiver(pre_save, sender=Flat)
+def remember_tree_building(sender, instance, raw=False, update_fields=None, **kwargs):
+    if instance.pk and not raw and changes_tree(update_fields):
+        instance._stored_building_id = (
+            sender.objects.filter(pk=instance.pk)
+            .values_list("building_id", flat=True)
+            .first()
+        )
+
+
+@receiver(post_save, sender=Section)
+@receiver(post_save, sender=Flat)
+def invalidate_tree_on_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not raw and changes_tree(update_fields):
+        stored = getattr(instance, "_stored_building_id", None)
+        if stored and stored != instance.building_id:
+            tree_changed(instance.building_id, stored)
+        else:
+            tree_changed(instance.building_id)
+
+
+@receiver(post_delete, sender=Section)
+@receiver(post_delete, sender=Flat)
+def invalidate_tree_on_delete(sender, instance, **kwargs):
+    tree_changed(instance.building_id)
+
+
+# Deleted rows leave a tombstone for the sync API, found through the flat
+# (charges, payments) or the user (notifications) they belonged to. Rows
+# deleted along with their flat, or anything above it, or their user need
+# none: the app drops a vanished flat's rows itself, and a deleted user has
+# no app to sync. This also keeps those cascades free of one INSERT per row.
+TOMBSTONE_FREE_ORIGINS = (User, Branch, Building, Section, Flat)
+
+
+def needs_tombstone(origin):
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return not issubclass(model, TOMBSTONE_FREE_ORIGINS)
+
+
+@receiver(post_delete, sender=Charge)
+@receiver(post_delete, sender=Payment)
+def record_flat_row_deletion(sender, instance, origin=None, **kwargs):
+    if needs_tombstone(origin):
+        record_deletion(instance, flat_id=instance.flat_id)
+
+
+@receiver(post_delete, sender=Notification)
+def record_notification_deletion(sender, instance, origin=None, **kwargs):
+    if needs_tombstone(origin):
+        record_deletion(instance, user_id=instance.user_id)
@@ -0,0 +1,313 @@
+from datetime import date
+from django.db.models import (
+    DecimalField,
+    F,
+    IntegerField,
+    OuterRef,
+    Q,
+    Subquery,
+    Sum,
+    Count,
+    Value,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import (
+    Branch,
+    Building,
+    Section,
+    Flat,
+    Payment,
+    Expense,
+    BuildingStats,
+    BranchStats,
+)
+from .scope import get_scope
+
+STATS_CHUNK_SIZE = 500
+COUNTER_FIELDS = (
+    "section_count",
+    "flat_count",
+    "resident_count",
+    "debtor_count",
+    "payment_count",
+)
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+
+def _scalar(queryset, aggregate, output_field):
+    """A scalar subquery computing `aggregate` over `queryset`, 0 when empty."""
+    return Coalesce(
+        Subquery(
+            queryset.order_by()
+            .annotate(_group=Value(1))
+            .values("_group")
+            .annotate(result=aggregate)
+            .values("result"),
+            output_field=output_field,
+        ),
+        Value(0),
+        output_field=output_field,
+    )
+
+
+def _count(queryset):
+    return _scalar(queryset, Count("pk"), IntegerField())
+
+
+def current_month():
+    return timezone.localdate().replace(day=1)
+
+
+def _month_expenses(month):
+    next_month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+    return Expense.objects.filter(outcome_date__gte=month, outcome_date__lt=next_month)
+
+
+def _residents(flats):
+    return _scalar(
+        flats.filter(resident__isnull=False),
+        Count("resident", distinct=True),
+        IntegerField(),
+    )
+
+
+def bump_stats(building_id, **deltas):
+    """
+    Add `deltas` ({counter: change}) to the row of a building and of its
+    branch with F() updates. Returns False when the building has no row yet.
+    """
+    updates = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if not updates:
+        return True
+    if not BuildingStats.objects.filter(building_id=building_id).update(**updates):
+        return False
+    BranchStats.objects.filter(branch__buildings=building_id).update(**updates)
+    return True
+
+
+def bump_expense(expense, sign=1):
+    """Add (or with sign=-1 take back) `expense` to this month's expense totals."""
+    month = current_month()
+    if expense.outcome_date.replace(day=1) != month:
+        return
+    if expense.branch_id:
+        branch = Q(branch_id=expense.branch_id)
+    elif expense.building_id:
+        branch = Q(branch__buildings=expense.building_id)
+    else:
+        return
+    total = F("expense_total") + sign * expense.price
+    if expense.building_id:
+        BuildingStats.objects.filter(
+            building_id=expense.building_id, expense_month=month
+        ).update(expense_total=total)
+    BranchStats.objects.filter(branch, expense_month=month).update(expense_total=total)
+
+
+def refresh_residents(building_ids):
+    """
+    Recount the residents and debtors of `building_ids` (ids or a values
+    queryset) and, where they changed, of their branches. Balances move
+    through F() and bulk updates that send no signals, so the write paths
+    call this.
+    """
+    flats = Flat.objects.filter(building=OuterRef("pk"))
+    rows = (
+        Building.objects.filter(id__in=building_ids, stats__isnull=False)
+        .annotate(
+            residents=_residents(flats),
+            debtors=_residents(flats.filter(balance__lt=0)),
+        )
+        .values_list(
+            "id",
+            "branch_id",
+            "residents",
+            "debtors",
+            "stats__resident_count",
+            "stats__debtor_count",
+        )
+    )
+    branch_ids = set()
+    for building_id, branch_id, residents, debtors, *old in rows:
+        if [residents, debtors] != old:
+            BuildingStats.objects.filter(building_id=building_id).update(
+                resident_count=residents, debtor_count=debtors
+            )
+            branch_ids.add(branch_id)
+    if branch_ids:
+        BranchStats.objects.filter(branch_id__in=branch_ids).update(
+            **_branch_residents("branch")
+        )
+
+
+def _branch_residents(branch):
+    """
+    resident_count and debtor_count of the branch `branch` refers to, counted
+    across all its flats: a resident with flats in two buildings is one.
+    """
+    flats = Flat.objects.filter(building__branch=OuterRef(branch))
+    return {
+        "resident_count": _residents(flats),
+        "debtor_count": _residents(flats.filter(balance__lt=0)),
+    }
+
+
+def reconcile_stats(building_ids=None):
+    """
+    Recompute the rows of `building_ids` (every building by default) and of
+    their branches from the source tables, correcting any drift of the
+    incremental updates. Returns the number of buildings written.
+    """
+    month = current_month()
+    buildings = Building.objects.all()
+    branches = Branch.objects.all()
+    if building_ids is not None:
+        buildings = buildings.filter(id__in=building_ids)
+        branches = branches.filter(id__in=buildings.values("branch_id"))
+
+    flats = Flat.objects.filter(building=OuterRef("pk"))
+    rows = (
+        buildings.annotate(
+            section_count_total=_count(Section.objects.filter(building=OuterRef("pk"))),
+            flat_count_total=_count(flats),
+            resident_count_total=_residents(flats),
+            debtor_count_total=_residents(flats.filter(balance__lt=0)),
+            payment_count_total=_count(Payment.objects.filter(building=OuterRef("pk"))),
+            expense_total_month=_scalar(
+                _month_expenses(month).filter(building=OuterRef("pk")),
+                Sum("price"),
+                MONEY,
+            ),
+        )
+        .order_by("id")
+        .values_list(
+            "id",
+            *(f"{field}_total" for field in COUNTER_FIELDS),
+            "expense_total_month",
+        )
+    )
+    written = 0
+    batch = []
+    for building_id, *counters, expenses in rows.iterator(chunk_size=STATS_CHUNK_SIZE):
+        batch.append(
+            BuildingStats(
+                building_id=building_id,
+                expense_month=month,
+                expense_total=expenses,
+                **dict(zip(COUNTER_FIELDS, counters)),
+            )
+        )
+        if len(batch) == STATS_CHUNK_SIZE:
+            written += _upsert(BuildingStats, "building", batch)
+            batch = []
+    written += _upsert(BuildingStats, "building", batch)
+
+    reconcile_branch_stats(branches)
+    return written
+
+
+def reconcile_branch_stats(branches):
+    """
+    Rewrite the rows of `branches` (a Branch queryset) as the sum of their
+    building rows, with residents and debtors counted once per branch, plus
+    this month's branch expenses.
+    """
+    month = current_month()
+    building_stats = BuildingStats.objects.filter(building__branch=OuterRef("pk"))
+    branch_expenses = _month_expenses(month).filter(
+        Q(branch=OuterRef("pk"))
+        | Q(branch__isnull=True, building__branch=OuterRef("pk"))
+    )
+    counters = {
+        field: _scalar(building_stats, Sum(field), IntegerField())
+        for field in COUNTER_FIELDS
+    }
+    counters.update(_branch_residents("pk"))
+    rows = branches.annotate(
+        buildings_total=_count(Building.objects.filter(branch=OuterRef("pk"))),
+        expense_total_month=_scalar(branch_expenses, Sum("price"), MONEY),
+        **{f"{field}_total": counter for field, counter in counters.items()},
+    ).values_list(
+        "id",
+        "buildings_total",
+        "expense_total_month",
+        *(f"{field}_total" for field in COUNTER_FIELDS),
+    )
+    _upsert(
+        BranchStats,
+        "branch",
+        [
+            BranchStats(
+                branch_id=branch_id,
+                building_count=building_count,
+                expense_month=month,
+                expense_total=expenses,
+                **dict(zip(COUNTER_FIELDS, counters)),
+            )
+            for branch_id, building_count, expenses, *counters in rows
+        ],
+    )
+
+
+def _upsert(model, key, rows):
+    fields = [
+        field.name for field in model._meta.concrete_fields if not field.primary_key
+    ]
+    model.objects.bulk_create(
+        rows, update_conflicts=True, unique_fields=[key], update_fields=fields
+    )
+    return len(rows)
+
+
+def with_building_stats(buildings):
+    """Annotate `buildings` with their counters, read from the stats rows."""
+    return buildings.annotate(
+        flat_count=Coalesce(F("stats__flat_count"), 0),
+        section_count=Coalesce(F("stats__section_count"), 0),
+        users_count=Coalesce(F("stats__resident_count"), 0),
+    )
+
+
+def dashboard_stats(user):
+    """
+    Every dashboard number for `user` in a single SELECT over the stats rows.
+
+    A superuser sees the branches they own, a commandant the buildings they
+    are assigned to; anyone else gets zeros without a query.
+    """
+    counters = {
+        "section_count": Coalesce(Sum("section_count"), 0),
+        "flat_count": Coalesce(Sum("flat_count"), 0),
+        "resident_count": Coalesce(Sum("resident_count"), 0),
+        "payment_count": Coalesce(Sum("payment_count"), 0),
+        "delayed_resident": Coalesce(Sum("debtor_count"), 0),
+        "total_expenses": Coalesce(
+            Sum("expense_total", filter=Q(expense_month=current_month())),
+            Value(0),
+            output_field=MONEY,
+        ),
+    }
+    if user.is_superuser:
+        return BranchStats.objects.filter(
+            branch_id__in=get_scope(user).branch_ids
+        ).aggregate(
+            branch_count=Count("pk"),
+            building_count=Coalesce(Sum("building_count"), 0),
+            **counters,
+        )
+    if user.commandant:
+        stats = BuildingStats.objects.filter(
+            building_id__in=get_scope(user).building_ids
+        ).aggregate(building_count=Count("pk"), **counters)
+        return {"branch_count": 0, **stats}
+    return {
+        "branch_count": 0,
+        "building_count": 0,
+        "section_count": 0,
+        "flat_count": 0,
+        "resident_count": 0,
+        "payment_count": 0,
+        "delayed_resident": 0,
+        "total_expenses": 0,
+    }
@@ -0,0 +1,70 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from .models import Charge, Flat, Notification, Payment, Tombstone
+
+# Tombstones are kept this long; older sync tokens get a full reset.
+SYNC_TOMBSTONE_DAYS = getattr(settings, "SYNC_TOMBSTONE_DAYS", 90)
+# Rows are re-sent for this long after a sync: a transaction that started
+# before it may commit rows stamped earlier than its token.
+SYNC_OVERLAP = timedelta(seconds=getattr(settings, "SYNC_OVERLAP_SECONDS", 300))
+
+
+def record_deletion(instance, flat_id=None, user_id=None):
+    """Keep a Tombstone of a deleted charge, payment or notification."""
+    Tombstone.objects.create(
+        model_name=instance._meta.model_name,
+        object_id=instance.pk,
+        flat_id=flat_id,
+        user_id=user_id,
+    )
+
+
+def purge_tombstones(days=SYNC_TOMBSTONE_DAYS, now=None):
+    """Delete tombstones older than `days`; returns how many went."""
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+    count, _ = Tombstone.objects.filter(deleted_at__lt=cutoff).delete()
+    return count
+
+
+def changes_since(user, since=None, known_flats=(), now=None):
+    """
+    What changed for resident `user` since the moment `since`, for a client
+    that then had the flats `known_flats`: querysets of the flats, charges,
+    payments and notifications saved since, and the ids deleted or no longer
+    visible, per model. Flats the client did not know yet come with their
+    whole history. `since=None`, or a moment older than the tombstones,
+    means a full download; `reset` then tells the client to drop its copy.
+    """
+    now = now or timezone.now()
+    reset = since is None or since < now - timedelta(days=SYNC_TOMBSTONE_DAYS)
+    flats = Flat.objects.filter(resident=user)
+    flat_ids = set(flats.values_list("id", flat=True))
+    charges = Charge.objects.filter(flat_id__in=flat_ids)
+    payments = Payment.objects.filter(flat_id__in=flat_ids)
+    notifications = Notification.objects.filter(user=user)
+    deleted = {"flats": [], "charges": [], "payments": [], "notifications": []}
+    if not reset:
+        cutoff = since - SYNC_OVERLAP
+        new_flats = flat_ids - set(known_flats)
+        changed = Q(updated_at__gte=cutoff) | Q(flat_id__in=new_flats)
+        flats = flats.filter(Q(updated_at__gte=cutoff) | Q(id__in=new_flats))
+        charges = charges.filter(changed)
+        payments = payments.filter(changed)
+        notifications = notifications.filter(updated_at__gte=cutoff)
+        deleted["flats"] = sorted(set(known_flats) - flat_ids)
+        tombstones = Tombstone.objects.filter(
+            Q(flat_id__in=flat_ids) | Q(user_id=user.pk), deleted_at__gte=cutoff
+        ).values_list("model_name", "object_id")
+        for model_name, object_id in tombstones:
+            deleted[f"{model_name}s"].append(object_id)
+    return {
+        "reset": reset,
+        "flats": flats.order_by("id"),
+        "charges": charges.order_by("id"),
+        "payments": payments.order_by("id"),
+        "notifications": notifications.order_by("id"),
+        "deleted": deleted,
+        "flat_ids": sorted(flat_ids),
+    }
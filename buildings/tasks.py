@@ -1,45 +1,108 @@
-from celery import shared_task
+from datetime import date
+from celery import shared_task, group
+from celery.utils.log import get_task_logger
 from django.utils import timezone
-from .models import Service, Flat, Payment, Charge
+from .ledger import take_balance_snapshots
+from .allocation import allocate_balances
+from .stats import reconcile_stats
+from .latency import rollup_pending
+from .archive import archive_expired_logs
+from .sync import purge_tombstones
+from .models import Flat, Service
+from .billing import (
+    bill_service,
+    services_due_on,
+    pending_billing_dates,
+    advance_billing_schedule,
+)
+
+logger = get_task_logger(__name__)
 
 
 @shared_task
 def process_service_invoices():
-    today = timezone.now().day
-    services = Service.objects.filter(invoice_day=today, is_active=True)
-
-    for service in services:
-        for flat in service.flats.all():
-
-            amount = service.price * flat.square_metres
-
-            if flat.balance >= amount:
-                flat.balance -= amount
-                flat.save()
-                Payment.objects.create(
-                    building=flat.building,
-                    flat=flat,
-                    amount=amount,
-                    charge=None,
-                    user=flat.user,
-                    date=timezone.now().date(),
-                )
-            else:
-                charge_amount = amount - flat.balance
-                Charge.objects.create(
-                    flat=flat, service=service, amount=charge_amount, is_paid=False
-                )
-                if flat.balance != 0:
-                    Payment.objects.create(
-                        building=flat.building,
-                        flat=flat,
-                        amount=flat.balance,
-                        charge=None,
-                        user=flat.resident,
-                        date=timezone.now().date(),
-                    )
-
-                flat.balance = 0
-                flat.save()
-
-    return "Process completed"
+    """
+    Bill every branch for the dates since its own last completed run, as one
+    subtask per branch; each logs its own totals. A group rather than a
+    chord, so dispatching needs no result backend.
+
+    Missed days (beat down, worker lost) are picked up by the next run. Each
+    branch moves its own high-water mark as its dates complete, so a branch
+    that keeps failing holds back only itself.
+    """
+    branch_ids = (
+        Service.objects.filter(is_active=True)
+        .order_by("branch_id")
+        .values_list("branch_id", flat=True)
+        .distinct()
+    )
+    subtasks = []
+    for branch_id in branch_ids:
+        dates = pending_billing_dates(branch_id)
+        if dates:
+            dates = [billing_date.isoformat() for billing_date in dates]
+            subtasks.append(process_branch_invoices.s(branch_id, dates))
+    if not subtasks:
+        return "Nothing to bill"
+    group(subtasks).apply_async()
+    return f"Dispatched {len(subtasks)} branch billing tasks"
+
+
+@shared_task
+def process_branch_invoices(branch_id, billing_dates):
+    totals = {
+        "branch": branch_id,
+        "services": 0,
+        "flats": 0,
+        "payments": 0,
+        "charges": 0,
+    }
+    for billing_date in map(date.fromisoformat, billing_dates):
+        for service in services_due_on(billing_date).filter(branch_id=branch_id):
+            service_totals = bill_service(service, billing_date)
+            totals["services"] += 1
+            for key, value in service_totals.items():
+                totals[key] += value
+        advance_billing_schedule(branch_id, billing_date)
+    logger.info("Billing run completed: %s", totals)
+    return totals
+
+
+@shared_task
+def take_monthly_balance_snapshots():
+    month_start = timezone.localtime().replace(
+        day=1, hour=0, minute=0, second=0, microsecond=0
+    )
+    count = take_balance_snapshots(month_start)
+    return f"Snapshotted {count} flat balances at {month_start.isoformat()}"
+
+
+@shared_task
+def allocate_building_balances(building_id):
+    total = allocate_balances(Flat.objects.filter(building_id=building_id))
+    return f"Allocated {total} to open charges in building {building_id}"
+
+
+@shared_task
+def reconcile_building_stats():
+    count = reconcile_stats()
+    return f"Reconciled statistics of {count} buildings"
+
+
+@shared_task
+def rollup_route_latency():
+    count = rollup_pending()
+    return f"Rolled up route latency for {count} hours"
+
+
+@shared_task
+def archive_old_logs():
+    archived = archive_expired_logs()
+    count = sum(count for _, count in archived)
+    return f"Archived {count} log entries in {len(archived)} files"
+
+
+@shared_task
+def purge_old_tombstones():
+    count = purge_tombstones()
+    return f"Purged {count} sync tombstones"
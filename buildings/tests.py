@@ -1,3 +1,1279 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import re
+import tempfile
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from types import SimpleNamespace
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import IntegrityError, connection, close_old_connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from .ledger import adjust_balance, record_entries
+from .allocation import allocate_balances, allocate_payments
+from .billing import (
+    bill_service,
+    billing_mark,
+    invoice_amount,
+    pending_billing_dates,
+)
+from .tasks import process_branch_invoices, process_service_invoices
+from .utils import process_payments
+from .stats import dashboard_stats, reconcile_stats, refresh_residents
+from .rollups import add_to_rollup, month_series, rollups_for
+from .latency import latency_summary, rollup_bucket
+from .pagination import paginate_keyset
+from .logbuffer import LogBuffer
+from .archive import ARCHIVE_FIELDS, archive_month
+from rest_framework_simplejwt.tokens import RefreshToken
+from api import urls as api_urls
+from . import urls as building_urls
+from .scope import get_scope
+from .phones import normalize_phone, phone_query
+from .models import (
+    User,
+    Branch,
+    Building,
+    Section,
+    Flat,
+    Service,
+    Charge,
+    ChargeAllocation,
+    Payment,
+    News,
+    Camera,
+    Garage,
+    CarPlate,
+    Notification,
+    LedgerEntry,
+    Log,
+    RouteLatency,
+    BuildingStats,
+    BranchStats,
+    BillingRun,
+    BillingSchedule,
+    MonthlyRollup,
+)
 
-# Create your tests here.
+
+def create_flat(username="owner", balance=0):
+    owner = User.objects.create(username=username, is_superuser=True)
+    branch = Branch.objects.create(owner=owner, name="Filial", address="Bakı")
+    building = Building.objects.create(name="Bina", address="Bakı", branch=branch)
+    section = Section.objects.create(building=building, name="A")
+    return Flat.objects.create(
+        building=building,
+        section=section,
+        name="1",
+        square_metres=Decimal("50.00"),
+        balance=balance,
+    )
+
+
+class AdjustBalanceTests(TestCase):
+    def test_increment_is_recorded_in_ledger(self):
+        flat = create_flat(balance=Decimal("10.00"))
+        adjust_balance(flat.id, Decimal("2.50"), "PAYMENT")
+        flat.refresh_from_db()
+        self.assertEqual(flat.balance, Decimal("12.50"))
+        self.assertEqual(
+            list(LedgerEntry.objects.values_list("kind", "amount")),
+            [("PAYMENT", Decimal("2.50"))],
+        )
+
+
+@skipUnlessDBFeature("has_select_for_update")
+class ConcurrentBalanceTests(TransactionTestCase):
+    writers = 16
+    payments_per_writer = 25
+
+    def test_parallel_payments_are_not_lost(self):
+        flat = create_flat()
+        amount = Decimal("1.25")
+
+        def post_payments():
+            try:
+                for _ in range(self.payments_per_writer):
+                    adjust_balance(flat.id, amount, "PAYMENT")
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.writers) as pool:
+            futures = [pool.submit(post_payments) for _ in range(self.writers)]
+        for future in futures:
+            future.result()
+        close_old_connections()
+
+        expected = amount * self.writers * self.payments_per_writer
+        flat.refresh_from_db()
+        self.assertEqual(flat.balance, expected)
+        self.assertEqual(
+            LedgerEntry.objects.filter(flat=flat).aggregate(total=Sum("amount"))[
+                "total"
+            ],
+            expected,
+        )
+
+
+class DashboardStatsTests(TestCase):
+    def test_superuser_stats_use_one_query(self):
+        flat = create_flat(balance=Decimal("-1.00"))
+        resident = User.objects.create(username="sakin", resident=True)
+        flat.resident = resident
+        flat.save()
+        owner = flat.building.branch.owner
+        get_scope(owner)  # cached after the first request
+
+        with self.assertNumQueries(1):
+            stats = dashboard_stats(owner)
+
+        self.assertEqual(stats["branch_count"], 1)
+        self.assertEqual(stats["flat_count"], 1)
+        self.assertEqual(stats["resident_count"], 1)
+        self.assertEqual(stats["delayed_resident"], 1)
+        self.assertEqual(stats["total_expenses"], 0)
+
+    def test_commandant_sees_only_assigned_buildings(self):
+        flat = create_flat()
+        commandant = User.objects.create(username="komendant", commandant=True)
+        Building.objects.create(
+            name="Digər", address="Bakı", branch=flat.building.branch
+        ).commandant.add(commandant)
+
+        stats = dashboard_stats(commandant)
+
+        self.assertEqual(stats["branch_count"], 0)
+        self.assertEqual(stats["building_count"], 1)
+        self.assertEqual(stats["flat_count"], 0)
+
+
+class StatsCounterTests(TestCase):
+    def counters(self):
+        return (
+            list(BuildingStats.objects.order_by("pk").values()),
+            list(BranchStats.objects.order_by("pk").values()),
+        )
+
+    def test_incremental_counters_match_reconcile(self):
+        flat = create_flat(balance=Decimal("5.00"))
+        flat.resident = User.objects.create(username="sakin", resident=True)
+        flat.save()
+        Payment.objects.create(
+            building=flat.building, flat=flat, amount=5, date=date(2024, 1, 1)
+        )
+        adjust_balance(flat.id, Decimal("-10.00"), "BILLING")
+
+        stats = BuildingStats.objects.get(building=flat.building)
+        self.assertEqual(
+            (stats.flat_count, stats.resident_count, stats.debtor_count),
+            (1, 1, 1),
+        )
+        self.assertEqual(stats.payment_count, 1)
+
+        incremental = self.counters()
+        reconcile_stats()
+        self.assertEqual(
+            [[row | {"updated_at": None} for row in rows] for rows in incremental],
+            [[row | {"updated_at": None} for row in rows] for rows in self.counters()],
+        )
+
+    def test_branch_counts_each_resident_once(self):
+        flat = create_flat(balance=Decimal("-5.00"))
+        other = Building.objects.create(
+            name="Bina 2", address="Bakı", branch=flat.building.branch
+        )
+        resident = User.objects.create(username="sakin", resident=True)
+        second = Flat.objects.create(
+            building=other,
+            section=Section.objects.create(building=other, name="B"),
+            name="2",
+            square_metres=Decimal("40.00"),
+        )
+        for owned in (flat, second):
+            Flat.objects.filter(id=owned.id).update(resident=resident)
+        refresh_residents([flat.building_id, other.id])
+        adjust_balance(second.id, Decimal("-1.00"), "BILLING")
+
+        branch = BranchStats.objects.get()
+        self.assertEqual((branch.resident_count, branch.debtor_count), (1, 1))
+        self.assertEqual(
+            list(BuildingStats.objects.values_list("resident_count", flat=True)),
+            [1, 1],
+        )
+        reconcile_stats()
+        branch.refresh_from_db()
+        self.assertEqual((branch.resident_count, branch.debtor_count), (1, 1))
+
+
+class StatsBackfillMigrationTests(TransactionTestCase):
+    def test_existing_rows_are_counted_on_migrate(self):
+        flat = create_flat()
+        Payment.objects.create(
+            building=flat.building, flat=flat, amount=5, date=date(2024, 1, 1)
+        )
+        executor = MigrationExecutor(connection)
+        executor.migrate([("buildings", "0057_billingschedule_branch")])
+        self.assertFalse(BuildingStats.objects.exists())
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes("buildings"))
+        stats = BuildingStats.objects.get(building=flat.building)
+        self.assertEqual((stats.flat_count, stats.payment_count), (1, 1))
+        self.assertEqual(BranchStats.objects.get().building_count, 1)
+
+
+class MonthlyRollupTests(TestCase):
+    def test_series_is_gap_filled_and_scoped(self):
+        flat = create_flat()
+        owner = flat.building.branch.owner
+        Payment.objects.create(
+            building=flat.building, flat=flat, amount=10, date=date(2024, 1, 5)
+        )
+        payment = Payment.objects.create(
+            building=flat.building, flat=flat, amount=5, date=date(2024, 1, 20)
+        )
+        payment.date = date(2024, 3, 1)
+        payment.save()
+        other = create_flat(username="digər")
+        Payment.objects.create(
+            building=other.building, flat=other, amount=99, date=date(2024, 2, 1)
+        )
+
+        series = month_series(
+            rollups_for(owner), "payment_total", date(2023, 12, 1), date(2024, 3, 1)
+        )
+
+        self.assertEqual(
+            series,
+            [("12/2023", 0), ("01/2024", 10.0), ("02/2024", 0), ("03/2024", 5.0)],
+        )
+
+    def test_one_branch_row_per_month(self):
+        branch = create_flat().building.branch
+        for _ in range(2):
+            add_to_rollup(branch.id, None, date(2024, 1, 5), expense_total=7)
+
+        self.assertEqual(
+            list(MonthlyRollup.objects.values_list("building_id", "expense_total")),
+            [(None, Decimal("14.00"))],
+        )
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            MonthlyRollup.objects.create(
+                branch=branch, building=None, year=2024, month=1
+            )
+
+
+class RouteLatencyTests(TestCase):
+    def test_hour_is_rolled_up_into_a_histogram(self):
+        user = User.objects.create(username="owner")
+        hour = datetime(2024, 5, 1, 10, tzinfo=dt_timezone.utc)
+        Log.objects.bulk_create(
+            Log(
+                user=user,
+                action="ACCESS",
+                model_name="N/A",
+                timestamp=hour.replace(minute=minute),
+                method="GET",
+                path="/payments/",
+                route="payment-list",
+                status=200 if duration < 900 else 500,
+                duration_ms=duration,
+            )
+            for minute, duration in enumerate([5, 20, 20, 80, 900])
+        )
+
+        self.assertEqual(rollup_bucket(hour), 1)
+        latency = RouteLatency.objects.get()
+        self.assertEqual(latency.histogram, [1, 2, 0, 1, 0, 0, 1, 0, 0, 0, 0])
+        self.assertEqual(
+            latency_summary([latency]),
+            {
+                "count": 5,
+                "errors": 1,
+                "mean_ms": 205.0,
+                "max_ms": 900,
+                "p50": 25,
+                "p95": 900,
+                "p99": 900,
+            },
+        )
+
+
+class KeysetPaginationTests(TestCase):
+    def test_pages_cover_ties_once_in_both_directions(self):
+        flat = create_flat()
+        for day in [3, 3, 3, 2, 2, 1, 1]:
+            Payment.objects.create(
+                building=flat.building, flat=flat, amount=1, date=date(2024, 1, day)
+            )
+        payments = Payment.objects.all()
+        ordering = ("-date", "-id")
+        expected = list(payments.order_by(*ordering).values_list("id", flat=True))
+
+        pages = [paginate_keyset(payments, ordering, 3)]
+        while pages[-1].has_next():
+            pages.append(paginate_keyset(payments, ordering, 3, pages[-1].next_cursor))
+
+        self.assertEqual([p.id for page in pages for p in page], expected)
+        self.assertFalse(pages[0].has_previous())
+        back = paginate_keyset(payments, ordering, 3, pages[-1].previous_cursor)
+        self.assertEqual(list(back), list(pages[-2]))
+
+
+class AccessScopeTests(TestCase):
+    def test_scope_is_cached_and_follows_assignments(self):
+        flat = create_flat()
+        commandant = User.objects.create(username="komendant", commandant=True)
+        flat.building.commandant.add(commandant)
+        other = Building.objects.create(
+            name="Bina 2", address="Bakı", branch=flat.building.branch
+        )
+
+        scope = get_scope(commandant)
+        self.assertEqual(scope.building_ids, {flat.building_id})
+        self.assertEqual(scope.branch_ids, {flat.building.branch_id})
+        with self.assertNumQueries(0):
+            self.assertIs(get_scope(commandant), scope)
+        # A new request loads a new user object and finds the cached ids.
+        reloaded = User.objects.get(id=commandant.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_scope(reloaded).building_ids, scope.building_ids)
+
+        other.commandant.add(commandant)
+        refreshed = get_scope(User.objects.get(id=commandant.id))
+        self.assertEqual(refreshed.building_ids, {flat.building_id, other.id})
+
+        owner = flat.building.branch.owner
+        self.assertEqual(get_scope(owner).building_ids, {flat.building_id, other.id})
+
+
+@override_settings(ACCESS_LOG_MODE="sync")
+class ScopedListQueryTests(TestCase):
+    def test_list_views_need_no_distinct(self):
+        flat = create_flat()
+        resident = User.objects.create(username="sakin", resident=True)
+        flat.resident = resident
+        flat.save()
+        Flat.objects.create(
+            building=flat.building,
+            section=flat.section,
+            name="2",
+            square_metres=Decimal("40.00"),
+            resident=resident,
+        )
+        Payment.objects.create(
+            building=flat.building, flat=flat, amount=1, date=date(2024, 1, 1)
+        )
+        self.client.force_login(flat.building.branch.owner)
+
+        for url in ["/residents/", "/flats/", "/charge/", "/payments/", "/expenses/"]:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            for query in queries:
+                self.assertNotIn("DISTINCT", query["sql"], url)
+
+        response = self.client.get("/residents/", {"building": flat.building_id})
+        self.assertEqual(list(response.context["residents"]), [resident])
+        self.assertEqual(len(self.client.get("/payments/").context["payments"]), 1)
+
+
+def populate(flats, scale):
+    """
+    A generated dataset for the query budgets; `scale` multiplies the rows
+    per flat (charges, payments, notifications) and per building or branch.
+    """
+    call_command(
+        "generate_data",
+        flats=flats,
+        flats_per_building=2,
+        buildings_per_branch=2,
+        months=scale,
+        notifications=scale,
+        resident_ratio=1.0,
+        stdout=StringIO(),
+    )
+    owner = User.objects.get(username="bench")
+    for building in Building.objects.all():
+        commandant = User.objects.create(
+            username=f"komendant{building.id}", commandant=True, is_staff=True
+        )
+        building.commandant.add(commandant)
+        for number in range(scale):
+            garage = Garage.objects.create(building=building, number=str(number))
+            CarPlate.objects.create(
+                name="Sakin", plate=f"10-AA-{number}", garage=garage
+            )
+            News.objects.create(building=building, title="Xəbər", content="Məzmun")
+    for branch in Branch.objects.all():
+        for number in range(scale):
+            Camera.objects.create(url=f"rtsp://kamera/{number}", branch=branch)
+    flat = Flat.objects.filter(resident__isnull=False).first()
+    return SimpleNamespace(
+        owner=owner,
+        resident=flat.resident,
+        branch=flat.building.branch,
+        building=flat.building,
+        flat=flat,
+        commandant=flat.building.commandant.first(),
+        service=Service.objects.filter(branch=flat.building.branch).first(),
+        charge=Charge.objects.filter(flat=flat).first(),
+        news=News.objects.first(),
+        camera=Camera.objects.filter(branch=flat.building.branch).first(),
+        garage=Garage.objects.first(),
+        carplate=CarPlate.objects.first(),
+        notification=Notification.objects.filter(user=flat.resident).first(),
+    )
+
+
+def none(data):
+    return {}, {}
+
+
+def pk(name):
+    return lambda data: ({"pk": getattr(data, name).pk}, {})
+
+
+# Route name -> (query budget, function of the dataset giving (url kwargs, GET
+# parameters)). Pages are requested by the branch owner.
+BUILDING_ROUTES = {
+    "dashboard": (5, none),
+    "login": (3, none),
+    "logout": (3, none),
+    "user_profile": (4, pk("owner")),
+    "branches": (4, none),
+    "branch-detail": (4, pk("branch")),
+    "branch-edit": (4, pk("branch")),
+    "branch-add": (3, none),
+    "commandant-list": (5, lambda d: ({"branch_id": d.branch.pk}, {})),
+    "commandant-add": (5, lambda d: ({"branch_id": d.branch.pk}, {})),
+    "commandant-delete": (
+        14,
+        lambda d: ({"branch_id": d.branch.pk, "pk": d.commandant.pk}, {}),
+    ),
+    "flat-services": (7, lambda d: ({"flat_id": d.flat.pk}, {})),
+    "flat-add": (5, none),
+    "flat-list": (7, none),
+    "buildings": (4, none),
+    "buildings-list": (4, lambda d: ({"branch_id": d.branch.pk}, {})),
+    "building-add": (3, lambda d: ({"branch_id": d.branch.pk}, {})),
+    "create_building": (4, none),
+    "section-list": (4, none),
+    "section-add": (5, none),
+    "section_autocomplete": (5, lambda d: ({}, {"building_id": d.building.pk})),
+    "services": (4, none),
+    "service-detail": (5, pk("service")),
+    "service-edit": (5, pk("service")),
+    "service_delete": (10, pk("service")),
+    "service-projection": (4, pk("service")),
+    "charge-autocomplete": (4, lambda d: ({}, {"flat_id": d.flat.pk})),
+    "charge-detail": (4, lambda d: ({}, {"charge_id": d.charge.pk})),
+    "charge-list": (4, none),
+    "service-add": (4, none),
+    "flat-add-services": (7, lambda d: ({"flat_id": d.flat.pk}, {})),
+    "expense-chart": (4, none),
+    "expense-list": (5, none),
+    "expense-add": (5, none),
+    "payment-list": (4, none),
+    "payment-add": (6, none),
+    "payment-chart": (4, none),
+    "all-residents": (6, none),
+    "add-resident": (6, none),
+    "resident-delete": (17, pk("resident")),
+    "flat-autocomplete": (4, lambda d: ({}, {"building_id": d.building.pk})),
+    "flat-autocomplete-sec": (4, lambda d: ({}, {"building_id": d.building.pk})),
+    "building_autocomplete": (4, lambda d: ({}, {"branch_id": d.branch.pk})),
+    "branch_buildings": (4, lambda d: ({}, {"branch_id": d.branch.pk})),
+    "carplate-list": (4, none),
+    "carplate-add": (4, none),
+    "carplate-delete": (7, pk("carplate")),
+    "garage-list": (4, none),
+    "garage-detail": (4, pk("garage")),
+    "garage-edit": (5, pk("garage")),
+    "garage-add": (4, none),
+    "log_list": (5, none),
+    "news-list": (5, none),
+    "news-create": (4, none),
+    "news-detail": (4, pk("news")),
+    "news-edit": (5, pk("news")),
+    "news-delete": (7, pk("news")),
+    "camera-list": (6, lambda d: ({"branch_id": d.branch.pk}, {})),
+    "camera-add": (4, lambda d: ({"branch_id": d.branch.pk}, {})),
+    "camera-delete": (5, pk("camera")),
+    "camera-edit": (4, lambda d: ({"branch_id": d.branch.pk, "pk": d.camera.pk}, {})),
+    "get_weather": (3, none),
+}
+
+# Delete views without a working confirmation page; they are posted instead.
+POSTED_ROUTES = {
+    "commandant-delete",
+    "resident-delete",
+    "carplate-delete",
+    "service_delete",
+    "camera-delete",
+    "news-delete",
+}
+
+# API routes are requested with a resident's token, garages with the owner's.
+# The credential routes get no credentials and only have to fail cleanly.
+CREDENTIAL_ROUTES = {"login", "token_obtain_pair", "token_refresh"}
+API_ROUTES = {
+    "login": (4, none),
+    "token_obtain_pair": (3, none),
+    "token_refresh": (3, none),
+    "flat-list": (5, none),
+    "flat-charges": (6, lambda d: ({"id": d.flat.pk}, {})),
+    "all-charges": (5, none),
+    "payments-list": (5, none),
+    "garages-list": (6, none),
+    "notifications-list": (5, none),
+    "notification-detail": (5, lambda d: ({"id": d.notification.pk}, {})),
+    "unread-notifications-count": (5, none),
+    "mark-all-notifications-read": (5, none),
+    "sync": (9, none),
+}
+
+
+@override_settings(ACCESS_LOG_MODE="sync")
+class QueryBudgetTests(TestCase):
+    """
+    Renders every route of buildings.urls and api.urls against a small and a
+    large generated dataset. A route fails when its query count grows with
+    the data (an N+1) or exceeds its budget.
+    """
+
+    sizes = ((4, 1), (12, 3))
+
+    def measure(self, data):
+        counts = {}
+        # API routes first: the posted delete routes remove the resident.
+        routes = [("api/", api_urls, API_ROUTES), ("", building_urls, BUILDING_ROUTES)]
+        for prefix, module, budgets in routes:
+            for pattern in module.urlpatterns:
+                name = f"{prefix}{pattern.name}"
+                if name in counts:
+                    continue
+                self.assertIn(pattern.name, budgets, f"{name} has no query budget")
+                budget, arguments = budgets[pattern.name]
+                kwargs, params = arguments(data)
+                path = re.sub(
+                    r"<(?:\w+:)?(\w+)>",
+                    lambda match: str(kwargs[match.group(1)]),
+                    str(pattern.pattern),
+                )
+                headers = {}
+                if prefix:
+                    user = (
+                        data.owner if pattern.name == "garages-list" else data.resident
+                    )
+                    token = RefreshToken.for_user(user).access_token
+                    headers["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+                send = self.client.get
+                if not prefix and pattern.name in POSTED_ROUTES:
+                    send = self.client.post
+                with CaptureQueriesContext(connection) as queries:
+                    response = send(f"/{prefix}{path}", params, **headers)
+                self.assertLess(response.status_code, 500, name)
+                if prefix and pattern.name not in CREDENTIAL_ROUTES:
+                    self.assertEqual(response.status_code, 200, name)
+                counts[name] = (len(queries), budget)
+        return counts
+
+    def test_query_counts_do_not_grow_with_data(self):
+        results = []
+        for flats, scale in self.sizes:
+            cache.clear()
+            with transaction.atomic():
+                data = populate(flats, scale)
+                self.client.force_login(data.owner)
+                results.append(self.measure(data))
+                transaction.set_rollback(True)
+        small, large = results
+        for name, (count, budget) in large.items():
+            with self.subTest(route=name):
+                self.assertEqual(count, small[name][0], "queries grow with the data")
+                self.assertLessEqual(count, budget)
+
+
+class PhoneSearchTests(TestCase):
+    def test_numbers_are_normalized_and_searchable(self):
+        for raw in ["+994 50 123-45-67", "00994501234567", "050 123 45 67"]:
+            self.assertEqual(normalize_phone(raw), "994501234567")
+        user = User.objects.create(username="sakin", phone_number="050 123 45 67")
+        User.objects.create(username="digər", phone_number="+994551112233")
+        self.assertEqual(user.phone_digits, "994501234567")
+
+        def search(value):
+            users = User.objects.filter(phone_query(value))
+            return list(users.values_list("username", flat=True))
+
+        self.assertEqual(search("+994501234567"), ["sakin"])
+        self.assertEqual(search("050 12"), ["sakin"])
+        self.assertEqual(search("4567"), ["sakin"])
+        self.assertEqual(search("9999"), [])
+        self.assertIsNone(phone_query("abc"))
+
+    def test_backfill_command(self):
+        user = User.objects.create(username="sakin")
+        User.objects.filter(id=user.id).update(phone_number="+994501234567")
+        call_command("normalize_phones", stdout=StringIO())
+        user.refresh_from_db()
+        self.assertEqual(user.phone_digits_reversed, "765432105499")
+
+
+@override_settings(ACCESS_LOG_MODE="sync")
+class AutocompleteTests(TestCase):
+    def test_ranked_and_paged_suggestions(self):
+        flat = create_flat()
+        Flat.objects.bulk_create(
+            Flat(
+                building=flat.building,
+                section=flat.section,
+                name=str(number),
+                square_metres=Decimal("40.00"),
+            )
+            for number in [105, *range(2, 26)]
+        )
+        self.client.force_login(flat.building.branch.owner)
+
+        def suggest(**params):
+            params["building_id"] = flat.building_id
+            return self.client.get("/flat-autocomplete/", params).json()
+
+        found = suggest(q="5")
+        self.assertEqual(
+            [row["text"] for row in found["results"]], ["5", "15", "25", "105"]
+        )
+        self.assertFalse(found["pagination"]["more"])
+        first = suggest()
+        self.assertEqual(len(first["results"]), 20)
+        self.assertTrue(first["pagination"]["more"])
+        last = suggest(page=2)
+        self.assertEqual([row["text"] for row in last["results"]][-1], "105")
+        self.assertFalse(last["pagination"]["more"])
+
+    def test_dropdowns_get_every_building_of_the_branch(self):
+        flat = create_flat()
+        Building.objects.bulk_create(
+            Building(name=f"Bina {number}", address="Bakı", branch=flat.building.branch)
+            for number in range(30)
+        )
+        self.client.force_login(flat.building.branch.owner)
+        params = {"branch_id": flat.building.branch_id}
+        listed = self.client.get("/branch-buildings/", params).json()["results"]
+        self.assertEqual(len(listed), 31)
+        suggested = self.client.get("/autocomplete/buildings/", params).json()
+        self.assertEqual(len(suggested["results"]), 20)
+
+
+@override_settings(ACCESS_LOG_MODE="sync")
+class BuildingTreeTests(TestCase):
+    def test_tree_is_cached_revalidated_and_invalidated(self):
+        flat = create_flat()
+        self.client.force_login(flat.building.branch.owner)
+        params = {"building_id": flat.building_id}
+
+        response = self.client.get("/flat-autocomplete-sec/", params)
+        etag = response["ETag"]
+        self.assertEqual(response.json()["results"], [{"id": flat.id, "text": "1"}])
+        with self.assertNumQueries(3):
+            sections = self.client.get("/section-autocomplete/", params)
+        self.assertEqual(sections.json()["results"][0]["id"], flat.section_id)
+
+        again = self.client.get(
+            "/flat-autocomplete-sec/", params, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(again.status_code, 304)
+
+        flat.name = "1A"
+        flat.save()
+        changed = self.client.get(
+            "/flat-autocomplete-sec/", params, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()["results"][0]["text"], "1A")
+
+        outsider = User.objects.create(username="kənar")
+        self.client.force_login(outsider)
+        self.assertEqual(
+            self.client.get("/flat-autocomplete-sec/", params).json(), {"results": []}
+        )
+
+
+class BillingScheduleTests(TestCase):
+    def test_a_failing_branch_holds_back_only_itself(self):
+        failing = create_flat("owner-a").building.branch
+        healthy = create_flat("owner-b").building.branch
+        for branch in (failing, healthy):
+            BillingSchedule.objects.create(
+                branch=branch, last_billed_date=date(2024, 1, 1)
+            )
+            Service.objects.create(branch=branch, name="Su", price=1, invoice_day=2)
+        dates = ["2024-01-02", "2024-01-03"]
+
+        def bill(service, billing_date):
+            if service.branch_id == failing.id:
+                raise RuntimeError("branch is down")
+            return {}
+
+        with mock.patch("buildings.tasks.bill_service", side_effect=bill):
+            with self.assertRaises(RuntimeError):
+                process_branch_invoices(failing.id, dates)
+            process_branch_invoices(healthy.id, dates)
+
+        today = date(2024, 1, 5)
+        self.assertEqual(billing_mark(failing.id), date(2024, 1, 1))
+        self.assertEqual(len(pending_billing_dates(failing.id, today)), 4)
+        self.assertEqual(
+            pending_billing_dates(healthy.id, today),
+            [date(2024, 1, 4), date(2024, 1, 5)],
+        )
+
+    def test_daily_run_dispatches_one_task_per_branch(self):
+        branch = create_flat().building.branch
+        Service.objects.create(branch=branch, name="Su", price=1, invoice_day=2)
+        today = timezone.now().date()
+
+        with mock.patch("buildings.tasks.group") as group:
+            process_service_invoices()
+
+        (subtasks,), _ = group.call_args
+        self.assertEqual(
+            [subtask.args for subtask in subtasks],
+            [(branch.id, [today.isoformat()])],
+        )
+        group.return_value.apply_async.assert_called_once_with()
+
+    def test_a_new_branch_starts_today(self):
+        branch = create_flat().building.branch
+        today = date(2024, 1, 5)
+        self.assertIsNone(billing_mark(branch.id))
+        self.assertEqual(pending_billing_dates(branch.id, today), [today])
+
+        process_branch_invoices(branch.id, [today.isoformat()])
+        self.assertEqual(billing_mark(branch.id), today)
+        self.assertEqual(pending_billing_dates(branch.id, today), [])
+
+
+class BillingScheduleMigrationTests(TransactionTestCase):
+    def test_shared_mark_becomes_each_branch_mark(self):
+        before = [("buildings", "0058_backfill_stats")]
+        executor = MigrationExecutor(connection)
+        executor.migrate(before)
+        apps = executor.loader.project_state(before).apps
+        owner = apps.get_model("buildings", "User").objects.create(username="owner")
+        Branch = apps.get_model("buildings", "Branch")
+        old, own = (
+            Branch.objects.create(owner=owner, name=name, address="Bakı")
+            for name in ("Köhnə", "Yeni")
+        )
+        OldSchedule = apps.get_model("buildings", "BillingSchedule")
+        OldSchedule.objects.create(last_billed_date=date(2024, 1, 1))
+        OldSchedule.objects.create(branch=own, last_billed_date=date(2024, 1, 3))
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes("buildings"))
+        self.assertEqual(
+            dict(BillingSchedule.objects.values_list("branch_id", "last_billed_date")),
+            {old.id: date(2024, 1, 1), own.id: date(2024, 1, 3)},
+        )
+
+
+class ProcessPaymentsTests(TestCase):
+    def test_balance_is_read_under_lock_and_split(self):
+        flat = create_flat(balance=Decimal("10.00"))
+        service = Service.objects.create(
+            branch=flat.building.branch,
+            name="Su",
+            price=Decimal("1.00"),
+            invoice_day=timezone.now().day,
+        )
+        service.flats.add(flat)
+
+        with CaptureQueriesContext(connection) as queries:
+            process_payments(SimpleNamespace(user=flat.building.branch.owner))
+
+        flat.refresh_from_db()
+        self.assertEqual(flat.balance, 0)
+        self.assertEqual(Payment.objects.get(flat=flat).amount, Decimal("10.00"))
+        self.assertEqual(Charge.objects.get(flat=flat).amount, Decimal("40.00"))
+        if connection.features.has_select_for_update:
+            self.assertTrue(any("FOR UPDATE" in q["sql"] for q in queries))
+
+
+SQUARE_METRES = Decimal("50.50")
+
+
+def per_flat_billing(price, balances):
+    """
+    What the per-flat loop that bill_service replaced did to flats holding
+    `balances`: (balances, charges, payments) afterwards, per flat index.
+    """
+    after, charges, payments = {}, {}, {}
+    for index, balance in enumerate(balances):
+        amount = invoice_amount(price, SQUARE_METRES)
+        if balance >= amount:
+            after[index] = balance - amount
+            payments[index] = amount
+        else:
+            charges[index] = amount - balance
+            if balance != 0:
+                payments[index] = balance
+            after[index] = Decimal(0)
+    return after, charges, payments
+
+
+@override_settings(ACCESS_LOG_MODE="sync")
+class BillingTests(TestCase):
+    price = Decimal("0.25")
+    # Covering, exactly covering, zero, partial and negative balances.
+    balances = [
+        Decimal("100.00"),
+        Decimal("12.63"),
+        Decimal("0.00"),
+        Decimal("5.00"),
+        Decimal("-15.00"),
+    ]
+
+    def setUp(self):
+        first = create_flat()
+        first.square_metres = SQUARE_METRES
+        first.save()
+        self.flats = [first] + [
+            Flat.objects.create(
+                building=first.building,
+                section=first.section,
+                name=str(number),
+                square_metres=SQUARE_METRES,
+            )
+            for number in range(2, len(self.balances) + 1)
+        ]
+        for flat, balance in zip(self.flats, self.balances):
+            Flat.objects.filter(id=flat.id).update(balance=balance)
+        self.service = Service.objects.create(
+            branch=first.building.branch,
+            name="Su",
+            price=self.price,
+            invoice_day=1,
+        )
+        self.service.flats.add(*self.flats)
+
+    def assertBilledOnce(self):
+        after, charges, payments = per_flat_billing(self.price, self.balances)
+        index = {flat.id: number for number, flat in enumerate(self.flats)}
+        self.assertEqual(
+            {
+                index[flat_id]: amount
+                for flat_id, amount in Charge.objects.values_list("flat_id", "amount")
+            },
+            charges,
+        )
+        self.assertEqual(Charge.objects.count(), len(charges))
+        self.assertEqual(
+            {
+                index[flat_id]: amount
+                for flat_id, amount in Payment.objects.values_list("flat_id", "amount")
+            },
+            payments,
+        )
+        self.assertEqual(Payment.objects.count(), len(payments))
+        self.assertEqual(
+            {
+                index[flat_id]: balance
+                for flat_id, balance in Flat.objects.values_list("id", "balance")
+            },
+            after,
+        )
+        ledger = dict(
+            LedgerEntry.objects.filter(kind="BILLING")
+            .values("flat_id")
+            .annotate(total=Sum("amount"))
+            .values_list("flat_id", "total")
+        )
+        self.assertEqual(
+            {index[flat_id]: total for flat_id, total in ledger.items()},
+            {
+                number: after[number] - balance
+                for number, balance in enumerate(self.balances)
+                if after[number] != balance
+            },
+        )
+
+    def test_matches_the_per_flat_loop(self):
+        totals = bill_service(self.service, date(2024, 1, 1), chunk_size=2)
+
+        self.assertEqual(totals, {"flats": 5, "payments": 4, "charges": 3})
+        self.assertBilledOnce()
+
+    def test_rerun_after_a_crash_bills_only_the_missing_flats(self):
+        real_record_entries = record_entries
+        calls = []
+
+        def crash_on_second_chunk(entries):
+            calls.append(entries)
+            if len(calls) == 2:
+                # After this chunk's items, charges and payments were inserted.
+                raise RuntimeError("worker lost")
+            real_record_entries(entries)
+
+        with mock.patch(
+            "buildings.billing.record_entries", side_effect=crash_on_second_chunk
+        ):
+            with self.assertRaises(RuntimeError):
+                bill_service(self.service, date(2024, 1, 1), chunk_size=2)
+
+        run = BillingRun.objects.get()
+        self.assertEqual(run.status, "RUNNING")
+        self.assertEqual(run.items.count(), 2)
+        self.assertEqual(LedgerEntry.objects.count(), 2)
+
+        totals = bill_service(self.service, date(2024, 1, 1), chunk_size=2)
+        self.assertEqual(totals["flats"], 3)
+        self.assertBilledOnce()
+
+        self.assertEqual(
+            bill_service(self.service, date(2024, 1, 1), chunk_size=2),
+            {"flats": 0, "payments": 0, "charges": 0},
+        )
+        self.assertBilledOnce()
+
+    def test_projection_at_a_new_price(self):
+        self.client.force_login(self.service.branch.owner)
+        url = f"/service/{self.service.id}/projection/"
+
+        data = self.client.get(url, {"price": "1.00", "invoice_day": "5"}).json()
+
+        self.assertEqual(Decimal(data["current_total"]), Decimal("63.15"))
+        self.assertEqual(Decimal(data["projected_total"]), Decimal("252.50"))
+        self.assertEqual(Decimal(data["shortfall_total"]), Decimal("199.37"))
+        self.assertEqual(data["short_flat_count"], 4)
+        self.assertEqual(
+            [Decimal(flat["shortfall"]) for flat in data["short_flats"]],
+            [Decimal("65.50"), Decimal("50.50"), Decimal("45.50"), Decimal("37.87")],
+        )
+        self.assertEqual(data["invoice_day"], 5)
+        self.assertEqual(Charge.objects.count(), 0)
+
+        for params in (
+            {"price": "NaN"},
+            {"price": "sNaN"},
+            {"price": "Infinity"},
+            {"price": "-Infinity"},
+            {"price": "-1"},
+            {"price": "1e9"},
+            {"price": "abc"},
+            {"invoice_day": "0"},
+            {"invoice_day": "32"},
+            {"invoice_day": "x"},
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(url, params).status_code, 400)
+
+    def test_commandant_projects_only_assigned_buildings(self):
+        branch = self.service.branch
+        secret = Building.objects.create(name="Secret", address="Bakı", branch=branch)
+        hidden = Flat.objects.create(
+            building=secret,
+            section=Section.objects.create(building=secret, name="S"),
+            name="S-1",
+            square_metres=SQUARE_METRES,
+        )
+        self.service.flats.add(hidden)
+        commandant = User.objects.create(username="komendant", commandant=True)
+        self.flats[0].building.commandant.add(commandant)
+        self.client.force_login(commandant)
+
+        data = self.client.get(
+            f"/service/{self.service.id}/projection/", {"price": "1.00"}
+        ).json()
+
+        self.assertEqual(data["flats"], len(self.flats))
+        self.assertEqual([building["name"] for building in data["buildings"]], ["Bina"])
+        self.assertNotIn("S-1", [flat["name"] for flat in data["short_flats"]])
+        self.assertEqual(Decimal(data["projected_total"]), Decimal("252.50"))
+
+    def test_half_cents_round_away_from_zero(self):
+        self.assertEqual(
+            invoice_amount(Decimal("0.25"), Decimal("50.50")), Decimal("12.63")
+        )
+        self.assertEqual(
+            invoice_amount(Decimal("0.25"), Decimal("50.30")), Decimal("12.58")
+        )
+
+
+@override_settings(ACCESS_LOG_MODE="sync")
+class AllocationTests(TestCase):
+    def setUp(self):
+        self.flat = create_flat()
+        # The newer charge gets the lower id, so ordering by id would be wrong.
+        self.newer = Charge.objects.create(flat=self.flat, amount=Decimal("20.00"))
+        self.older = Charge.objects.create(flat=self.flat, amount=Decimal("30.00"))
+        Charge.objects.filter(id=self.older.id).update(
+            created_at=self.newer.created_at - timedelta(days=30)
+        )
+
+    def allocated(self, charge):
+        return charge.allocations.aggregate(total=Sum("amount"))["total"]
+
+    def pay(self, amount, charge=None):
+        self.client.force_login(self.flat.building.branch.owner)
+        response = self.client.post(
+            "/payments/add/",
+            {
+                "building": self.flat.building_id,
+                "flat": self.flat.id,
+                "charge": charge.id if charge else "",
+                "amount": amount,
+                "date": "2024-01-10",
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        return Payment.objects.get()
+
+    def test_payment_settles_the_oldest_charge_first(self):
+        payment = self.pay("40.00")
+
+        self.older.refresh_from_db()
+        self.newer.refresh_from_db()
+        self.assertTrue(self.older.is_paid)
+        self.assertFalse(self.newer.is_paid)
+        self.assertEqual(self.allocated(self.older), Decimal("30.00"))
+        self.assertEqual(self.allocated(self.newer), Decimal("10.00"))
+        self.assertEqual(
+            payment.allocations.aggregate(total=Sum("amount"))["total"],
+            payment.amount,
+        )
+        self.flat.refresh_from_db()
+        self.assertEqual(self.flat.balance, 0)
+
+    def test_overpayment_is_credited_to_the_balance(self):
+        payment = self.pay("70.00")
+
+        self.assertEqual(set(Charge.objects.values_list("is_paid", flat=True)), {True})
+        allocated = payment.allocations.aggregate(total=Sum("amount"))["total"]
+        self.assertEqual(allocated, Decimal("50.00"))
+        self.flat.refresh_from_db()
+        self.assertEqual(self.flat.balance, Decimal("20.00"))
+        self.assertEqual(allocated + self.flat.balance, payment.amount)
+        self.assertEqual(
+            list(LedgerEntry.objects.values_list("kind", "amount")),
+            [("PAYMENT", Decimal("20.00"))],
+        )
+
+    def test_partial_payment_of_a_selected_charge_leaves_it_open(self):
+        payment = self.pay("5.00", charge=self.newer)
+
+        self.newer.refresh_from_db()
+        self.assertFalse(self.newer.is_paid)
+        self.assertEqual(self.allocated(self.newer), Decimal("5.00"))
+        self.assertIsNone(self.allocated(self.older))
+        self.assertEqual(
+            payment.allocations.aggregate(total=Sum("amount"))["total"],
+            payment.amount,
+        )
+
+    def test_selected_charge_first_then_oldest_then_credit(self):
+        payment = self.pay("60.00", charge=self.newer)
+
+        self.assertEqual(set(Charge.objects.values_list("is_paid", flat=True)), {True})
+        self.assertEqual(self.allocated(self.newer), Decimal("20.00"))
+        self.assertEqual(self.allocated(self.older), Decimal("30.00"))
+        self.flat.refresh_from_db()
+        self.assertEqual(self.flat.balance, Decimal("10.00"))
+        allocated = payment.allocations.aggregate(total=Sum("amount"))["total"]
+        self.assertEqual(allocated + self.flat.balance, payment.amount)
+
+    def test_payments_are_allocated_only_once(self):
+        payment = Payment.objects.create(
+            building=self.flat.building,
+            flat=self.flat,
+            amount=Decimal("45.00"),
+            date=date(2024, 1, 10),
+        )
+        payments = Payment.objects.filter(id=payment.id)
+
+        self.assertEqual(allocate_payments(payments), {payment.id: Decimal(0)})
+        self.assertEqual(allocate_payments(payments), {})
+        self.assertEqual(self.allocated(self.older), Decimal("30.00"))
+        self.assertEqual(self.allocated(self.newer), Decimal("15.00"))
+        self.assertEqual(
+            ChargeAllocation.objects.aggregate(total=Sum("amount"))["total"],
+            payment.amount,
+        )
+
+    def test_balances_are_spent_oldest_charge_first(self):
+        Flat.objects.filter(id=self.flat.id).update(balance=Decimal("60.00"))
+        partial = Flat.objects.create(
+            building=self.flat.building,
+            section=self.flat.section,
+            name="2",
+            square_metres=Decimal("50.00"),
+            balance=Decimal("25.00"),
+        )
+        only = Charge.objects.create(flat=partial, amount=Decimal("40.00"))
+
+        total = allocate_balances(Flat.objects.all(), chunk_size=1)
+
+        self.assertEqual(total, Decimal("75.00"))
+        self.flat.refresh_from_db()
+        partial.refresh_from_db()
+        only.refresh_from_db()
+        self.assertEqual(self.flat.balance, Decimal("10.00"))
+        self.assertEqual(partial.balance, 0)
+        self.assertFalse(only.is_paid)
+        self.assertEqual(self.allocated(only), Decimal("25.00"))
+        self.assertEqual(
+            set(
+                Charge.objects.filter(flat=self.flat).values_list("is_paid", flat=True)
+            ),
+            {True},
+        )
+        self.assertEqual(
+            dict(
+                LedgerEntry.objects.filter(kind="ALLOCATION").values_list(
+                    "flat_id", "amount"
+                )
+            ),
+            {self.flat.id: Decimal("-50.00"), partial.id: Decimal("-25.00")},
+        )
+        self.assertEqual(
+            set(ChargeAllocation.objects.values_list("payment_id", flat=True)),
+            {None},
+        )
+
+
+class LogBufferTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="owner")
+
+    def entries(self, count):
+        return [
+            Log(user=self.user, action="ACCESS", model_name="N/A", path=f"/{n}/")
+            for n in range(count)
+        ]
+
+    def test_rows_are_written_in_batches(self):
+        buffer = LogBuffer(batch_size=2, flush_interval=0.01)
+        for entry in self.entries(5):
+            buffer.queue.put_nowait(entry)
+
+        self.assertEqual(len(buffer._collect()), 2)
+        buffer.flush()
+
+        self.assertEqual(Log.objects.count(), 3)
+        for entry in self.entries(5):
+            buffer.queue.put_nowait(entry)
+        with CaptureQueriesContext(connection) as queries:
+            buffer.flush()
+        self.assertEqual(len(queries), 3)
+        self.assertEqual(Log.objects.count(), 8)
+        self.assertEqual(buffer.written, 8)
+
+    def test_a_full_buffer_drops_and_counts(self):
+        buffer = LogBuffer(max_size=2)
+        with mock.patch.object(buffer, "_start"):
+            for entry in self.entries(5):
+                buffer.put(entry)
+
+        self.assertEqual(buffer.dropped, 3)
+        with self.assertLogs("buildings.logbuffer", "WARNING") as logs:
+            buffer.flush()
+        self.assertIn("3 entries dropped", logs.output[0])
+        self.assertEqual(Log.objects.count(), 2)
+
+    def test_what_is_left_is_flushed_at_exit(self):
+        buffer = LogBuffer()
+        with mock.patch("buildings.logbuffer.threading.Thread") as thread, mock.patch(
+            "buildings.logbuffer.atexit.register"
+        ) as register:
+            for entry in self.entries(3):
+                buffer.put(entry)
+
+        thread.return_value.start.assert_called_once_with()
+        register.assert_called_once_with(buffer.stop)
+        self.assertEqual(Log.objects.count(), 0)
+        buffer.stop()
+        self.assertEqual(Log.objects.count(), 3)
+
+
+class LogArchiveTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="owner")
+        self.directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.january = timezone.make_aware(datetime(2024, 1, 1))
+        for day, route in ((3, "flat-list"), (17, "payment-add"), (31, "flat-list")):
+            Log.objects.create(
+                user=self.user,
+                action="ACCESS",
+                model_name="N/A",
+                timestamp=self.january.replace(day=day, hour=12),
+                path=f"/{route}/",
+                route=route,
+                status=200,
+            )
+        self.february = Log.objects.create(
+            user=self.user,
+            action="ACCESS",
+            model_name="N/A",
+            timestamp=timezone.make_aware(datetime(2024, 2, 1)),
+            route="flat-list",
+        )
+
+    def test_month_is_exported_then_deleted(self):
+        path, count = archive_month(self.january, self.directory)
+
+        self.assertEqual(count, 3)
+        self.assertEqual(path.name, "logs-2024-01.jsonl.gz")
+        with gzip.open(path, "rt", encoding="utf-8") as archive:
+            rows = [json.loads(line) for line in archive]
+        self.assertEqual(
+            [row["route"] for row in rows], ["flat-list", "payment-add", "flat-list"]
+        )
+        self.assertEqual(set(rows[0]), set(ARCHIVE_FIELDS))
+        self.assertEqual(rows[1]["user_id"], self.user.id)
+        self.assertEqual(
+            datetime.fromisoformat(rows[1]["timestamp"]),
+            self.january.replace(day=17, hour=12),
+        )
+        self.assertEqual(
+            list(Log.objects.values_list("id", flat=True)), [self.february.id]
+        )
+
+        out = StringIO()
+        call_command(
+            "search_log_archive",
+            "--dir",
+            self.directory,
+            "--route",
+            "payment-add",
+            "--since",
+            "2024-01-01",
+            "--until",
+            "2024-02-01",
+            stdout=out,
+        )
+        found = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(found, [rows[1]])
+
+    def test_nothing_is_deleted_when_the_export_fails(self):
+        dumps = json.dumps
+
+        def fail_on_second_row(row, **kwargs):
+            if row["route"] == "payment-add":
+                raise OSError("No space left on device")
+            return dumps(row, **kwargs)
+
+        with mock.patch("buildings.archive.json.dumps", side_effect=fail_on_second_row):
+            with self.assertRaises(OSError):
+                archive_month(self.january, self.directory)
+
+        self.assertEqual(Log.objects.count(), 4)
+        self.assertEqual(os.listdir(self.directory), [])
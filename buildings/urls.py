@@ -89,6 +89,11 @@ urlpatterns = [
         views.ServiceDeleteView.as_view(),
         name="service_delete",
     ),
+    path(
+        "service/<int:pk>/projection/",
+        views.ServiceProjectionView.as_view(),
+        name="service-projection",
+    ),
     # -------------------------- Charge -------------------------------
     path(
         "autocomplete/charges/", views.charge_autocomplete, name="charge-autocomplete"
@@ -144,6 +149,7 @@ urlpatterns = [
         views.building_autocomplete,
         name="building_autocomplete",
     ),
+    path("branch-buildings/", views.branch_buildings, name="branch_buildings"),
     # -------------------------- CAR PLATE -------------------------------
     path(
         "carplates/",
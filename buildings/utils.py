@@ -4,6 +4,7 @@ from django.utils import timezone
 from django.db import transaction
 from django.shortcuts import render
 from buildings.models import Service, Branch, Flat, Payment, Charge
+from buildings.ledger import adjust_balance
 
 
 def get_weather_data(city_id):
@@ -28,33 +29,29 @@ def process_payments(request):
     today = timezone.now().date()
     services = Service.objects.filter(invoice_day=today.day, is_active=True)
     for service in services:
-        branch = service.branch
-        flats = branch.flat_set.all()
-        for flat in flats:
-            balance = flat.balance
-            if balance > 0:
-                payment_amount = min(balance, service.price * flat.square_metres)
-                flat.balance -= payment_amount
-                flat.save()
-                Payment.objects.create(
-                    building=flat.building,
-                    flat=flat,
-                    amount=payment_amount,
-                    service=service,
-                    user=request.user,
-                    date=today,
-                )
-                if payment_amount < service.price * flat.square_metres:
-                    charge_amount = service.price * flat.square_metres - payment_amount
-                    Charge.objects.create(
+        flat_ids = service.flats.order_by("id").values_list("id", flat=True)
+        for flat_id in flat_ids:
+            with transaction.atomic():
+                # Read the balance under a row lock: a payment or billing run
+                # touching the flat meanwhile waits instead of being overdrawn.
+                flat = Flat.objects.select_for_update().get(id=flat_id)
+                amount = service.price * flat.square_metres
+                if flat.balance > 0:
+                    payment_amount = min(flat.balance, amount)
+                    adjust_balance(flat.id, -payment_amount, "BILLING")
+                    Payment.objects.create(
+                        building_id=flat.building_id,
                         flat=flat,
-                        service=service,
-                        amount=charge_amount,
+                        amount=payment_amount,
+                        user=request.user,
+                        date=today,
                     )
-            else:
-                Charge.objects.create(
-                    flat=flat,
-                    service=service,
-                    amount=service.price * flat.square_metres,
-                )
+                    if payment_amount < amount:
+                        Charge.objects.create(
+                            flat=flat,
+                            service=service,
+                            amount=amount - payment_amount,
+                        )
+                else:
+                    Charge.objects.create(flat=flat, service=service, amount=amount)
     return True
@@ -1,7 +1,6 @@
 import re
 from django.http import JsonResponse, HttpResponseForbidden, HttpResponseNotAllowed
-from django.db.models.functions import ExtractMonth, ExtractYear
-from django.db.models import Sum
+from django.db import transaction
 from django.utils import timezone
 from django.http import HttpResponseNotFound
 from django.template.loader import render_to_string
@@ -9,7 +8,7 @@ from django.forms import formset_factory
 from django.shortcuts import render, get_object_or_404, redirect
 from django.urls import reverse
 from django.contrib import messages
-from django.db.models import Count, Q
+from django.db.models import Count, Exists, OuterRef
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import ListView, DeleteView, UpdateView, View
 from django.views.generic.edit import FormView
@@ -17,8 +16,18 @@ from django.contrib.auth.views import LoginView as BaseLoginView, LogoutView
 from django.views.generic.detail import DetailView
 from django.urls import reverse_lazy
 from buildings.utils import get_weather_data
+from buildings.ledger import adjust_balance
+from buildings.allocation import allocate_payments
+from buildings.billing import project_service
+from buildings.stats import dashboard_stats, with_building_stats
+from buildings.rollups import chart_range, month_series, rollups_for
+from buildings.pagination import KeysetPaginationMixin
+from buildings.scope import get_scope, scope_flats
+from buildings.phones import phone_query
+from buildings.autocomplete import ranked, select2_page
+from buildings.hierarchy import tree_items, tree_response
 from django.views.generic.edit import CreateView
-from datetime import timedelta
+from decimal import Decimal, InvalidOperation
 
 from .models import (
     Building,
@@ -35,6 +44,7 @@ from .models import (
     Charge,
     Garage,
     CarPlate,
+    MonthlyRollup,
 )
 from .forms import (
     BuildingForm,
@@ -57,42 +67,67 @@ from django.contrib.auth.decorators import login_required
 
 
 def flat_autocomplete(request):
-    q = request.GET.get("q", "")
-    building_id = request.GET.get("building_id")
+    q = request.GET.get("q", "").strip()
     flats = Flat.objects.filter(
-        Q(name__icontains=q) | Q(resident__phone_number__icontains=q),
-        building_id=building_id,
-    )
-    results = [{"id": flat.id, "text": flat.name} for flat in flats]
-    return JsonResponse({"results": results})
+        building_id=request.GET.get("building_id"),
+        building_id__in=get_scope(request.user).building_ids,
+    ).only("id", "name")
+    flats = ranked(flats, q, phone_query(q, "resident__"))
+    return select2_page(request, flats, lambda flat: flat.name)
 
 
 def flat_autocomplete_sec(request):
-    building_id = request.GET.get("building_id")
-    flats = Flat.objects.filter(building_id=building_id)
-    results = [{"id": flat.id, "text": flat.name} for flat in flats]
-    return JsonResponse({"results": results})
+    return tree_response(
+        request,
+        lambda tree: {
+            "results": [
+                {"id": pk, "text": name} for pk, name in tree_items(tree, "flats")
+            ]
+        },
+    )
 
 
 def section_autocomplete(request):
-    building_id = request.GET.get("building_id")
-    sections = Section.objects.filter(building_id=building_id)
-    results = [{"id": section.id, "text": section.name} for section in sections]
-    return JsonResponse({"results": results})
+    return tree_response(
+        request,
+        lambda tree: {
+            "results": [
+                {"id": pk, "text": name} for pk, name in tree_items(tree, "sections")
+            ]
+        },
+    )
 
 
 def building_autocomplete(request):
-    q = request.GET.get("q", "")
-    branch_id = request.GET.get("branch_id")
-    buildings = Building.objects.filter(name__icontains=q, branch_id=branch_id)
-    results = [{"id": building.id, "text": building.name} for building in buildings]
+    q = request.GET.get("q", "").strip()
+    buildings = get_scope(request.user).buildings()
+    buildings = buildings.filter(branch_id=request.GET.get("branch_id"))
+    buildings = ranked(buildings.only("id", "name"), q)
+    return select2_page(request, buildings, lambda building: building.name)
+
+
+def branch_buildings(request):
+    """
+    Every building of a branch in the user's scope, uncapped, for the plain
+    dropdowns that list them all; typed searches use building_autocomplete.
+    """
+    buildings = get_scope(request.user).buildings()
+    buildings = buildings.filter(branch_id=request.GET.get("branch_id"))
+    results = [
+        {"id": pk, "text": name}
+        for pk, name in buildings.order_by("id").values_list("id", "name")
+    ]
     return JsonResponse({"results": results})
 
 
 def charge_detail(request):
     charge_id = request.GET.get("charge_id")
     if charge_id:
-        charge = Charge.objects.get(id=charge_id)
+        charge = get_object_or_404(
+            Charge,
+            id=charge_id,
+            flat__building_id__in=get_scope(request.user).building_ids,
+        )
         return JsonResponse({"amount": charge.amount})
     else:
         return JsonResponse({"amount": None})
@@ -102,8 +137,9 @@ def charge_autocomplete(request):
     flat_id = request.GET.get("flat_id")
     charges = Charge.objects.filter(
         flat_id=flat_id,
+        flat__building_id__in=get_scope(request.user).building_ids,
         is_paid=False,
-    )
+    ).select_related("service")
     results = [
         {"id": charge.id, "text": f"{charge.service.name} - {charge.amount}"}
         for charge in charges
@@ -117,79 +153,12 @@ class DashboardView(LoginRequiredMixin, View):
     template_name = "dashboard.html"
 
     def get(self, request, *args, **kwargs):
-        user = self.request.user
-        one_month_ago = timezone.now() - timedelta(days=30)
-        if user.is_superuser:
-            branch_count = Branch.objects.filter(owner=user).count()
-            building_count = Building.objects.filter(branch__owner=user).count()
-            section_count = Section.objects.filter(building__branch__owner=user).count()
-            flat_count = Flat.objects.filter(building__branch__owner=user).count()
-            resident_count = (
-                User.objects.filter(flat__building__branch__owner=user, resident=True)
-                .distinct()
-                .count()
-            )
-            payment_count = Payment.objects.filter(
-                flat__building__branch__owner=user
-            ).count()
-            delayed_resident = User.objects.filter(
-                flat__building__branch__owner=user,
-                flat__balance__lt=0,
-                resident=True,
-            ).count()
-            total_expenses = (
-                Expense.objects.filter(outcome_date__gte=one_month_ago).aggregate(
-                    total=Sum("price")
-                )["total"]
-                or 0
-            )
-        elif user.commandant:
-            user_buildings = user.building.all()
-            branch_count = 0
-            building_count = Building.objects.filter(commandant=user).count()
-            section_count = Section.objects.filter(
-                building__in=user.building.all()
-            ).count()
-            flat_count = Flat.objects.filter(building__in=user_buildings).count()
-            resident_count = (
-                User.objects.filter(flat__building__in=user_buildings, resident=True)
-                .distinct()
-                .count()
-            )
-            payment_count = Payment.objects.filter(
-                flat__building__in=user_buildings
-            ).count()
-            delayed_resident = User.objects.filter(
-                flat__building__in=user_buildings, resident=True
-            ).count()
-            total_expenses = (
-                Expense.objects.filter(
-                    building__in=user_buildings, outcome_date__gte=one_month_ago
-                ).aggregate(total=Sum("price"))["total"]
-                or 0
-            )
-        else:
-            branch_count = 0
-            building_count = 0
-            section_count = 0
-            flat_count = 0
-            resident_count = 0
-            payment_count = 0
-            delayed_resident = 0
-            total_expenses = 0
         context = {
             "page_title": "Dashboard",
             "breadcrumbs": [
                 {"title": "Ana səhifə", "url": reverse("dashboard")},
             ],
-            "branch_count": branch_count,
-            "building_count": building_count,
-            "section_count": section_count,
-            "flat_count": flat_count,
-            "resident_count": resident_count,
-            "payment_count": payment_count,
-            "delayed_resident": delayed_resident,
-            "total_expenses": total_expenses,
+            **dashboard_stats(request.user),
             "user_name": request.user.username,
             "is_superuser": request.user.is_superuser,
         }
@@ -266,10 +235,14 @@ class BranchListView(LoginRequiredMixin, ListView):
         """
         user = self.request.user
         if user.is_superuser:
-            return Branch.objects.filter(owner=user).annotate(
-                commandant_count=Count("buildings__commandant", distinct=True),
-                building_count=Count("buildings", distinct=True),
-                camera_count=Count("cameras", distinct=True),
+            return (
+                get_scope(user)
+                .branches()
+                .annotate(
+                    commandant_count=Count("buildings__commandant", distinct=True),
+                    building_count=Count("buildings", distinct=True),
+                    camera_count=Count("cameras", distinct=True),
+                )
             )
         else:
             return Branch.objects.none()
@@ -367,12 +340,13 @@ class CommandantListView(LoginRequiredMixin, ListView):
 
     def get_queryset(self):
         branch_id = self.kwargs["branch_id"]
-        buildings = Building.objects.filter(branch_id=branch_id)
-        users = User.objects.filter(
-            building__in=buildings,
+        assignments = Building.commandant.through.objects.filter(
+            building__branch_id=branch_id
+        )
+        return User.objects.filter(
+            id__in=assignments.values("user_id"),
             commandant=True,
-        ).distinct()
-        return users
+        )
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -465,39 +439,16 @@ class BuildingListView(LoginRequiredMixin, ListView):
     context_object_name = "buildings"
 
     def get_queryset(self):
-        user = self.request.user
-        branch_id = self.kwargs.get("branch_id")
-        if user.is_superuser:
-            branch_id = user.branch.values_list("id", flat=True)
-        elif user.commandant:
-            branch_id = user.building.first().branch.id
-            return Building.objects.filter(
-                branch_id=branch_id, commandant=user
-            ).annotate(
-                flat_count=Count("flat", distinct=True),
-                section_count=Count("section", distinct=True),
-                users_count=Count("flat__resident", distinct=True),
-            )
-        return Building.objects.filter(branch_id__in=branch_id).annotate(
-            flat_count=Count("flat", distinct=True),
-            section_count=Count("section", distinct=True),
-            users_count=Count("flat__resident", distinct=True),
-        )
+        return with_building_stats(get_scope(self.request.user).buildings())
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        user = self.request.user
-        branch_id = self.kwargs.get("branch_id")
-        if user.is_superuser:
-            branch_id = user.branch.values_list("id", flat=True).last()
-        elif user.commandant:
-            branch_id = user.building.first().branch.id
-
+        branch_ids = get_scope(self.request.user).branch_ids
         context["breadcrumbs"] = [
             {"title": "Ana səhifə", "url": reverse("branches")},
             # {"title": "Binalar", "url": reverse("buildings")},
         ]
-        context["branch_id"] = branch_id
+        context["branch_id"] = max(branch_ids, default=None)
         context["user_name"] = self.request.user.username
         context["is_superuser"] = self.request.user.is_superuser
         return context
@@ -554,14 +505,9 @@ class SectionListView(LoginRequiredMixin, ListView):
     context_object_name = "sections"
 
     def get_queryset(self):
-        user = self.request.user  # Başlangıçta boş queryset
-
-        if user.is_superuser:
-            queryset = Section.objects.filter(building__branch__owner=user)
-        elif user.commandant:
-            queryset = Section.objects.filter(
-                building__in=Building.objects.filter(commandant=user)
-            )
+        queryset = Section.objects.filter(
+            building_id__in=get_scope(self.request.user).building_ids
+        ).select_related("building__branch")
 
         building_id = self.kwargs.get("building_id")
         if building_id:
@@ -620,13 +566,14 @@ class SectionsCreateView(LoginRequiredMixin, CreateView):
         return response
 
 
-class FlatListView(LoginRequiredMixin, ListView):
+class FlatListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     login_url = "/login/"
     model = Flat
     form = FlatForm
     template_name = "flat.html"
     context_object_name = "flats"
     paginate_by = 50
+    keyset_ordering = ("id",)
 
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
@@ -634,13 +581,13 @@ class FlatListView(LoginRequiredMixin, ListView):
         return kwargs
 
     def get_queryset(self):
-        user = self.request.user
-        if user.is_superuser:
-            queryset = Flat.objects.filter(building__branch__owner=user).distinct()
-        if user.commandant:
-            queryset = Flat.objects.filter(
-                building__in=Building.objects.filter(commandant=user)
-            ).distinct()
+        queryset = (
+            Flat.objects.filter(
+                building_id__in=get_scope(self.request.user).building_ids
+            )
+            .select_related("section", "building")
+            .prefetch_related("services")
+        )
         building_id = self.request.GET.get("building")
         section_id = self.request.GET.get("section")
         min_square_metres = self.request.GET.get("min_square_metres")
@@ -658,18 +605,13 @@ class FlatListView(LoginRequiredMixin, ListView):
         if name:
             queryset = queryset.filter(name__icontains=name)
         if phone:
-            queryset = queryset.filter(resident__phone_number__contains=phone)
+            match = phone_query(phone, "resident__")
+            queryset = queryset.filter(match) if match else queryset.none()
         return queryset
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        user = self.request.user
-        if user.is_superuser:
-            user_branches = Branch.objects.filter(owner=user)
-            buildings = Building.objects.filter(branch__in=user_branches)
-        if user.commandant:
-            buildings = Building.objects.filter(commandant=user)
-        context["buildings"] = buildings
+        context["buildings"] = get_scope(self.request.user).buildings()
         context["breadcrumbs"] = [
             {"title": "Ana səhifə", "url": reverse("branches")},
             {"title": "Binalar", "url": reverse("buildings")},
@@ -802,15 +744,7 @@ class ServiceCreateView(LoginRequiredMixin, CreateView):
     def get_context_data(self, **kwargs):
         user = self.request.user
         context = super().get_context_data(**kwargs)
-        if user.is_superuser:
-            context["branches"] = Branch.objects.filter(owner=user)
-        elif user.commandant:
-            buildings = Building.objects.filter(commandant=user)
-            context["branches"] = Branch.objects.filter(
-                buildings__in=buildings
-            ).distinct()
-        else:
-            context["branches"] = Branch.objects.none()
+        context["branches"] = get_scope(user).branches()
         context["breadcrumbs"] = [
             {"title": "Ana səhifə", "url": reverse("branches")},
             {"title": "Xidmətlər", "url": reverse("services")},
@@ -896,29 +830,19 @@ class FlatAddServiceListView(LoginRequiredMixin, FormView):
         return context
 
 
-class ChargeListView(LoginRequiredMixin, ListView):
+class ChargeListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = Charge
     template_name = "charge_list.html"  # Create this template
     context_object_name = "debts"
     paginate_by = 10
+    keyset_ordering = ("-created_at", "-id")
+    keyset_by_default = True
 
     def get_queryset(self):
-        user = self.request.user
-
-        if user.is_superuser:
-            user_branches = Branch.objects.filter(owner=user)
-            user_buildings = Building.objects.filter(branch__in=user_branches)
-            return Charge.objects.filter(
-                flat__building__in=user_buildings, is_paid=False
-            ).distinct()
-
-        if user.commandant:
-            user_buildings = Building.objects.filter(commandant=user)
-            return Charge.objects.filter(
-                flat__building__in=user_buildings, is_paid=False
-            ).distinct()
-
-        return Charge.objects.none()
+        flats = scope_flats(get_scope(self.request.user))
+        return Charge.objects.filter(
+            flat_id__in=flats.values("id"), is_paid=False
+        ).select_related("flat", "service")
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -939,14 +863,13 @@ class ExpenseListView(LoginRequiredMixin, ListView):
 
     def get_queryset(self):
         user = self.request.user
+        scope = get_scope(user)
 
         if user.is_superuser:
-            user_branches = Branch.objects.filter(owner=user)
-            return Expense.objects.filter(branch__in=user_branches).distinct()
+            return Expense.objects.filter(branch_id__in=scope.branch_ids)
 
         if user.commandant:
-            user_buildings = Building.objects.filter(commandant=user)
-            return Expense.objects.filter(building__in=user_buildings).distinct()
+            return Expense.objects.filter(building_id__in=scope.building_ids)
 
         return Expense.objects.none()
 
@@ -995,89 +918,45 @@ class ExpenseCreateView(LoginRequiredMixin, CreateView):
         return response
 
 
-class ExpenseChartView(ListView):
-    model = Expense
+class ExpenseChartView(LoginRequiredMixin, ListView):
+    login_url = "/login/"
+    model = MonthlyRollup
     template_name = "expense_chart.html"
-    context_object_name = "expenses"
+    context_object_name = "rollups"
+
+    def get_queryset(self):
+        return rollups_for(self.request.user)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-
-        # Aggregate expenses by year and month
-        expense_data = (
-            Expense.objects.annotate(month=ExtractMonth("outcome_date"))
-            .annotate(year=ExtractYear("outcome_date"))
-            .values("year", "month")
-            .annotate(total=Sum("price"))
-            .order_by("year", "month")
-        )
-
-        # Prepare data for the chart
-        stepcount = []
-        if expense_data:
-            for data in expense_data:
-                # Create a label for each month with the year included
-                label = f"{data['month']:02d}/{data['year']}"
-                stepcount.append({"y": float(data["total"]), "label": label})
-
-            # Ensure the stepcount data covers all months in the year
-            all_months = {
-                f"{month:02d}/{year}": 0
-                for month in range(1, 13)
-                for year in range(
-                    expense_data[0]["year"], expense_data.last()["year"] + 1
-                )
-            }
-            for entry in stepcount:
-                month_label = entry["label"]
-                if month_label in all_months:
-                    all_months[month_label] = entry["y"]
-
-            # Reformat stepcount to ensure all months are represented
-            start_year = expense_data[0]["year"]
-            end_year = expense_data.last()["year"]
-            stepcount = [
-                {"y": all_months[f"{month:02d}/{year}"], "label": f"{month:02d}/{year}"}
-                for month in range(1, 13)
-                for year in range(start_year, end_year + 1)
-            ]
-        else:
-            # Handle the case where expense_data is empty
-            start_year = 2024  # Default or current year
-            end_year = 2024
-            stepcount = [
-                {"y": 0, "label": f"{month:02d}/{year}"}
-                for month in range(1, 13)
-                for year in range(start_year, end_year + 1)
-            ]
+        start, end = chart_range(self.request.GET)
+        series = month_series(self.object_list, "expense_total", start, end)
 
         context["is_superuser"] = self.request.user.is_superuser
         context["breadcrumbs"] = [
             {"title": "Ana səhifə", "url": reverse("branches")},
         ]
-        context["stepcount"] = stepcount
+        context["stepcount"] = [{"y": total, "label": label} for label, total in series]
+        context["start"] = start.strftime("%Y-%m")
+        context["end"] = end.strftime("%Y-%m")
         context["user_name"] = self.request.user.username
 
         return context
 
 
-class PaymentListView(ListView):
+class PaymentListView(KeysetPaginationMixin, ListView):
     model = Payment
     template_name = "payment_list.html"
     context_object_name = "payments"
     paginate_by = 10
+    keyset_ordering = ("-date", "-id")
+    keyset_by_default = True
 
     def get_queryset(self):
-        user = self.request.user
-
-        if user.is_superuser:
-            user_branches = Branch.objects.filter(owner=user)
-            user_buildings = Building.objects.filter(branch__in=user_branches)
-            return Payment.objects.filter(flat__building__in=user_buildings).distinct()
-
-        if user.commandant:
-            user_buildings = Building.objects.filter(commandant=user)
-            return Payment.objects.filter(flat__building__in=user_buildings).distinct()
+        flats = scope_flats(get_scope(self.request.user))
+        return Payment.objects.filter(flat_id__in=flats.values("id")).select_related(
+            "flat", "charge"
+        )
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -1102,51 +981,49 @@ class PaymentCreateView(CreateView):
             {"title": "Ödənişlər", "url": reverse("payment-list")},
         ]
         user = self.request.user
-        if user.is_superuser:
-            user_branches = Branch.objects.filter(owner=user)
-            context["buildings"] = Building.objects.filter(branch__in=user_branches)
-        elif user.commandant:
-            context["buildings"] = Building.objects.filter(commandant=user)
-        else:
-            context["buildings"] = Building.objects.none()
+        context["buildings"] = get_scope(user).buildings()
         context["user_name"] = user.username
         context["is_superuser"] = user.is_superuser
         return context
 
     def get_form(self, form_class=None):
         form = super().get_form(form_class)
-        user = self.request.user
-        if user.is_superuser:
-            user_branches = Branch.objects.filter(owner=user)
-            buildings = Building.objects.filter(branch__in=user_branches)
-            form.fields["building"].queryset = buildings
-        elif user.commandant:
-            buildings = Building.objects.filter(commandant=user)
-            form.fields["building"].queryset = buildings
-        else:
-            form.fields["building"].queryset = Building.objects.none()
+        scope = get_scope(self.request.user)
+        flats = scope_flats(scope)
+        form.fields["building"].queryset = scope.buildings()
+        form.fields["flat"].queryset = flats
+        form.fields["charge"].queryset = Charge.objects.filter(
+            flat_id__in=flats.values("id"), is_paid=False
+        ).select_related("flat")
         return form
 
     def get(self, request, *args, **kwargs):
         if request.headers.get("x-requested-with") == "XMLHttpRequest":
-            building_id = request.GET.get("building_id")
-            if building_id:
-                flats = Flat.objects.filter(building_id=building_id)
-            else:
-                flats = Flat.objects.none()
-            return JsonResponse({"flats": list(flats.values("id", "name"))})
+            return tree_response(
+                request,
+                lambda tree: {
+                    "flats": [
+                        {"id": pk, "name": name}
+                        for pk, name in tree_items(tree, "flats")
+                    ]
+                },
+            )
         return super().get(request, *args, **kwargs)
 
     def form_valid(self, form):
         form.instance.user = self.request.user
-        response = super().form_valid(form)
-        charge_id = form.instance.charge.id if form.instance.charge else None
-        if charge_id:
-            Charge.objects.filter(id=charge_id).update(is_paid=True)
-        else:
-            flat = form.instance.flat
-            flat.balance += form.cleaned_data["amount"]
-            flat.save()
+        with transaction.atomic():
+            response = super().form_valid(form)
+            # Settle the selected charge, then the oldest open ones; only the
+            # rest is credit.
+            charge_id = form.instance.charge_id
+            leftovers = allocate_payments(
+                Payment.objects.filter(id=self.object.id),
+                first=[charge_id] if charge_id else (),
+            )
+            credit = leftovers.get(self.object.id, 0)
+            if credit:
+                adjust_balance(form.instance.flat_id, credit, "PAYMENT")
         Log.objects.create(
             action="CREATE",
             model_name="Payment",
@@ -1161,57 +1038,28 @@ class PaymentCreateView(CreateView):
         return response
 
 
-class PaymentChartView(ListView):
-    model = Payment
+class PaymentChartView(LoginRequiredMixin, ListView):
+    login_url = "/login/"
+    model = MonthlyRollup
     template_name = "payment_chart.html"
-    context_object_name = "payments"
+    context_object_name = "rollups"
+
+    def get_queryset(self):
+        return rollups_for(self.request.user)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        payment_data = (
-            Payment.objects.annotate(month=ExtractMonth("date"))
-            .annotate(year=ExtractYear("date"))
-            .values("year", "month")
-            .annotate(total=Sum("amount"))
-            .order_by("year", "month")
-        )
-        labels = []
-        data_points = []
-        if payment_data:
-            for data in payment_data:
-                label = f"{data['month']:02d}/{data['year']}"
-                labels.append(label)
-                data_points.append(float(data["total"]))
-
-            start_year = payment_data[0]["year"]
-            end_year = payment_data.last()["year"]
-            all_months = {
-                f"{month:02d}/{year}": 0
-                for month in range(1, 13)
-                for year in range(start_year, end_year + 1)
-            }
-
-            for entry in zip(labels, data_points):
-                month_label, value = entry
-                all_months[month_label] = value
-            labels = list(all_months.keys())
-            data_points = list(all_months.values())
-        else:
-            start_year = timezone.now().year
-            end_year = start_year
-            labels = [
-                f"{month:02d}/{year}"
-                for year in range(start_year, end_year + 1)
-                for month in range(1, 13)
-            ]
-            data_points = [0] * 12
+        start, end = chart_range(self.request.GET)
+        series = month_series(self.object_list, "payment_total", start, end)
 
         context["is_superuser"] = self.request.user.is_superuser
         context["breadcrumbs"] = [
             {"title": "Ana Sayfa", "url": reverse("branches")},
         ]
-        context["labels"] = labels
-        context["data_points"] = data_points
+        context["labels"] = [label for label, _ in series]
+        context["data_points"] = [total for _, total in series]
+        context["start"] = start.strftime("%Y-%m")
+        context["end"] = end.strftime("%Y-%m")
         context["user_name"] = self.request.user.username
 
         return context
@@ -1225,45 +1073,37 @@ class ResidentListView(ListView):
     context_object_name = "residents"
 
     def get_queryset(self):
-        user = self.request.user
-        if user.is_superuser:
-            queryset = User.objects.filter(
-                flat__building__branch__owner=user
-            ).distinct()
-        if user.commandant:
-            queryset = User.objects.filter(
-                flat__building__in=Building.objects.filter(commandant=user)
-            ).distinct()
         building_id = self.request.GET.get("building")
         section_id = self.request.GET.get("section")
         flatname = self.request.GET.get("flatname")
         phone = self.request.GET.get("phone")
         negative_balance = self.request.GET.get("negative_balance")
+        # The flat conditions go into one EXISTS subquery: a resident with
+        # several flats is still one row, with no DISTINCT over the users.
+        flat_filters = {}
         if building_id:
-            queryset = queryset.filter(flat__building_id=building_id)
-
+            flat_filters["building_id"] = building_id
         if section_id:
-            queryset = queryset.filter(flat__section_id=section_id)
+            flat_filters["section_id"] = section_id
         if flatname:
-            queryset = queryset.filter(flat__name=flatname)
-        if phone:
-            queryset = queryset.filter(phone_number__contains=phone)
+            flat_filters["name"] = flatname
         if negative_balance:
-            queryset = queryset.filter(flat__balance__lt=0)
+            flat_filters["balance__lt"] = 0
+        flats = scope_flats(
+            get_scope(self.request.user), resident=OuterRef("pk"), **flat_filters
+        )
+        queryset = User.objects.filter(Exists(flats)).prefetch_related("flat")
+        if phone:
+            match = phone_query(phone)
+            queryset = queryset.filter(match) if match else queryset.none()
 
-        return queryset.distinct()
+        return queryset
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        user = self.request.user
         # building_id = self.kwargs.get("building_id")
         # branch_id = self.kwargs.get("branch_id")
-        if user.is_superuser:
-            user_branches = Branch.objects.filter(owner=user)
-            buildings = Building.objects.filter(branch__in=user_branches)
-        if user.commandant:
-            buildings = Building.objects.filter(commandant=user)
-        context["buildings"] = buildings
+        context["buildings"] = get_scope(self.request.user).buildings()
         context["breadcrumbs"] = [
             {"title": "Ana səhifə", "url": reverse("branches")},
             {"title": "Binalar", "url": reverse("buildings")},
@@ -1350,16 +1190,9 @@ class GarageListView(LoginRequiredMixin, ListView):
     context_object_name = "garages"
 
     def get_queryset(self):
-        user = self.request.user
-        if user.is_superuser:
-            return Garage.objects.filter(building__branch__owner=user).annotate(
-                car_plate_count=Count("carplate")
-            )
-        elif user.commandant:
-            return Garage.objects.filter(
-                building__in=Building.objects.filter(commandant=user)
-            ).annotate(car_plate_count=Count("carplate"))
-        return Garage.objects.none()
+        return Garage.objects.filter(
+            building_id__in=get_scope(self.request.user).building_ids
+        ).annotate(car_plate_count=Count("carplate"))
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -1425,7 +1258,9 @@ class CarPlateListView(LoginRequiredMixin, ListView):
     def get_queryset(self):
         user = self.request.user
         if user.is_superuser:
-            return CarPlate.objects.filter(garage__building__branch__owner=user)
+            return CarPlate.objects.filter(
+                garage__building_id__in=get_scope(user).building_ids
+            )
         return CarPlate.objects.none()
 
     def get_context_data(self, **kwargs):
@@ -1486,28 +1321,31 @@ class CarPlateDeleteView(LoginRequiredMixin, DeleteView):
         return response
 
 
-class LogListView(ListView):
+class LogListView(KeysetPaginationMixin, ListView):
     model = Log
     template_name = "log_list.html"
     context_object_name = "logs"
     ordering = ["-timestamp"]
     paginate_by = 20
+    keyset_ordering = ("-timestamp", "-id")
 
     def get_queryset(self):
         user = self.request.user
 
         if user.is_superuser:
-            # user_branches = Branch.objects.filter(owner=user)
-            # queryset = Log.objects.filter(branch__in=user_branches)
+            # Was user__branch__owner=user: the user's own entries, provided
+            # they own a branch, which needs no join through the branches.
+            if not get_scope(user).branch_ids:
+                return Log.objects.none()
             return (
-                Log.objects.filter(user__branch__owner=user)
-                .distinct()
+                Log.objects.filter(user_id=user.pk)
+                .select_related("user")
                 .order_by("-timestamp")
             )
 
         if user.commandant:
-            queryset = Log.objects.filter(commandant=user)
-            return queryset
+            return Log.objects.filter(user_id=user.pk).select_related("user")
+        return Log.objects.none()
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -1523,6 +1361,7 @@ class NewsListView(ListView):
     model = News
     template_name = "news_list.html"
     context_object_name = "news_list"
+    ordering = ["-created_at"]
     paginate_by = 20
 
     def get_context_data(self, **kwargs):
@@ -1641,12 +1480,47 @@ class ServiceDeleteView(LoginRequiredMixin, DeleteView):
         return response
 
 
+class ServiceProjectionView(LoginRequiredMixin, View):
+    login_url = "/login/"
+
+    def get(self, request, pk):
+        scope = get_scope(request.user)
+        services = Service.objects.filter(branch_id__in=scope.branch_ids)
+        service = get_object_or_404(services, pk=pk)
+
+        try:
+            price = request.GET.get("price")
+            price = Decimal(price) if price else None
+            # NaN and Infinity parse, but cannot be compared or rounded; the
+            # bound is what Service.price (10 digits, 2 decimals) can hold.
+            if price is not None and not (price.is_finite() and 0 <= price < 10**8):
+                raise ValueError(price)
+            invoice_day = request.GET.get("invoice_day")
+            invoice_day = int(invoice_day) if invoice_day else None
+            if invoice_day is not None and not 1 <= invoice_day <= 31:
+                raise ValueError(invoice_day)
+        except (InvalidOperation, ValueError):
+            return JsonResponse({"error": "Yanlış qiymət və ya gün."}, status=400)
+
+        # A commandant's branch also has buildings they are not assigned to.
+        return JsonResponse(
+            project_service(
+                service, price, invoice_day, building_ids=scope.building_ids
+            )
+        )
+
+
 class NewsUpdateView(UpdateView):
     model = News
     form_class = NewsForm
     template_name = "edit_news.html"
     success_url = reverse_lazy("news-list")
 
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs["user"] = self.request.user
+        return kwargs
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["breadcrumbs"] = [
@@ -1696,7 +1570,7 @@ class CameraListView(ListView):
     def get_queryset(self):
         branch_id = self.kwargs["branch_id"]
         branch = get_object_or_404(Branch, id=branch_id)
-        return Camera.objects.filter(branch=branch)
+        return Camera.objects.filter(branch=branch).select_related("branch")
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -16,4 +16,29 @@ app.conf.beat_schedule = {
         "schedule": crontab(hour=8, minute=0),
         "args": (),
     },
+    "take-monthly-balance-snapshots": {
+        "task": "buildings.tasks.take_monthly_balance_snapshots",
+        "schedule": crontab(day_of_month=1, hour=0, minute=5),
+        "args": (),
+    },
+    "reconcile-building-stats-nightly": {
+        "task": "buildings.tasks.reconcile_building_stats",
+        "schedule": crontab(hour=0, minute=10),
+        "args": (),
+    },
+    "rollup-route-latency-hourly": {
+        "task": "buildings.tasks.rollup_route_latency",
+        "schedule": crontab(minute=5),
+        "args": (),
+    },
+    "archive-old-logs-monthly": {
+        "task": "buildings.tasks.archive_old_logs",
+        "schedule": crontab(day_of_month=2, hour=3, minute=0),
+        "args": (),
+    },
+    "purge-old-tombstones-nightly": {
+        "task": "buildings.tasks.purge_old_tombstones",
+        "schedule": crontab(hour=3, minute=30),
+        "args": (),
+    },
 }
@@ -58,11 +58,23 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "buildings.middleware.LogMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 CSRF_COOKIE_SECURE = False
 
+# Access log written by LogMiddleware: "buffered" (background bulk inserts) or
+# "sync" (one INSERT per response).
+ACCESS_LOG_MODE = env("ACCESS_LOG_MODE", default="buffered")
+ACCESS_LOG_BUFFER_SIZE = 10000
+ACCESS_LOG_BATCH_SIZE = 500
+ACCESS_LOG_FLUSH_INTERVAL = 2.0
+
+# Log rows older than this many full months are moved to LOG_ARCHIVE_DIR.
+LOG_RETENTION_MONTHS = env.int("LOG_RETENTION_MONTHS", default=6)
+LOG_ARCHIVE_DIR = env("LOG_ARCHIVE_DIR", default=str(BASE_DIR / "log_archive"))
+
 AUTHENTICATION_BACKENDS = [
     "buildings.backends.CustomBackend",
     "django.contrib.auth.backends.ModelBackend",
@@ -110,6 +122,24 @@ else:
         },
     }
 
+# Cached access scopes (buildings.scope). Without CACHE_URL every process keeps
+# its own memory cache and only sees its own invalidations, so set it (e.g.
+# redis://localhost:6379/1) when running more than one worker.
+if env("CACHE_URL", default=""):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": env("CACHE_URL"),
+        }
+    }
+ACCESS_SCOPE_TIMEOUT = 300
+# Cached section/flat lists of a building (buildings.hierarchy).
+BUILDING_TREE_TIMEOUT = 24 * 60 * 60
+
+# Suggestions per Select2 page of the flat and building autocompletes.
+AUTOCOMPLETE_PAGE_SIZE = 20
+AUTOCOMPLETE_MAX_PAGES = 10
+
 
 REST_FRAMEWORK = {
     # Use Django's standard `django.contrib.auth` permissions,
@@ -121,6 +151,13 @@ REST_FRAMEWORK = {
         "rest_framework_simplejwt.authentication.JWTAuthentication",
     ),
 }
+# Cursor pagination of the resident list endpoints (api.pagination).
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 200
+# Delta sync of the resident app (buildings.sync): how long deletions are
+# remembered, and how far back each sync re-reads to catch late commits.
+SYNC_TOMBSTONE_DAYS = 90
+SYNC_OVERLAP_SECONDS = 300
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 